@@ -0,0 +1,132 @@
+#!/usr/bin/env python
+"""
+Column schemas of the L{PoseInstance} and L{JointVelocities} topics.
+
+Instead of sending its column names within each message, a publisher
+announces them once in a latched L{ColumnSchema} msg on the
+C{<topic>_schema} topic. Messages only carry the C{schema_id} of their
+layout, which consumers resolve with a L{SchemaCache}::
+
+    # Publisher
+    schema = SchemaPublisher('pose_instance')
+    schema.stamp(msg, columns)   # Sets msg.schema_id (and msg.columns)
+    publisher.publish(msg)
+
+    # Consumer
+    schemas = SchemaCache('pose_instance')
+    columns = schemas.columns(msg)
+
+By default, messages only carry their C{schema_id}. Publishers whose
+C{~column_schema} param is false also send the columns, for consumers
+that read C{msg.columns} directly. Messages that carry their columns
+(or C{schema_id} 0) are resolved to them, so both kinds of publishers
+and consumers can be mixed.
+"""
+import rospy
+
+import threading
+from zlib import crc32
+
+from pose_msgs.msg import ColumnSchema
+
+# Suffix of the topics where the schemas of a topic are announced
+SCHEMA_TOPIC_SUFFIX = '_schema'
+
+
+def schema_topic(topic):
+    """Return the (resolved) name of the schema topic of a topic."""
+    return rospy.resolve_name(topic) + SCHEMA_TOPIC_SUFFIX
+
+
+def schema_id(columns):
+    """
+    Return the id of the schema of a list of columns.
+
+    It is a (non-zero) CRC32 of the column names, so publishers of the
+    same layout announce the same id.
+    """
+    sid = crc32('\n'.join(columns)) & 0xffffffff
+    return sid or 1
+
+
+class SchemaPublisher(object):
+
+    """Announce the column layout of the msgs of a topic."""
+
+    def __init__(self, topic, send_columns=None):
+        """
+        Constructor.
+
+        @param topic: the topic of the msgs whose layout is announced
+        @param send_columns: whether the msgs still carry their columns.
+            Default: the opposite of the C{~column_schema} param (True)
+        """
+        if send_columns is None:
+            send_columns = not rospy.get_param('~column_schema', True)
+        self.send_columns = send_columns
+        self.columns = None
+        self.schema_id = 0
+        self._stamped = None    # Last stamped columns (avoids comparing them)
+        self._publisher = rospy.Publisher(schema_topic(topic), ColumnSchema,
+                                          latch=True)
+
+    def stamp(self, msg, columns):
+        """
+        Set the schema_id (and the columns, if sent) of a msg.
+
+        The schema is announced the first time its columns are stamped.
+
+        @param msg: a msg with C{schema_id} and C{columns} fields
+        @param columns: the columns of the msg. If empty, the msg has
+            no schema (schema_id 0)
+        @return: the msg
+        """
+        if not columns:
+            msg.schema_id, msg.columns = 0, []
+            return msg
+        if columns is not self._stamped and columns != self.columns:
+            self.columns = list(columns)
+            self.schema_id = schema_id(self.columns)
+            self._publisher.publish(ColumnSchema(schema_id=self.schema_id,
+                                                 columns=self.columns))
+        self._stamped = columns
+        msg.schema_id = self.schema_id
+        msg.columns = self.columns if self.send_columns else []
+        return msg
+
+
+class SchemaCache(object):
+
+    """Resolve the columns of the msgs of a topic from their schema."""
+
+    def __init__(self, topic):
+        """
+        Constructor.
+
+        @param topic: the topic of the msgs whose layouts are resolved
+        """
+        self.schemas = {}
+        self._lock = threading.Lock()
+        self._subscriber = rospy.Subscriber(schema_topic(topic), ColumnSchema,
+                                            self.schema_cb)
+
+    def schema_cb(self, schema):
+        """Store a received schema."""
+        with self._lock:
+            self.schemas[schema.schema_id] = list(schema.columns)
+
+    def columns(self, msg):
+        """
+        Return the columns of a msg.
+
+        @return: the columns of the msg if it carries them.
+            Otherwise, the columns of its schema.
+        @raise KeyError: if the msg schema has not been received yet
+        """
+        if msg.columns:
+            return msg.columns
+        with self._lock:
+            try:
+                return self.schemas[msg.schema_id]
+            except KeyError:
+                raise KeyError("Unknown schema: {}".format(msg.schema_id))
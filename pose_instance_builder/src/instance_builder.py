@@ -5,13 +5,12 @@ roslib.load_manifest('pose_instance_builder')
 #import rospy
 # from rospy import (logdebug, loginfo, logwarn, logerr, logfatal)
 
-from itertools import (chain, imap, izip, product, starmap)
-from toolz import (concat, cons)
+from itertools import (chain, imap, product)
+import numpy as np
 
 from pi_tracker.msg import Skeleton
 from pose_msgs.msg import PoseInstance
 from kinect.msg import NiteSkeletonList
-import kinect.nite_skeleton_msg_utils as nsku
 
 
 def _check_msg_preconditions(msg, msg_class, label):
@@ -40,29 +39,50 @@ class IBuilder(object):
         """Return the class of the skel. msg the builder is able to parse."""
         pass
 
-    def parse_msg(self, msg, label):
+    def parse_msg(self, msg, label, schema=None):
         """Get msg and returns an instance message.
 
         @param msg: The message to be converted to a PoseInstance
                     Each Builder will be able to process a single msg type
                     Thus, the type of msg will depend on the Builder.
+        @param schema: if set, the msg is stamped with it instead of
+                       carrying its columns
+                       (See C{column_schema.SchemaPublisher})
         @return: The instance message filled with the msg data
         @rtype: pose_instance_builder.msg.PoseInstance
         """
         pass
 
+    def unpack(self, msg):
+        """Get msg and return its instance and columns, without a label.
+
+        @param msg: The message to be unpacked (See L{parse_msg})
+        @return: tuple (instance, columns). The instance is an array
+                 that may be reused by the builder for the next msg.
+        @rtype: (numpy.ndarray, list of str)
+        """
+        pass
+
 
 class PiTrackerIBuilder(object):
 
     """Instance Builder for skeletons coming from pi_tracker package."""
 
+    # Fields of each joint in the instances:
+    # position (x, y, z), orientation (x, y, z, w) and confidence
+    JOINT_FIELDS = 8
+    FIELDS = ('pos_x', 'pos_y', 'pos_z', 'orient_x', 'orient_y', 'orient_z',
+              'orient_w', 'confidence')
+
     def __init__(self, *args, **kwargs):
-        pass
+        self._columns = None   # Joint names of the cached layout
+        self._buffer = None    # user_id + JOINT_FIELDS per joint
+        self._field_columns = None  # Columns of L{unpack}
 
     def get_msg_class(self):
         return Skeleton
 
-    def parse_msg(self, msg, label):
+    def parse_msg(self, msg, label, schema=None):
         """Parse a pi_tracker.msg.Skeleton message.
 
         Parse a pi_tracker.msg.Skeleton message and converts it to a
@@ -70,28 +90,84 @@ class PiTrackerIBuilder(object):
 
         @name msg: The message to be parsed
         @type msg: pi_tracker.msg.Skeleton
+        @param schema: if set, the msg is stamped with it instead of
+                       carrying its columns
+        @type schema: C{column_schema.SchemaPublisher}
         @return: The instance message already formatted
         @rtype: pose_instance_builder.msg.PoseInstance
         @raise TypeError if preconditions fail
         """
         _check_msg_preconditions(msg, self.get_msg_class(), label)
+        instance = PoseInstance(label=str(label),
+                                instance=self._fill_buffer(msg).tolist())
+        if schema is None:
+            instance.columns = msg.name
+            return instance
+        return schema.stamp(instance, self._columns)
+
+    def unpack(self, msg):
+        """Return the instance of a pi_tracker.msg.Skeleton and its columns.
+
+        Unlike L{parse_msg}, the columns name each field of the instance:
+        user_id and <joint>_<field> for the L{JOINT_FIELDS} of each joint.
+        The instance is the builder buffer, overwritten by the next msg.
+
+        @raise TypeError: if the msg is not a Skeleton or its joint fields
+                          do not match its joints
+        """
+        if not isinstance(msg, self.get_msg_class()):
+            raise TypeError("Message not a {}.msg"
+                            .format(self.get_msg_class()))
+        instance = self._fill_buffer(msg)
+        if self._field_columns is None:
+            self._field_columns = ['user_id'] + \
+                ['_'.join(jf) for jf in product(self._columns, self.FIELDS)]
+        return instance, self._field_columns
+
+    def _check_layout(self, msg):
+        """Cache the buffer of the joints of msg if they are new.
+
+        @raise TypeError: if the joint fields do not match msg.name
+        """
+        if msg.name != self._columns:
+            self._columns = list(msg.name)
+            self._field_columns = None
+            self._buffer = np.empty(1 + self.JOINT_FIELDS * len(msg.name))
+        njoints = len(self._columns)
+        if not len(msg.position) == len(msg.orientation) == \
+                len(msg.confidence) == njoints:
+            raise TypeError("Skeleton fields do not match its {} joints"
+                            .format(njoints))
 
-        msg_fields = izip(msg.position, msg.orientation, msg.confidence)
-        instance = cons(msg.user_id, concat(starmap(self._parse, msg_fields)))
-        return PoseInstance(columns=msg.name,
-                            label=str(label),
-                            instance=list(instance))
+    def _fill_buffer(self, msg):
+        """Write user_id and the fields of each joint of msg in the buffer.
 
-    def _parse(self, position, orientation, confidence):
-        return (position.x, position.y, position.z,
-                orientation.x, orientation.y, orientation.z, orientation.w,
-                confidence)
+        @return: the buffer: [user_id, joint0 fields, joint1 fields, ...]
+        @rtype: numpy.ndarray
+        """
+        self._check_layout(msg)
+        buf = self._buffer
+        joints = buf[1:].reshape(-1, self.JOINT_FIELDS)
+        buf[0] = msg.user_id
+        joints[:, 0] = [p.x for p in msg.position]
+        joints[:, 1] = [p.y for p in msg.position]
+        joints[:, 2] = [p.z for p in msg.position]
+        joints[:, 3] = [o.x for o in msg.orientation]
+        joints[:, 4] = [o.y for o in msg.orientation]
+        joints[:, 5] = [o.z for o in msg.orientation]
+        joints[:, 6] = [o.w for o in msg.orientation]
+        joints[:, 7] = msg.confidence
+        return buf
 
 
 class KinectIBuilder(object):
 
     """Instance Builder for skeletons coming from kinect package."""
 
+    # Fields of each joint in the instances: position (x, y, z),
+    # orientation (x, y, z, w) and their confidences
+    JOINT_FIELDS = 9
+
     def __init__(self):
         self.joints = ['head', 'neck', 'torso',
                        'left_shoulder', 'left_elbow', 'left_hand',
@@ -104,11 +180,15 @@ class KinectIBuilder(object):
         self.header = ['user_id', 'stamp']
         self.cols = imap('_'.join, product(self.joints, self.attribs))
         self.cols = list(chain(self.header, self.cols))
+        self._size = len(self.cols)
+        self._buffer = np.empty(self._size)   # header + JOINT_FIELDS per joint
+        self._joints = self._buffer[len(self.header):] \
+            .reshape(-1, self.JOINT_FIELDS)   # View of the joints fields
 
     def get_msg_class(self):
         return NiteSkeletonList
 
-    def parse_msg(self, msg, label):
+    def parse_msg(self, msg, label, schema=None):
         """Convert a NiteSkeletonList message to a PoseInstance message.
 
         @raise: TypeError if preconditions fail
@@ -116,14 +196,63 @@ class KinectIBuilder(object):
         @type msg: NiteSkeletonList
         @param label: the label to add to the PoseInstance message
         @type label: str
+        @param schema: if set, the msg is stamped with it instead of
+                       carrying self.cols
+        @type schema: C{column_schema.SchemaPublisher}
         @return: a PoseInstance message
         """
         self._check_parse_msg_preconditions(msg, label)
         skel = msg.skeletons[0]   # only parse the first skeleton
-        instance, _ = nsku.unpack_skeleton_msg(skel)
-        return PoseInstance(columns=self.cols,
-                            label=str(label),
-                            instance=list(instance))
+        instance = PoseInstance(label=str(label),
+                                instance=self._unpack(skel).tolist())
+        if schema is None:
+            instance.columns = self.cols
+            return instance
+        return schema.stamp(instance, self.cols)
+
+    def unpack(self, msg):
+        """Return the instance of the first skeleton of msg and its columns.
+
+        Unlike L{parse_msg}, it does not need a label nor build a msg.
+        The instance is the builder buffer, overwritten by the next msg.
+
+        @raise: TypeError if the msg is not a NiteSkeletonList, it has
+                no skeletons or they do not have len(self.joints) joints
+        @return: tuple (instance, self.cols)
+        """
+        if not isinstance(msg, self.get_msg_class()):
+            raise TypeError("Message not a {}.msg"
+                            .format(self.get_msg_class()))
+        if not msg.skeletons:
+            raise TypeError("Received a message with no skeletons")
+        return self._unpack(msg.skeletons[0]), self.cols
+
+    def _unpack(self, skel):
+        """Write the fields of a skeleton in the buffer.
+
+        @return: the buffer: [user_id, stamp, joint0 fields, ...]
+        @rtype: numpy.ndarray
+        @raise: TypeError if the skeleton does not have len(self.joints)
+                joints
+        """
+        joints = skel.joints
+        if len(joints) != len(self.joints):
+            raise TypeError("Skeleton has {} joints instead of {}"
+                            .format(len(joints), len(self.joints)))
+        transforms = [j.transform for j in joints]
+        buf, fields = self._buffer, self._joints
+        buf[0] = skel.user_id
+        buf[1] = skel.header.stamp.to_sec()
+        fields[:, 0] = [t.translation.x for t in transforms]
+        fields[:, 1] = [t.translation.y for t in transforms]
+        fields[:, 2] = [t.translation.z for t in transforms]
+        fields[:, 3] = [t.rotation.x for t in transforms]
+        fields[:, 4] = [t.rotation.y for t in transforms]
+        fields[:, 5] = [t.rotation.z for t in transforms]
+        fields[:, 6] = [t.rotation.w for t in transforms]
+        fields[:, 7] = [j.pos_confidence for j in joints]
+        fields[:, 8] = [j.orient_confidence for j in joints]
+        return buf
 
     def _check_parse_msg_preconditions(self, msg, label):
         """Helper method to check if all preconditions hold."""
@@ -13,6 +13,8 @@ from rospy import (logdebug, loginfo, logwarn, logerr, logfatal)
 from func_utils import error_handler as eh
 from func_utils import load_class
 from param_utils import get_parameters, ParamNotFoundError
+from latency_monitor import (LatencyMonitor, timed_callback)
+from column_schema import SchemaPublisher
 
 from pose_msgs.msg import PoseInstance
 from std_msgs.msg import String
@@ -48,6 +50,7 @@ class InstanceBuilderNode(object):
         self.node_name = rospy.get_name()
         rospy.on_shutdown(self.shutdown)
         loginfo("Initializing " + self.node_name + " node...")
+        self.latency_monitor = LatencyMonitor.from_params()
 
         with eh(logger=logfatal, log_msg="Couldn't load parameters",
                 action=self.shutdown, reraise=True):
@@ -63,14 +66,17 @@ class InstanceBuilderNode(object):
 
         # Publishers
         self.publisher = rospy.Publisher('pose_instance', PoseInstance)
+        self.schema = SchemaPublisher('pose_instance')
 
+    @timed_callback()
     def skel_cb(self, msg):
         """Callback for skeleton msgs.
 
         Publishes an instance from a skeelton msg."""
         with eh(logger=loginfo,
                 log_msg='Instance not published. '):
-            pose_instance = self.builder.parse_msg(msg, self.label)
+            pose_instance = self.builder.parse_msg(msg, self.label,
+                                                   self.schema)
             self.publisher.publish(pose_instance)
 
     def label_cb(self, label):
@@ -0,0 +1,223 @@
+#!/usr/bin/env python
+"""
+Per-stage latency instrumentation of the node callbacks.
+
+A L{LatencyMonitor} keeps, for each stage of a node (usually a callback),
+a histogram of its latencies and its message rate. Callbacks are
+instrumented with the L{timed_callback} decorator, which times them only
+if their node has a monitor in its C{latency_monitor} attribute::
+
+    class MyNode(object):
+        def __init__(self):
+            self.latency_monitor = LatencyMonitor.from_params()
+
+        @timed_callback('my_stage')
+        def callback(self, msg):
+            ...
+
+When the monitor is disabled (C{latency_monitor} is None), the decorator
+only adds an attribute lookup to each call.
+
+Stages can also be timed with a context manager::
+
+    with monitor.timer('my_stage'):
+        ...
+
+The monitor periodically publishes a YAML report on the
+C{~latency_report} topic and (optionally) dumps it to a file.
+"""
+import rospy
+from std_msgs.msg import String
+
+import time
+import threading
+from bisect import bisect_right
+from contextlib import contextmanager
+from functools import wraps
+
+import numpy as np
+
+# Upper edges of the histogram buckets (in seconds): 1us to 10s
+BUCKET_EDGES = tuple(np.logspace(-6, 1, 71))
+
+# Params (and their default values) read by L{LatencyMonitor.from_params}
+# latency_monitor: enables the instrumentation
+# latency_report_period: seconds between reports
+# latency_report_file: file where reports are dumped. Empty: no file
+MONITOR_PARAMS = {'latency_monitor': False, 'latency_report_period': 5.0,
+                  'latency_report_file': ''}
+
+
+class StageStats(object):
+
+    """Latency histogram and message rate of a stage."""
+
+    def __init__(self, edges=BUCKET_EDGES):
+        self.edges = edges
+        self.reset()
+
+    def reset(self):
+        """Forget all the recorded latencies."""
+        self.counts = [0] * (len(self.edges) + 1)   # Last one: overflow
+        self.count = 0
+        self.total = 0.0
+        self.max = 0.0
+        self.first_call = None
+        self.last_call = None
+        return self
+
+    def record(self, latency, now=None):
+        """Record the latency (in seconds) of a call to the stage."""
+        now = time.time() if now is None else now
+        self.counts[bisect_right(self.edges, latency)] += 1
+        self.count += 1
+        self.total += latency
+        if latency > self.max:
+            self.max = latency
+        if self.first_call is None:
+            self.first_call = now
+        self.last_call = now
+        return self
+
+    def mean(self):
+        """Return the mean latency (in seconds)."""
+        return self.total / self.count if self.count else 0.0
+
+    def percentile(self, q):
+        """
+        Return the q-th percentile of the latency (in seconds).
+
+        Computed from the histogram, so it returns the upper edge of the
+        bucket that contains the percentile (or the max latency if lower).
+        """
+        if not self.count:
+            return 0.0
+        cumcounts = np.cumsum(self.counts)
+        bucket = int(np.searchsorted(cumcounts, q / 100.0 * self.count))
+        if bucket >= len(self.edges):
+            return self.max
+        return min(self.edges[bucket], self.max)
+
+    def rate(self):
+        """Return the rate (in Hz) of the calls to the stage."""
+        if self.count < 2 or self.last_call == self.first_call:
+            return 0.0
+        return (self.count - 1) / (self.last_call - self.first_call)
+
+    def summary(self):
+        """Return a dict with the statistics of the stage (times in ms)."""
+        return {'count': self.count,
+                'rate_hz': round(self.rate(), 2),
+                'mean_ms': round(1e3 * self.mean(), 3),
+                'p50_ms': round(1e3 * self.percentile(50), 3),
+                'p99_ms': round(1e3 * self.percentile(99), 3),
+                'max_ms': round(1e3 * self.max, 3)}
+
+
+class LatencyMonitor(object):
+
+    """Collect the latencies of the stages of a node."""
+
+    def __init__(self, name=None):
+        """
+        Constructor.
+
+        @param name: name of the monitored node (used in the reports)
+        """
+        self.name = name
+        self.stages = {}
+        self._lock = threading.Lock()
+        self._publisher = None
+        self._report_file = None
+
+    @classmethod
+    def from_params(cls):
+        """
+        Return a monitor configured with the node params (See MONITOR_PARAMS).
+
+        @return: the monitor or None if the latency_monitor param is False
+        """
+        params = {pname: rospy.get_param('~' + pname, default)
+                  for pname, default in MONITOR_PARAMS.iteritems()}
+        if not params['latency_monitor']:
+            return None
+        monitor = cls(rospy.get_name())
+        monitor.start_reporting(params['latency_report_period'],
+                                params['latency_report_file'])
+        return monitor
+
+    def record(self, stage, latency):
+        """Record the latency (in seconds) of a call to a stage."""
+        with self._lock:
+            stats = self.stages.get(stage)
+            if stats is None:
+                stats = self.stages[stage] = StageStats()
+            stats.record(latency)
+
+    @contextmanager
+    def timer(self, stage):
+        """Context manager that records the time spent in its block."""
+        start = time.time()
+        try:
+            yield
+        finally:
+            self.record(stage, time.time() - start)
+
+    def report(self):
+        """Return a dict with the summary of each stage."""
+        with self._lock:
+            return {stage: stats.summary()
+                    for stage, stats in self.stages.iteritems()}
+
+    def report_yaml(self):
+        """Return the report as a YAML string."""
+        import yaml
+        return yaml.safe_dump({'node': self.name, 'stamp': time.time(),
+                               'stages': self.report()},
+                              default_flow_style=False)
+
+    def start_reporting(self, period, filename=''):
+        """
+        Publish the report on ~latency_report every period seconds.
+
+        @param filename: if set, reports are also appended to this file
+        """
+        self._publisher = rospy.Publisher('~latency_report', String)
+        self._report_file = filename or None
+        rospy.Timer(rospy.Duration(period), self._report_cb)
+        return self
+
+    def _report_cb(self, event=None):
+        """Publish and dump the current report."""
+        report = self.report_yaml()
+        self._publisher.publish(report)
+        if self._report_file:
+            with open(self._report_file, 'a') as f:
+                f.write('---\n' + report)
+
+
+def timed_callback(stage=None):
+    """
+    Decorator that records the latency of a node method.
+
+    The latency is recorded in the L{LatencyMonitor} stored in the
+    C{latency_monitor} attribute of the node. If it is None (or the node
+    does not have it), the method is called without timing it.
+
+    @param stage: name of the stage. Default: the name of the method
+    """
+    def method_wrapper(method):
+        stage_name = stage or method.__name__
+
+        @wraps(method)
+        def caller(self, *args, **kwargs):
+            monitor = getattr(self, 'latency_monitor', None)
+            if monitor is None:
+                return method(self, *args, **kwargs)
+            start = time.time()
+            try:
+                return method(self, *args, **kwargs)
+            finally:
+                monitor.record(stage_name, time.time() - start)
+        return caller
+    return method_wrapper
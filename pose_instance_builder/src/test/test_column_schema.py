@@ -0,0 +1,80 @@
+#!/usr/bin/env python
+PKG = 'pose_instance_builder'
+import roslib; roslib.load_manifest(PKG)
+import rospy
+import unittest
+from mock import patch
+
+from column_schema import (schema_id, SchemaPublisher, SchemaCache)
+from pose_msgs.msg import (PoseInstance, ColumnSchema)
+
+COLUMNS = ['user_id', 'stamp', 'head_pos_x', 'head_pos_y']
+
+
+class SchemaIdTestCase(unittest.TestCase):
+    def test_schema_id_depends_on_columns(self):
+        self.assertEqual(schema_id(COLUMNS), schema_id(list(COLUMNS)))
+        self.assertNotEqual(schema_id(COLUMNS), schema_id(COLUMNS[::-1]))
+        self.assertNotEqual(schema_id(COLUMNS), 0)
+
+
+class SchemaTestCase(unittest.TestCase):
+    def __init__(self, *args):
+        super(SchemaTestCase, self).__init__(*args)
+
+    def setUp(self):
+        for name in ('Publisher', 'Subscriber'):
+            patcher = patch.object(rospy, name)
+            patcher.start()
+            self.addCleanup(patcher.stop)
+
+    def test_stamp_announces_schema_once(self):
+        schema = SchemaPublisher('pose_instance', send_columns=False)
+        for _ in range(3):
+            msg = schema.stamp(PoseInstance(), COLUMNS)
+        self.assertEqual(msg.schema_id, schema_id(COLUMNS))
+        self.assertEqual(msg.columns, [])
+        schema._publisher.publish.assert_called_once_with(
+            ColumnSchema(schema_id=schema_id(COLUMNS), columns=COLUMNS))
+
+    def test_stamp_announces_new_columns(self):
+        schema = SchemaPublisher('pose_instance', send_columns=True)
+        schema.stamp(PoseInstance(), COLUMNS)
+        msg = schema.stamp(PoseInstance(), COLUMNS[:2])
+        self.assertEqual(msg.schema_id, schema_id(COLUMNS[:2]))
+        self.assertEqual(msg.columns, COLUMNS[:2])
+        self.assertEqual(schema._publisher.publish.call_count, 2)
+
+    def test_columns_are_only_sent_if_column_schema_is_disabled(self):
+        for param, sent in ((None, []), (True, []), (False, COLUMNS)):
+            params = {} if param is None else {'~column_schema': param}
+            with patch.object(rospy, 'get_param',
+                              side_effect=lambda name, default: params.get(
+                                  name, default)):
+                schema = SchemaPublisher('pose_instance')
+            msg = schema.stamp(PoseInstance(), COLUMNS)
+            self.assertEqual(msg.schema_id, schema_id(COLUMNS))
+            self.assertEqual(msg.columns, sent)
+
+    def test_stamp_without_columns(self):
+        schema = SchemaPublisher('pose_instance', send_columns=False)
+        msg = schema.stamp(PoseInstance(), [])
+        self.assertEqual(msg.schema_id, 0)
+        self.assertFalse(schema._publisher.publish.called)
+
+    def test_cache_resolves_columns(self):
+        cache = SchemaCache('pose_instance')
+        schema = SchemaPublisher('pose_instance', send_columns=False)
+        msg = schema.stamp(PoseInstance(), COLUMNS)
+        with self.assertRaises(KeyError):
+            cache.columns(msg)
+        cache.schema_cb(ColumnSchema(schema_id=msg.schema_id,
+                                     columns=COLUMNS))
+        self.assertEqual(cache.columns(msg), COLUMNS)
+        self.assertEqual(cache.columns(PoseInstance(columns=['a'])), ['a'])
+
+
+if __name__ == '__main__':
+    import rosunit
+    rosunit.unitrun(PKG, 'test_schema_id', SchemaIdTestCase)
+    rosunit.unitrun(PKG, 'test_column_schema', SchemaTestCase)
@@ -143,10 +143,32 @@ class TestPiTrackerIBuiler(unittest.TestCase):
         self.assertEqual(self.instance,
                          self.builder.parse_msg(self.skel, 'lalala'))
 
+    def test_parse_msg_raises_TypeError_with_bad_num_of_fields(self):
+        self.skel.confidence = linspace(1, 1, 4)
+        with self.assertRaises(TypeError):
+            self.builder.parse_msg(self.skel, 'lalala')
+
+    def test_parse_msg_with_new_joints(self):
+        self.builder.parse_msg(self.skel, 'lalala')
+        self.skel.name = self.skel.name[:3]
+        for field in ('confidence', 'position', 'orientation'):
+            setattr(self.skel, field, getattr(self.skel, field)[:3])
+        self.instance.columns = self.instance.columns[:3]
+        self.instance.instance = self.instance.instance[:1 + 3 * 8]
+        self.assertEqual(self.instance,
+                         self.builder.parse_msg(self.skel, 'lalala'))
+
     def test_get_msg_class(self):
         skel = self.builder.get_msg_class()()
         self.assertTrue(isinstance(skel, Skeleton))
 
+    def test_unpack(self):
+        instance, columns = self.builder.unpack(self.skel)
+        self.assertEqual(self.instance.instance, instance.tolist())
+        self.assertEqual(len(instance), len(columns))
+        self.assertEqual(columns[:3], ['user_id', 'c0_pos_x', 'c0_pos_y'])
+        self.assertEqual(columns[-1], 'c4_confidence')
+
 
 class TestKinectIBuilder(unittest.TestCase):
 
@@ -181,6 +203,62 @@ class TestKinectIBuilder(unittest.TestCase):
         except:
             self.fail()
 
+    def test_parse_msg(self):
+        self.skel_list = nsku.generate_fake_NiteSkeletonList_msg(
+            2, self.builder.joints)
+        instance, _ = nsku.unpack_skeleton_msg(self.skel_list.skeletons[0])
+        expected = PoseInstance(columns=self.builder.cols, label='lalala',
+                                instance=list(instance))
+        self.assertEqual(expected,
+                         self.builder.parse_msg(self.skel_list, 'lalala'))
+
+    def test_parse_msg_raises_TypeError_with_bad_num_of_fields(self):
+        for joints in (self.builder.joints[:-1], self.builder.joints * 2):
+            self.skel_list = nsku.generate_fake_NiteSkeletonList_msg(
+                1, joints)
+            with self.assertRaises(TypeError):
+                self.builder.parse_msg(self.skel_list, 'lalala')
+
+    def test_unpack(self):
+        self.skel_list = nsku.generate_fake_NiteSkeletonList_msg(
+            2, self.builder.joints)
+        expected, _ = nsku.unpack_skeleton_msg(self.skel_list.skeletons[0])
+        instance, columns = self.builder.unpack(self.skel_list)
+        self.assertEqual(list(expected), instance.tolist())
+        self.assertEqual(self.builder.cols, columns)
+        with self.assertRaises(TypeError):
+            self.builder.unpack(NiteSkeletonList())
+
+    def test_unpack_reuses_its_buffer(self):
+        msgs = [nsku.generate_fake_NiteSkeletonList_msg(1, self.builder.joints)
+                for _ in range(2)]
+        first, _ = self.builder.unpack(msgs[0])
+        second, _ = self.builder.unpack(msgs[1])
+        self.assertIs(first, second)
+        expected, _ = nsku.unpack_skeleton_msg(msgs[1].skeletons[0])
+        self.assertEqual(list(expected), second.tolist())
+
+    def test_parse_msg_with_schema_does_not_carry_columns(self):
+        schema = FakeSchema()
+        self.skel_list = nsku.generate_fake_NiteSkeletonList_msg(
+            1, self.builder.joints)
+        msg = self.builder.parse_msg(self.skel_list, 'lalala', schema)
+        self.assertEqual([], msg.columns)
+        self.assertEqual(schema.schema_id, msg.schema_id)
+        self.assertIs(self.builder.cols, schema.stamped)
+
+
+class FakeSchema(object):
+
+    """SchemaPublisher that does not send the columns of the msgs."""
+
+    schema_id = 42
+
+    def stamp(self, msg, columns):
+        self.stamped = columns
+        msg.schema_id, msg.columns = self.schema_id, []
+        return msg
+
 
 if __name__ == '__main__':
     import rosunit
@@ -0,0 +1,98 @@
+#!/usr/bin/env python
+PKG = 'pose_instance_builder'
+import roslib; roslib.load_manifest(PKG)
+import unittest
+
+from latency_monitor import (StageStats, LatencyMonitor, timed_callback)
+
+
+class FakeNode(object):
+    def __init__(self, monitor=None):
+        self.latency_monitor = monitor
+        self.calls = 0
+
+    @timed_callback('stage')
+    def callback(self, value):
+        self.calls += 1
+        return value
+
+    @timed_callback()
+    def failing_callback(self):
+        raise ValueError()
+
+
+class StageStatsTestCase(unittest.TestCase):
+    def __init__(self, *args):
+        super(StageStatsTestCase, self).__init__(*args)
+
+    def setUp(self):
+        self.stats = StageStats()
+
+    def tearDown(self):
+        pass
+
+    def test_empty_stats(self):
+        self.assertEqual(self.stats.count, 0)
+        self.assertEqual(self.stats.mean(), 0)
+        self.assertEqual(self.stats.percentile(50), 0)
+        self.assertEqual(self.stats.rate(), 0)
+
+    def test_record(self):
+        for i, latency in enumerate((0.001, 0.002, 0.003)):
+            self.stats.record(latency, now=i * 0.1)
+        self.assertEqual(self.stats.count, 3)
+        self.assertAlmostEqual(self.stats.mean(), 0.002)
+        self.assertEqual(self.stats.max, 0.003)
+        self.assertAlmostEqual(self.stats.rate(), 10)
+
+    def test_percentiles_are_bounded_by_bucket_edges(self):
+        for _ in xrange(99):
+            self.stats.record(0.001)
+        self.stats.record(1.0)
+        self.assertTrue(0.001 <= self.stats.percentile(50) < 0.0013)
+        self.assertEqual(self.stats.percentile(100), 1.0)
+
+    def test_latencies_over_the_last_edge_go_to_overflow(self):
+        self.stats.record(100.0)
+        self.assertEqual(self.stats.counts[-1], 1)
+        self.assertEqual(self.stats.percentile(50), 100.0)
+
+
+class TimedCallbackTestCase(unittest.TestCase):
+    def __init__(self, *args):
+        super(TimedCallbackTestCase, self).__init__(*args)
+
+    def setUp(self):
+        pass
+
+    def tearDown(self):
+        pass
+
+    def test_does_not_time_without_monitor(self):
+        node = FakeNode()
+        self.assertEqual(node.callback(3), 3)
+        self.assertEqual(node.calls, 1)
+
+    def test_records_the_stage_in_the_monitor(self):
+        node = FakeNode(LatencyMonitor('node'))
+        for i in xrange(5):
+            self.assertEqual(node.callback(i), i)
+        self.assertEqual(node.latency_monitor.stages['stage'].count, 5)
+        self.assertEqual(node.latency_monitor.report()['stage']['count'], 5)
+
+    def test_records_failing_calls_with_method_name(self):
+        node = FakeNode(LatencyMonitor('node'))
+        self.assertRaises(ValueError, node.failing_callback)
+        self.assertIn('failing_callback', node.latency_monitor.stages)
+
+    def test_timer_context_manager(self):
+        monitor = LatencyMonitor('node')
+        with monitor.timer('block'):
+            pass
+        self.assertEqual(monitor.stages['block'].count, 1)
+
+
+if __name__ == '__main__':
+    import rosunit
+    rosunit.unitrun(PKG, 'test_latency_monitor', StageStatsTestCase)
+    rosunit.unitrun(PKG, 'test_latency_monitor', TimedCallbackTestCase)
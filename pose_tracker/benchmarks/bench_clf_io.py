@@ -0,0 +1,119 @@
+#!/usr/bin/env python
+"""
+Benchmark of pose_learner.save_clf and load_clf.
+
+Fits a random forest of ``--trees`` trees on random instances and saves
+it with each of the ``--compress`` levels. Then it loads every file in
+memory and memory-mapped, ``--procs`` times in parallel processes, as
+several L{PoseEstimatorNode} would do on the same host. Reports the file
+size, save time, mean load time and the mean unique and proportional
+set size (USS and PSS, from /proc/<pid>/smaps) of the loading processes.
+Memory-mapping only avoids an intermediate copy of the arrays: the
+trees copy their arrays into private memory when unpickled, so they are
+not shared among the processes. With 100 trees (77 MB file) and 4
+processes, each loader took about 158 MB USS / 186 MB PSS in memory and
+82 MB USS / 109 MB PSS memory-mapped.
+
+Usage:
+    rosrun pose_tracker bench_clf_io.py [--trees 200] [--procs 4]
+"""
+from __future__ import (print_function, division)
+import roslib
+roslib.load_manifest('pose_tracker')
+
+import os
+import argparse
+import tempfile
+import time
+from multiprocessing import (Process, Queue, Event)
+import numpy as np
+from sklearn.ensemble import RandomForestClassifier
+
+import pose_tracker.pose_learner as pl
+
+
+def fit_forest(trees, samples, features, labels):
+    """Return a random forest fitted to random instances."""
+    rnd = np.random.RandomState(0)
+    X = rnd.rand(samples, features)
+    y = rnd.randint(labels, size=samples)
+    return RandomForestClassifier(n_estimators=trees, random_state=0).fit(X, y)
+
+
+def smaps_memory(pid):
+    """Return (USS, PSS) of a process in MB."""
+    uss = pss = 0
+    with open('/proc/{}/smaps'.format(pid)) as smaps:
+        for line in smaps:
+            if line.startswith(('Private_Clean:', 'Private_Dirty:')):
+                uss += int(line.split()[1])
+            elif line.startswith('Pss:'):
+                pss += int(line.split()[1])
+    return uss / 1024.0, pss / 1024.0
+
+
+def _load(queue, done, filename, mmap_mode):
+    """Load a classifier, touch all its trees and wait until done is set."""
+    start = time.time()
+    clf = pl.load_clf(filename, mmap_mode=mmap_mode)
+    for tree in clf.estimators_:
+        tree.tree_.value.sum()
+    elapsed = time.time() - start
+    queue.put((elapsed, ) + smaps_memory(os.getpid()))
+    done.wait()
+
+
+def measure_load(filename, mmap_mode, procs):
+    """Return mean load time (s), USS (MB) and PSS (MB) of procs loads."""
+    queue, done = Queue(), Event()
+    workers = [Process(target=_load, args=(queue, done, filename, mmap_mode))
+               for _ in xrange(procs)]
+    for w in workers:
+        w.start()
+    results = [queue.get() for _ in workers]
+    done.set()
+    for w in workers:
+        w.join()
+    return np.mean(results, axis=0)
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.split('\n')[1])
+    parser.add_argument('--trees', type=int, default=200)
+    parser.add_argument('--samples', type=int, default=20000)
+    parser.add_argument('--features', type=int, default=105)
+    parser.add_argument('--labels', type=int, default=4)
+    parser.add_argument('--procs', type=int, default=4,
+                        help="Processes loading the classifier at once")
+    parser.add_argument('--compress', type=int, nargs='+', default=[0, 3, 9])
+    args = parser.parse_args()
+
+    print("Fitting a forest of {} trees...".format(args.trees))
+    clf = fit_forest(args.trees, args.samples, args.features, args.labels)
+    tmpdir = tempfile.mkdtemp(prefix='bench_clf_io')
+    print("{:>8} {:>10} {:>8} {:>6} {:>8} {:>9} {:>9}"
+          .format('compress', 'size (MB)', 'save (s)', 'mmap',
+                  'load (s)', 'USS (MB)', 'PSS (MB)'))
+    for compress in args.compress:
+        filename = os.path.join(tmpdir, 'clf_{}.pkl'.format(compress))
+        start = time.time()
+        pl.save_clf(clf, filename, compress=compress)
+        save_time = time.time() - start
+        size = sum(os.path.getsize(os.path.join(tmpdir, f))
+                   for f in os.listdir(tmpdir)
+                   if f.startswith(os.path.basename(filename)))
+        for mmap_mode in (None, 'r'):
+            if compress and mmap_mode:
+                continue    # Compressed files can not be memory-mapped
+            load_time, uss, pss = measure_load(filename, mmap_mode,
+                                               args.procs)
+            print("{:>8} {:>10.1f} {:>8.2f} {:>6} {:>8.2f} {:>9.1f} {:>9.1f}"
+                  .format(compress, size / 2.0 ** 20, save_time,
+                          mmap_mode or '-', load_time, uss, pss))
+    for f in os.listdir(tmpdir):
+        os.remove(os.path.join(tmpdir, f))
+    os.rmdir(tmpdir)
+
+
+if __name__ == '__main__':
+    main()
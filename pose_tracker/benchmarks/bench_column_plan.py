@@ -0,0 +1,68 @@
+#!/usr/bin/env python
+"""
+Micro-benchmark of the per-message cost of building an estimator instance.
+
+Compares the labelled pandas.Series + drop() approach previously used by
+L{PoseEstimatorNode._unpack_skeleton_msg} with the precompiled
+L{column_plan} fancy-indexing into a reused float32 buffer.
+
+Usage:
+    rosrun pose_tracker bench_column_plan.py [-n NUM_MESSAGES]
+"""
+from __future__ import print_function
+import roslib
+roslib.load_manifest('pose_tracker')
+
+import os
+import argparse
+import timeit
+import numpy as np
+import rospkg
+import yaml
+from pandas import Series
+
+from pose_tracker.pose_estimator_node import column_plan, LABEL_COLUMN
+
+
+def _load_yaml(package, filename):
+    path = os.path.join(rospkg.RosPack().get_path(package), filename)
+    with open(path) as f:
+        return yaml.safe_load(f)
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.split('\n')[1])
+    parser.add_argument('-n', '--num-messages', type=int, default=100000)
+    args = parser.parse_args()
+
+    columns = _load_yaml('pose_tracker', 'params/dataset_default_columns'
+                                         '.yaml')['dataset_columns']
+    drop_columns = _load_yaml('pose_tracker', 'params/pose_learner_params'
+                                              '.yaml')['drop_columns']
+    drop_columns = [c for c in drop_columns if c in columns]
+    fields = [c for c in columns if c != LABEL_COLUMN]
+    unpacked = list(np.random.rand(len(fields)))   # A fake unpacked skeleton
+
+    def series_drop():
+        return Series(unpacked, index=fields).drop(drop_columns)
+
+    plan = column_plan(columns, drop_columns)
+    buf = np.empty(len(plan), dtype=np.float32)
+
+    def plan_take():
+        row = np.fromiter(unpacked, dtype=np.float64)
+        return row.take(plan, out=buf, mode='clip')
+
+    np.testing.assert_array_almost_equal(series_drop().values, plan_take())
+
+    print("Per message cost ({} msgs, {} fields, {} kept):"
+          .format(args.num_messages, len(fields), len(plan)))
+    for name, func in (('Series + drop', series_drop),
+                       ('column plan', plan_take)):
+        secs = min(timeit.repeat(func, number=args.num_messages, repeat=3))
+        print("  {:<15} {:8.2f} us/msg".format(name,
+                                              1e6 * secs / args.num_messages))
+
+
+if __name__ == '__main__':
+    main()
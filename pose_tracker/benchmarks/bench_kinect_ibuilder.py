@@ -0,0 +1,76 @@
+#!/usr/bin/env python
+"""
+Micro-benchmark of the per-message cost of KinectIBuilder.parse_msg.
+
+Compares the generator chain previously used by
+L{KinectIBuilder.parse_msg} (unpack_skeleton_msg + list() into the
+PoseInstance) with the current unpacking into the preallocated buffer of
+the builder, both with and without serializing the resulting PoseInstance
+msg.
+
+Each of the ``--users`` users is parsed at ``--rate`` Hz, so the CPU share
+is the per message cost times rate times users.
+
+Usage:
+    rosrun pose_tracker bench_kinect_ibuilder.py [-n NUM_MESSAGES]
+                                                 [--users 2] [--rate 30]
+"""
+from __future__ import (print_function, division)
+import roslib
+roslib.load_manifest('pose_tracker')
+roslib.load_manifest('pose_instance_builder')
+
+import argparse
+import timeit
+from StringIO import StringIO
+
+import kinect.nite_skeleton_msg_utils as nsku
+from pose_msgs.msg import PoseInstance
+from instance_builder import KinectIBuilder
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.split('\n')[1])
+    parser.add_argument('-n', '--num-messages', type=int, default=20000)
+    parser.add_argument('--users', type=int, default=1)
+    parser.add_argument('--rate', type=float, default=30.0,
+                        help="Rate (Hz) of the skeletons of each user")
+    args = parser.parse_args()
+
+    builder = KinectIBuilder()
+    msg = nsku.generate_fake_NiteSkeletonList_msg(args.users, builder.joints)
+    label = 'pointing'
+
+    def generator_chain():
+        builder._check_parse_msg_preconditions(msg, label)
+        instance, _ = nsku.unpack_skeleton_msg(msg.skeletons[0])
+        return PoseInstance(columns=builder.cols, label=str(label),
+                            instance=list(instance))
+
+    def fast_path():
+        return builder.parse_msg(msg, label)
+
+    def serialized(parse):
+        def parse_and_serialize():
+            parse().serialize(StringIO())
+        return parse_and_serialize
+
+    assert generator_chain() == fast_path()
+
+    print("Per message cost ({} msgs, {} fields, {} users at {} Hz):"
+          .format(args.num_messages, len(builder.cols), args.users,
+                  args.rate))
+    print("  {:<28} {:>9} {:>9}".format('', 'us/msg', 'CPU (%)'))
+    for name, func in (('generator chain', generator_chain),
+                       ('fast path', fast_path),
+                       ('generator chain + serialize',
+                        serialized(generator_chain)),
+                       ('fast path + serialize', serialized(fast_path))):
+        secs = min(timeit.repeat(func, number=args.num_messages, repeat=3))
+        cost = secs / args.num_messages
+        print("  {:<28} {:9.2f} {:9.3f}"
+              .format(name, 1e6 * cost, 100 * cost * args.rate * args.users))
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,108 @@
+#!/usr/bin/env python
+"""
+Benchmark of pose_learner.prepare_dataset on a synthetic HDF5 dataset.
+
+Builds a store with ``--tables`` tables of random skeletons in group
+``--group`` adding up to ``--size-gb`` GB of data and loads it with
+L{prepare_dataset}, both in memory and in chunks of ``--chunksize`` rows,
+sequentially and with a pool of ``--jobs`` processes. Each load runs in
+its own process to report its wall time and peak RSS (the RSS of parallel
+runs does not include their workers).
+
+Usage:
+    rosrun pose_tracker bench_prepare_dataset.py [--size-gb 2] [--tables 4]
+"""
+from __future__ import (print_function, division)
+import roslib
+roslib.load_manifest('pose_tracker')
+
+import os
+import argparse
+import resource
+import time
+from multiprocessing import (Process, Queue)
+import numpy as np
+import pandas as pd
+
+import pose_tracker.pose_learner as pl
+from pose_tracker.PoseDatasetIO import PoseDatasetIO
+
+POSES = ('STAND_pointing', 'STAND_hands_up', 'STAND_arms_crossed', 'STAND')
+WRITE_CHUNK = 200000    # Rows written to the store at once
+
+
+def build_store(filename, group, size_gb, tables):
+    """Write a synthetic dataset of size_gb GB split in tables tables."""
+    num_cols = len(pl.COLUMNS) - 1
+    rows_per_table = int(size_gb * 2 ** 30 / (8 * num_cols) / tables)
+    rnd = np.random.RandomState(0)
+    with PoseDatasetIO(dataset=filename, columns=pl.COLUMNS,
+                       mode='w') as dataset:
+        for t in xrange(tables):
+            table = '{}/exp{:02d}'.format(group, t)
+            for start in xrange(0, rows_per_table, WRITE_CHUNK):
+                nrows = min(WRITE_CHUNK, rows_per_table - start)
+                chunk = pd.DataFrame(rnd.rand(nrows, num_cols),
+                                     columns=pl.COLUMNS[:-1])
+                chunk['pose'] = rnd.choice(POSES, nrows)
+                dataset.write(table, chunk, table=True, append=True,
+                              min_itemsize={'pose': 30})
+    return rows_per_table * tables
+
+
+def _run(queue, func, kwargs):
+    """Run func in a child process and put its time and peak RSS in queue."""
+    start = time.time()
+    func(**kwargs)
+    elapsed = time.time() - start
+    queue.put((elapsed, resource.getrusage(resource.RUSAGE_SELF).ru_maxrss))
+
+
+def measure(func, **kwargs):
+    """Return (wall time in seconds, peak RSS in MB) of func(**kwargs)."""
+    queue = Queue()
+    proc = Process(target=_run, args=(queue, func, kwargs))
+    proc.start()
+    elapsed, maxrss = queue.get()
+    proc.join()
+    return elapsed, maxrss / 1024.0
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.split('\n')[1])
+    parser.add_argument('--file', default='/tmp/bench_prepare_dataset.h5')
+    parser.add_argument('--group', default='/bench')
+    parser.add_argument('--size-gb', type=float, default=2.0)
+    parser.add_argument('--tables', type=int, default=4)
+    parser.add_argument('--chunksize', type=int, default=100000)
+    parser.add_argument('--jobs', type=int, default=0,
+                        help="Processes of the parallel runs (0: all CPUs)")
+    parser.add_argument('--keep', action='store_true',
+                        help="Reuse the dataset file if it already exists")
+    args = parser.parse_args()
+
+    if not (args.keep and os.path.exists(args.file)):
+        print("Building {} GB dataset in {}...".format(args.size_gb,
+                                                       args.file))
+        nrows = build_store(args.file, args.group, args.size_gb, args.tables)
+        print("  {} rows in {} tables".format(nrows, args.tables))
+
+    runs = (('in memory', {}),
+            ('chunked', {'chunksize': args.chunksize}),
+            ('chunked + var', {'chunksize': args.chunksize,
+                               'variance': True}),
+            ('parallel', {'n_jobs': args.jobs}),
+            ('parallel chunked', {'chunksize': args.chunksize,
+                                  'n_jobs': args.jobs}))
+    for name, kwargs in runs:
+        elapsed, maxrss = measure(pl.prepare_dataset, filename=args.file,
+                                  group_name=args.group, **kwargs)
+        print("{:<17} {:8.2f} s   peak RSS {:8.1f} MB"
+              .format(name, elapsed, maxrss))
+
+    if not args.keep:
+        os.remove(args.file)
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,289 @@
+#!/usr/bin/env python
+"""
+Replay benchmark of the pipeline node callbacks without a ROS master.
+
+Each node is built with a local stand-in of the rospy transport (topics,
+params, services and timers live in the benchmark process) and a
+synthetic stream of ``--rate`` Hz during ``--duration`` seconds with
+``--users`` tracked users is replayed through its real callback:
+
+    - instance_builder:    InstanceBuilderNode.skel_cb (NiteSkeletonList)
+    - joint_velocities:    JointVelocitiesPublisher.instance_cb
+    - instance_averager:   InstanceAveragerNode.instance_cb
+    - pose_detector:       PoseDetectorNode.velo_cb (JointVelocities)
+    - pose_estimator:      PoseEstimatorNode.skeleton_cb (NiteSkeletonList)
+    - pose_pipeline:       PosePipelineNode.skel_cb (NiteSkeletonList). All
+                           the above in a single process; compare it with
+                           the sum of their latencies.
+
+Streams are replayed as fast as possible unless ``--realtime`` is set.
+Each node runs in its own process, which reports its throughput,
+p50/p99 callback latency and peak RSS.
+
+Usage:
+    rosrun pose_tracker bench_replay.py [--nodes pose_estimator ...]
+                                        [--users 2] [--rate 30]
+"""
+from __future__ import (print_function, division)
+import roslib
+roslib.load_manifest('pose_tracker')
+roslib.load_manifest('pose_instance_builder')
+import rospy
+
+import os
+import argparse
+import importlib
+import resource
+import tempfile
+import time
+from collections import defaultdict
+from multiprocessing import (Process, Queue)
+
+import numpy as np
+from mock import (MagicMock, patch)
+
+import kinect.nite_skeleton_msg_utils as nsku
+
+JOINTS = ['head', 'neck', 'torso',
+          'left_shoulder', 'left_elbow', 'left_hand',
+          'right_shoulder', 'right_elbow', 'right_hand',
+          'left_hip', 'left_knee', 'left_foot',
+          'right_hip', 'right_knee', 'right_foot']
+POSES = ['pointing', 'hands_up', 'arms_crossed', 'stand']
+
+
+class LocalPublisher(object):
+
+    """Publisher delivering msgs to the subscribers of a L{LocalTransport}."""
+
+    def __init__(self, transport, topic):
+        self.transport = transport
+        self.topic = topic
+
+    def publish(self, msg):
+        self.transport.deliver(self.topic, msg)
+
+    def get_num_connections(self):
+        return len(self.transport.callbacks[self.topic])
+
+
+class LocalTransport(object):
+
+    """
+    In-process stand-in for the rospy transport.
+
+    Topic names are matched without namespaces, msgs are delivered
+    synchronously and params are read from a dict.
+    """
+
+    def __init__(self, params):
+        self.params = dict(params)
+        self.callbacks = defaultdict(list)
+        self.published = defaultdict(int)
+
+    @staticmethod
+    def _name(name):
+        return name.rsplit('/', 1)[-1].lstrip('~')
+
+    def subscriber(self, topic, msg_class, callback, *args, **kwargs):
+        self.callbacks[self._name(topic)].append(callback)
+        return MagicMock()
+
+    def publisher(self, topic, msg_class, *args, **kwargs):
+        return LocalPublisher(self, self._name(topic))
+
+    def deliver(self, topic, msg):
+        self.published[topic] += 1
+        for callback in self.callbacks[topic]:
+            callback(msg)
+
+    def get_param(self, name, default=KeyError):
+        pname = self._name(name)
+        if pname in self.params:
+            return self.params[pname]
+        if default is KeyError:
+            raise KeyError(name)
+        return default
+
+    def search_param(self, name):
+        return name if self._name(name) in self.params else None
+
+    def has_param(self, name):
+        return self._name(name) in self.params
+
+    def patch(self, node_name):
+        """Return a patcher that replaces rospy with the local transport."""
+        return patch.multiple(rospy, init_node=MagicMock(),
+                              on_shutdown=MagicMock(),
+                              get_name=lambda: '/' + node_name,
+                              Subscriber=self.subscriber,
+                              Publisher=self.publisher,
+                              Service=MagicMock(), Timer=MagicMock(),
+                              wait_for_service=MagicMock(),
+                              get_param=self.get_param,
+                              search_param=self.search_param,
+                              has_param=self.has_param)
+
+
+# --- Synthetic streams ---
+
+def skeleton_stream(nmsgs, users, rate):
+    """Return nmsgs NiteSkeletonList msgs with the skeletons of users users."""
+    msgs = []
+    for _ in xrange(nmsgs):
+        msg = nsku.generate_fake_NiteSkeletonList_msg(users, JOINTS)
+        for user_id, skel in enumerate(msg.skeletons, 1):
+            skel.user_id = user_id
+        msgs.append(msg)
+    return msgs
+
+
+def instance_stream(nmsgs, users, rate):
+    """Return the PoseInstance msgs of a L{skeleton_stream}."""
+    from instance_builder import KinectIBuilder
+    builder = KinectIBuilder()
+    return [builder.parse_msg(msg, POSES[0])
+            for msg in skeleton_stream(nmsgs, users, rate)]
+
+
+def velocities_stream(nmsgs, users, rate):
+    """Return nmsgs JointVelocities msgs of random velocities."""
+    from pose_msgs.msg import JointVelocities
+    from instance_builder import KinectIBuilder
+    columns = KinectIBuilder().cols
+    rnd = np.random.RandomState(0)
+    return [JointVelocities(velocities=rnd.rand(len(columns)).tolist(),
+                            columns=columns) for _ in xrange(nmsgs)]
+
+
+def fit_estimator(filename, columns, drop_columns):
+    """Save a small random forest that estimates instances of columns."""
+    from sklearn.ensemble import RandomForestClassifier
+    import pose_tracker.pose_learner as pl
+    from pose_tracker.pose_estimator_node import column_plan
+    nfeatures = len(column_plan(columns, drop_columns))
+    rnd = np.random.RandomState(0)
+    X = rnd.rand(1000, nfeatures)
+    y = rnd.randint(len(POSES), size=1000)
+    clf = RandomForestClassifier(n_estimators=20, random_state=0).fit(X, y)
+    pl.save_clf(clf, filename, labels=POSES)
+
+
+# name: (module, class, callback, stream, params)
+NODES = {
+    'instance_builder': ('instance_builder_node', 'InstanceBuilderNode',
+                         'skel_cb', skeleton_stream,
+                         {'builder_type': 'instance_builder.KinectIBuilder',
+                          'skeleton_topic': 'skeletons'}),
+    'joint_velocities': ('pose_detector.joint_velocities_publisher',
+                         'JointVelocitiesPublisher', 'instance_cb',
+                         instance_stream, {'num_instances': 30}),
+    'instance_averager': ('pose_detector.instance_averager_node',
+                          'InstanceAveragerNode', 'instance_cb',
+                          instance_stream, {'averager_method': 'mean',
+                                            'dataframe_length': 30}),
+    'pose_detector': ('pose_detector.pose_detector_node', 'PoseDetectorNode',
+                      'velo_cb', velocities_stream,
+                      {'dataframe_length': 30, 'movement_threshold': 0.5}),
+    'pose_estimator': ('pose_tracker.pose_estimator_node',
+                       'PoseEstimatorNode', 'skeleton_cb', skeleton_stream,
+                       {}),
+    'pose_pipeline': ('pose_tracker.pose_pipeline_node', 'PosePipelineNode',
+                      'skel_cb', skeleton_stream,
+                      {'builder_type': 'instance_builder.KinectIBuilder',
+                       'skeleton_topic': 'skeletons', 'num_instances': 30,
+                       'averager_method': 'mean', 'dataframe_length': 30,
+                       'movement_threshold': 0.5}),
+}
+
+
+def replay(queue, name, msgs, params, realtime, rate):
+    """Build a node, replay msgs through its callback and report stats."""
+    module, klass, callback, _, node_params = NODES[name]
+    params = dict(params, **node_params)
+    transport = LocalTransport(params)
+    with transport.patch(name):
+        node = getattr(importlib.import_module(module), klass)()
+        if name == 'instance_builder':
+            node.label = POSES[0]
+        cb = getattr(node, callback)
+        latencies = np.empty(len(msgs))
+        start = time.time()
+        for i, msg in enumerate(msgs):
+            if realtime:
+                time.sleep(max(0, start + i / rate - time.time()))
+            t0 = time.time()
+            cb(msg)
+            latencies[i] = time.time() - t0
+        elapsed = time.time() - start
+    queue.put((len(msgs) / elapsed,
+               1e6 * np.percentile(latencies, 50),
+               1e6 * np.percentile(latencies, 99),
+               resource.getrusage(resource.RUSAGE_SELF).ru_maxrss / 1024.0,
+               sum(transport.published.values())))
+
+
+def measure(name, msgs, params, realtime, rate):
+    """Run L{replay} in a child process and return its stats."""
+    queue = Queue()
+    proc = Process(target=replay,
+                   args=(queue, name, msgs, params, realtime, rate))
+    proc.start()
+    stats = queue.get()
+    proc.join()
+    return stats
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.split('\n')[1])
+    parser.add_argument('--nodes', nargs='+', default=sorted(NODES),
+                        choices=sorted(NODES))
+    parser.add_argument('--users', type=int, default=1)
+    parser.add_argument('--rate', type=float, default=30.0,
+                        help="Rate (Hz) of the synthetic streams")
+    parser.add_argument('--duration', type=float, default=60.0,
+                        help="Seconds of stream replayed through each node")
+    parser.add_argument('--realtime', action='store_true',
+                        help="Replay at --rate instead of as fast as possible")
+    parser.add_argument('--batch-size', type=int, default=1,
+                        help="batch_size param of the pose_estimator")
+    args = parser.parse_args()
+
+    nmsgs = int(args.rate * args.duration)
+    params = {}
+    tmpdir = tempfile.mkdtemp(prefix='bench_replay')
+    if set(['pose_estimator', 'pose_pipeline']) & set(args.nodes):
+        import yaml
+        import rospkg
+        path = rospkg.RosPack().get_path('pose_tracker')
+        with open(os.path.join(path, 'params',
+                               'dataset_default_columns.yaml')) as f:
+            columns = yaml.safe_load(f)['dataset_columns']
+        with open(os.path.join(path, 'params',
+                               'pose_learner_params.yaml')) as f:
+            drop_columns = yaml.safe_load(f)['drop_columns']
+        params.update({'estimator_file': os.path.join(tmpdir, 'clf.pkl'),
+                       'dataset_columns': columns,
+                       'drop_columns': drop_columns,
+                       'batch_size': args.batch_size,
+                       'multi_user': args.users > 1})
+        fit_estimator(params['estimator_file'], columns, drop_columns)
+
+    print("{} msgs per node ({} Hz, {} s, {} users)"
+          .format(nmsgs, args.rate, args.duration, args.users))
+    print("{:<18} {:>10} {:>9} {:>9} {:>9} {:>9}"
+          .format('node', 'msgs/s', 'p50 (us)', 'p99 (us)', 'RSS (MB)',
+                  'published'))
+    for name in args.nodes:
+        msgs = NODES[name][3](nmsgs, args.users, args.rate)
+        print("{:<18} {:>10.1f} {:>9.1f} {:>9.1f} {:>9.1f} {:>9d}"
+              .format(name, *measure(name, msgs, params, args.realtime,
+                                     args.rate)))
+
+    for f in os.listdir(tmpdir):
+        os.remove(os.path.join(tmpdir, f))
+    os.rmdir(tmpdir)
+
+
+if __name__ == '__main__':
+    main()
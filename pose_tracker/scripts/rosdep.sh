@@ -7,6 +7,7 @@ PACKAGES="python-pip
 PIP_PACKAGES="numpy
 	      pandas
               scikit-learn
+              futures
               toolz
               mock"
 
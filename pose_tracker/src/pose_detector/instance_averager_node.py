@@ -1,17 +1,18 @@
 #!/usr/bin/env python
 import roslib; roslib.load_manifest('pose_tracker')
 import rospy
-from rospy import (loginfo, logerr, logfatal)
+from rospy import (loginfo, logwarn, logerr, logfatal)
 
-import pandas as pd
-from scipy.stats import gmean as geometric_mean
+import numpy as np
 
 from func_utils import error_handler as eh
 # from func_utils import load_class
 from param_utils import get_parameters, ParamNotFoundError
-import circular_dataframe as cdf
+from running_aggregates import (RunningMean, RunningMedian,
+                                RunningGeometricMean, SlidingAggregate)
+from column_schema import (SchemaPublisher, SchemaCache)
 
-from pose_instance_builder.msg import PoseInstance
+from pose_msgs.msg import PoseInstance
 # from std_msgs.msg import String
 
 
@@ -19,14 +20,9 @@ _DEFAULT_NAME = 'instance_averager_node'
 _NODE_PARAMS = ['builder_type', 'skeleton_topic']
 
 
-def __gmean(df):
-    """Return geometric mean of a dataframe in form of a pandas.Series."""
-    return pd.Series(geometric_mean(df), index=df.columns)
-
-
-METHODS = {'mean': pd.DataFrame.mean,
-           'median': pd.DataFrame.median,
-           'gmean': __gmean}
+METHODS = {'mean': RunningMean,
+           'median': RunningMedian,
+           'gmean': RunningGeometricMean}
 
 
 def load_params(params):
@@ -67,21 +63,29 @@ class InstanceAveragerNode(object):
                 action=self.shutdown, reraise=True):
             self.method, self.dflen = load_params(['averager_method',
                                                   'dataframe_length'])
-            self.averager = METHODS.get(self.method, METHODS['mean'])
+            self.averager = SlidingAggregate(
+                METHODS.get(self.method, METHODS['mean'])(self.dflen))
+
+        self.averaged = np.empty(0)
 
         # Publishers and Subscribers
         rospy.Subscriber('pose_instance', PoseInstance, self.instance_cb)
         self.publisher = rospy.Publisher('averaged_pose', PoseInstance)
-        self.df = pd.DataFrame()
-        self.df_averaged = pd.Series()
+        self.instance_schemas = SchemaCache('pose_instance')
+        self.schema = SchemaPublisher('averaged_pose')
 
     def instance_cb(self, msg):
         """Callback. Publish a PoseInstance with averaged values."""
-        instance = pd.Series(msg.instance, index=msg.columns)
-        self.df = cdf.append_instance(self.df, instance, self.dflen)
-        self.df_averaged = self.averager(self.df)
-        pinstance = PoseInstance(instance=list(self.df_averaged.values),
-                                 columns=list(self.df_averaged.index))
+        try:
+            columns = self.instance_schemas.columns(msg)
+            instance = np.asarray(msg.instance, dtype=np.float64)
+            self.averager.update(instance, columns=columns)
+        except (KeyError, ValueError) as e:
+            logwarn("Instance discarded. Reason: {}".format(e))
+            return
+        self.averaged = self.averager.value()
+        pinstance = PoseInstance(instance=self.averaged.tolist())
+        self.schema.stamp(pinstance, self.averager.columns)
         self.publisher.publish(pinstance)
 
     def run(self):
@@ -1,18 +1,31 @@
 #!/usr/bin/env python
 import roslib; roslib.load_manifest('pose_tracker')
 import rospy
-from rospy import (loginfo, logerr, logfatal)
+from rospy import (loginfo, logwarn, logerr, logfatal)
 
-import pandas as pd
+import numpy as np
 
 from func_utils import error_handler as eh
 from param_utils import get_parameters, ParamNotFoundError
-import circular_dataframe as cdf
+from velocity_estimators import VelocityWindow
+from latency_monitor import (LatencyMonitor, timed_callback)
+from column_schema import (SchemaPublisher, SchemaCache)
 
 from pose_msgs.msg import (PoseInstance, JointVelocities)
 
 _DEFAULT_NAME = 'joint_velocities_publisher'
 
+# Optional params (and their default values) of the node
+# velocity_estimator: one of velocity_estimators.ESTIMATORS
+# time_source: times of the instances used to calculate velocities:
+#   'stamp': the 'stamp' column of the instances (arrival time if they
+#            do not have it), 'arrival': their arrival time,
+#   'frames': the number of received instances
+# savgol_order: order of the polynomial of the 'savgol' estimator
+OPTIONAL_PARAMS = {'velocity_estimator': 'difference',
+                   'time_source': 'stamp',
+                   'savgol_order': 2}
+
 
 def load_params(params):
     """Load parameters that will be used by the node."""
@@ -25,22 +38,28 @@ def load_params(params):
 
 
 def calc_velocities(df):
-    """Calculate velocities of an input Dataframe with PoseInstances."""
-    if not all(df.shape):
+    """Calculate velocities of an input Dataframe (or 2D array) of instances.
+
+    Raises ValueError if df is empty.
+    """
+    values = np.asarray(df)
+    if not all(values.shape):
         raise ValueError("DataFrame is empty")
-    return (df.iloc[-1].values - df.iloc[0].values) / len(df)
+    return (values[-1] - values[0]) / len(values)
 
 
 class JointVelocitiesPublisher(object):
 
     """Node that calculates joint velocities from L{PoseInstance} messages.
 
-        Note velocity is calculated not by time, but considering the number
-        of received pose num_instances
+        Velocities are the derivatives of the instances of the window with
+        respect to their times (See the time_source param), so they are
+        in units per second (or per instance if time_source is 'frames').
 
         Loaded Parameters:
         ------------------
         'num_instances': num of pose_instances to calculate the velocity
+        See also L{OPTIONAL_PARAMS}
     """
 
     def __init__(self, **kwargs):
@@ -50,26 +69,54 @@ class JointVelocitiesPublisher(object):
         self.node_name = rospy.get_name()
         rospy.on_shutdown(self.shutdown)
         loginfo("Initializing " + self.node_name + " node...")
+        self.latency_monitor = LatencyMonitor.from_params()
 
         with eh(logger=logfatal, log_msg="Couldn't load parameters",
                 action=self.shutdown, reraise=True):
                 self.df_length = load_params(['num_instances']).next()
+        for pname, default in OPTIONAL_PARAMS.iteritems():
+            setattr(self, pname, rospy.get_param('~' + pname, default))
+        with eh(logger=logfatal, log_msg="Invalid velocity estimator",
+                errors=(KeyError, ValueError), action=self.shutdown,
+                reraise=True):
+            self.window = VelocityWindow(self.df_length,
+                                         self.velocity_estimator,
+                                         self.time_source, self.savgol_order,
+                                         clock=rospy.get_time)
 
         # Publishers and Subscribers
-        rospy.Subscriber('/pose_instance', PoseInstance, self.instance_cb)
         self.publisher = rospy.Publisher('/joint_velocities', JointVelocities)
-        self.df = pd.DataFrame()
+        self.instance_schemas = SchemaCache('/pose_instance')
+        self.schema = SchemaPublisher('/joint_velocities')
+        rospy.Subscriber('/pose_instance', PoseInstance, self.instance_cb)
 
+    @timed_callback()
     def instance_cb(self, msg):
         """Callback."""
-        instance = pd.Series(msg.instance, index=msg.columns)
-        self.df = cdf.append_instance(self.df, instance, self.df_length)
+        try:
+            columns = self.instance_schemas.columns(msg)
+        except KeyError as e:
+            logwarn("Instance discarded. Reason: {}".format(e))
+            return
+        instance = np.asarray(msg.instance, dtype=np.float64)
+        if self.window.columns is None:
+            self.window.allocate(columns)
+            if self.time_source == 'stamp' and \
+                    self.window.stamp_column is None:
+                logwarn("Instances without 'stamp' column. "
+                        "Using arrival time")
+        try:
+            if self.window.add(instance):
+                logwarn("Instance older than the last one. Window restarted")
+        except ValueError as e:
+            logwarn("Instance discarded. Reason: {}".format(e))
+            return
 
         with eh(logger=loginfo, errors=ValueError,
                 log_msg='Empty DataFrame. Velocities not published'):
-            vels = calc_velocities(self.df)
-            velocities = JointVelocities(velocities=vels.tolist(),
-                                         columns=self.df.columns.tolist())
+            vels = self.window.velocities()
+            velocities = JointVelocities(velocities=vels.tolist())
+            self.schema.stamp(velocities, self.window.columns)
             self.publisher.publish(velocities)
 
     def run(self):
@@ -2,17 +2,20 @@
 import roslib
 roslib.load_manifest('pose_tracker')
 import rospy
-from rospy import (logdebug, loginfo, logfatal)
+from rospy import (logdebug, loginfo, logwarn, logfatal)
 from rospy import (Publisher, Subscriber, Service)
 
 # from operator import (gt, lt)
 from collections import namedtuple
+from fnmatch import fnmatchcase
 from itertools import cycle
-import pandas as pd
+import numpy as np
 
 from func_utils import error_handler as eh
 from param_utils import load_params
-import circular_dataframe as cdf
+from ring_buffer import RingBuffer
+from latency_monitor import (LatencyMonitor, timed_callback)
+from column_schema import (SchemaPublisher, SchemaCache)
 
 # from pose_tracker.srv import Detector as DetectorSrv
 # from pose_tracker.srv import DetectorResponse
@@ -57,7 +60,7 @@ def is_still(threshold, df):
 
     Return True if all joints in df are below threshold. Otherwise, False.
     """
-    return df.lt(threshold).values.all()
+    return (np.asarray(df) < threshold).all()
 
 
 def is_moving(threshold, df):
@@ -66,17 +69,142 @@ def is_moving(threshold, df):
 
     Return True if all joints in df >= threshold. Otherwise, returns False.
     """
-    return df.gt(threshold).values.all()
+    return (np.asarray(df) > threshold).all()
+
+
+def below_threshold(threshold, velocities, out=None):
+    """Return which columns of a velocities row are below threshold.
+
+    threshold can be a scalar or an array with a threshold per column.
+    If out is set, the result is stored in it.
+    """
+    return np.less(velocities, threshold, out=out)
+
+
+def above_threshold(threshold, velocities, out=None):
+    """Return which columns of a velocities row are above threshold.
+
+    threshold can be a scalar or an array with a threshold per column.
+    If out is set, the result is stored in it.
+    """
+    return np.greater(velocities, threshold, out=out)
+
+
+def threshold_bands(columns, threshold, joint_thresholds=None,
+                    ignored_columns=(), hysteresis=0.0):
+    """
+    Return the threshold bands of each column of the velocities.
+
+    Args:
+
+    :columns (list of str): the columns of the velocities
+    :threshold (float): the threshold of the columns without a joint one
+    :joint_thresholds (dict): {column pattern: threshold}. Patterns are
+        fnmatch patterns. If a column matches several, the lowest is used.
+    :ignored_columns (list of str): patterns of the columns that do not
+        participate in the detection
+    :hysteresis (float): half width of the band around each threshold,
+        as a fraction of it
+
+    Returns a tuple (lower, upper, ignored) of arrays aligned to columns:
+    the still (lower) and moving (upper) thresholds of each column and
+    a mask of the columns that do not participate.
+    """
+    thresholds = np.empty(len(columns))
+    ignored = np.zeros(len(columns), dtype=bool)
+    joint_thresholds = joint_thresholds or {}
+    for i, col in enumerate(columns):
+        matches = [t for pattern, t in joint_thresholds.iteritems()
+                   if fnmatchcase(col, pattern)]
+        thresholds[i] = min(matches) if matches else threshold
+        ignored[i] = any(fnmatchcase(col, p) for p in ignored_columns)
+    return (thresholds * (1 - hysteresis), thresholds * (1 + hysteresis),
+            ignored)
+
+
+class ConsecutiveCounter(object):
+
+    """
+    Per column counters of consecutive velocities that hold a condition.
+
+    The speed (absolute velocity) of each participating column is compared
+    with its own threshold band (See L{threshold_bands}): the lower
+    threshold for L{below_threshold} and the upper one for
+    L{above_threshold}. Ignored columns always hold the condition.
+    """
+
+    def __init__(self, threshold, joint_thresholds=None, ignored_columns=(),
+                 hysteresis=0.0):
+        """Constructor. See L{threshold_bands} for the args."""
+        self.threshold = threshold
+        self.joint_thresholds = joint_thresholds
+        self.ignored_columns = ignored_columns
+        self.hysteresis = hysteresis
+        self.counts = None      # Allocated with the first counted velocities
+        self.columns = None     # Columns of the bands
+        self._bands = {}        # Threshold band of each condition
+        self._ignored = None    # Columns that do not participate
+        self._speeds = None     # Buffers of L{count}
+        self._holds = None
+
+    def compile(self, columns):
+        """Precompute the threshold bands and buffers of the columns."""
+        lower, upper, self._ignored = threshold_bands(
+            columns, self.threshold, self.joint_thresholds,
+            self.ignored_columns, self.hysteresis)
+        self._bands = {below_threshold: lower, above_threshold: upper}
+        self._speeds = np.empty(len(columns))
+        self._holds = np.empty(len(columns), dtype=bool)
+        self.counts = np.zeros(len(columns), dtype=np.int64)
+        self.columns = columns
+        if self._ignored.all():
+            logwarn("All the velocity columns are ignored")
+        return self
+
+    def count(self, velocities, columns, condition):
+        """
+        Update the counters with the newest velocities.
+
+        The counter of each column is incremented if condition holds for
+        the column. Otherwise, it is reset to 0.
+
+        Args:
+
+        :velocities (numpy.ndarray): the newest row of velocities
+        :columns (list of str): the columns of the velocities. Bands are
+            recompiled if they are not the columns of the last call.
+        :condition: L{below_threshold} or L{above_threshold}
+
+        Returns the counters.
+        """
+        if columns is not self.columns:
+            self.compile(columns)
+        speeds = np.absolute(velocities, out=self._speeds)
+        holds = condition(self._bands[condition], speeds, out=self._holds)
+        np.logical_or(holds, self._ignored, out=holds)
+        self.counts += 1
+        np.multiply(self.counts, holds, out=self.counts)
+        return self.counts
+
+    def reset(self):
+        """Set all the counters to 0."""
+        if self.counts is not None:
+            self.counts.fill(0)
+        return self
 
 
 def make_joint_velocities_msg(velocities):
-    """Return a L{JointVelocities} msg from the passed velocities dataframe."""
-    velos = []
+    """Return a L{JointVelocities} msg from the passed velocities buffer.
+
+    @param velocities: buffer with the last received velocities
+    @type velocities: L{RingBuffer}
+    """
+    columns = velocities.columns or []
     try:
-        velos = velocities.iloc[-1].values
-    except Exception:
-        velos = [0] * len(velocities.columns)
-    return JointVelocities(columns=velocities.columns, velocities=velos)
+        velos = velocities.last().tolist()
+    except IndexError:
+        velos = [0] * len(columns)
+    return JointVelocities(columns=columns, velocities=velos)
 
 
 # def next_caller(iterator):
@@ -84,7 +212,19 @@ def make_joint_velocities_msg(velocities):
 _DEFAULT_NAME = 'pose_detector_node'
 _NODE_PARAMS = ['dataframe_length', 'movement_threshold']
 
-Detector = namedtuple('Detector', ['name', 'detector', 'publisher', 'data'])
+# Optional params (and their default values) of the node
+# joint_thresholds: {column pattern: threshold} (See L{threshold_bands})
+#   Columns not matched by any pattern use movement_threshold
+# ignored_columns: patterns of the columns not used to detect movement
+# hysteresis: the user is still when all the speeds are below
+#   threshold * (1 - hysteresis) and moving when all are above
+#   threshold * (1 + hysteresis)
+OPTIONAL_PARAMS = {'joint_thresholds': {},
+                   'ignored_columns': ['user_id', 'stamp', '*confidence'],
+                   'hysteresis': 0.0}
+
+# condition: per column check of a row of velocities (See L{below_threshold})
+Detector = namedtuple('Detector', ['name', 'condition', 'publisher', 'data'])
 
 
 class PoseDetectorNode(object):
@@ -99,6 +239,9 @@ class PoseDetectorNode(object):
     Publishes a L{JointVelocities} to /user_moving if the user L{is_moving}
     Note that it only publishes if there has been a change
 
+    The speed (absolute velocity) of each participating column is compared
+    with its own threshold band (See L{ConsecutiveCounter}).
+
     Example:
     --------
         1. User is moving
@@ -115,11 +258,21 @@ class PoseDetectorNode(object):
         self.node_name = rospy.get_name()
         rospy.on_shutdown(self.shutdown)
         loginfo("Initializing " + self.node_name + " node...")
+        self.latency_monitor = LatencyMonitor.from_params()
 
         with eh(logger=logfatal, log_msg="Couldn't load parameters",
                 reraise=True):
             self.dflen, self.threshold = load_params(_NODE_PARAMS)
-
+        for pname, default in OPTIONAL_PARAMS.iteritems():
+            setattr(self, pname, rospy.get_param('~' + pname, default))
+
+        self.velocities = RingBuffer(self.dflen)
+        self._velocity_columns = None   # Columns of the last velocities msg
+        # Consecutive received velocities that hold the detector condition
+        # in each column.
+        self.consecutive = ConsecutiveCounter(
+            self.threshold, self.joint_thresholds, self.ignored_columns,
+            self.hysteresis)
         self.__build_detectors()
 
         ### Publishers and Subscribers
@@ -133,9 +286,13 @@ class PoseDetectorNode(object):
                                          self._curr_detector_cb)
         self.set_detector_srv = Service('set_detector', SetDetector,
                                         self._set_detector_cb)
+        self.instance_schemas = SchemaCache('pose_instance')
+        self.velocity_schemas = SchemaCache('joint_velocities')
+        self.__pose_schema = SchemaPublisher('user_pose')
+        self.__moving_schema = SchemaPublisher('user_moving')
 
-        self.velocities = pd.DataFrame()
         self.pose_instance = PoseInstance()
+        self.pose_columns = []
 
     def __build_detectors(self):
         """
@@ -143,10 +300,12 @@ class PoseDetectorNode(object):
 
         It is used to known wheter the user is still or moving.
         """
-        self._still_detector = Detector('is_still_detector', is_still,
+        self._still_detector = Detector('is_still_detector',
+                                        below_threshold,
                                         self.__pose_publisher,
                                         self.get_pose_instance)
-        self._moving_detector = Detector('is_moving_detector', is_moving,
+        self._moving_detector = Detector('is_moving_detector',
+                                         above_threshold,
                                          self.__velo_publisher,
                                          self.get_velocities)
 
@@ -158,12 +317,22 @@ class PoseDetectorNode(object):
     def instance_cb(self, msg):
         """Store the latest received L{PoseInstance} message."""
         logdebug("Instance Received:\n{}".format(msg))
+        try:
+            self.pose_columns = self.instance_schemas.columns(msg)
+        except KeyError as e:
+            logwarn("Instance discarded. Reason: {}".format(e))
+            return
         self.pose_instance = msg
 
+    @timed_callback()
     def velo_cb(self, msg):
         """Callback called when L{JointVelocities} msg is received."""
         logdebug("User is moving at velocity:\n{}".format(msg))
-        self._add_msg_to_dataset(msg)
+        try:
+            self._add_msg_to_dataset(msg)
+        except (KeyError, ValueError) as e:
+            logwarn("Velocities discarded. Reason: {}".format(e))
+            return
         self.check_dataset()
 
     def _set_detector_cb(self, srv):
@@ -191,8 +360,9 @@ class PoseDetectorNode(object):
         Helper method that publishes the user pose
         and a predicate indicating that the user is not moving.
         """
-        self.__pose_pub.publish(pose_instance())
-        logdebug('Published user pose:\n{}'.format(pose_instance()))
+        msg = self.__pose_schema.stamp(pose_instance(), self.pose_columns)
+        self.__pose_pub.publish(msg)
+        logdebug('Published user pose:\n{}'.format(msg))
         self.__publish_is_moving_predicate(False)
 
     def __velo_publisher(self, velocities):
@@ -200,32 +370,52 @@ class PoseDetectorNode(object):
         Publish the last velocities instance and whether the user is moving.
 
         Helper method that publishes the last velocities instance from
-        the L{PoseDetectorNode.velocities} DataFrame
+        the L{PoseDetectorNode.velocities} buffer
         and a predicate indicating the user is moving.
         """
         msg = make_joint_velocities_msg(velocities())
+        self.__moving_schema.stamp(msg, msg.columns)
         self.__moving_pub.publish(msg)
         logdebug('Published user moving:\n{}'.format(msg))
         self.__publish_is_moving_predicate(True)
 
     def _add_msg_to_dataset(self, msg):
-        """Add a message to dataset."""
-        new_instance = pd.Series(msg.velocities, index=msg.columns)
-        self.velocities = cdf.append_instance(self.velocities, new_instance)
+        """Add a message to dataset.
+
+        If the msg columns differ from the ones of the dataset, the dataset
+        is reallocated with them and the detection restarts.
+
+        Raises KeyError if the schema of the msg columns is unknown
+        and ValueError if the msg does not have a velocity per column.
+        """
+        columns = self.velocity_schemas.columns(msg)
+        if columns is not self._velocity_columns:
+            if self.velocities.columns not in (None, columns):
+                logwarn("Velocity columns changed. Restarting detection")
+                self.velocities = RingBuffer(self.dflen)
+                self.consecutive.reset()
+            self._velocity_columns = columns
+        self.velocities.append(msg.velocities, columns=columns)
         return self
 
     def check_dataset(self):
         """
         Check if detector condition holds.
 
-        Uses current detector to check if detector condition holds.
-        If so, then publishes a message and changes the detector
+        Uses current detector to check if detector condition holds
+        in all the columns of the last dataframe_length velocities.
+        If so, then publishes a message and changes the detector.
+
+        Only the newest velocities are checked: the per column counters of
+        consecutive velocities that hold the condition keep the rest.
         """
         try:
-            is_dataset_full(self.dflen, self.velocities)
-        except DatasetNotFullError:
+            consecutive = self.consecutive.count(
+                self.velocities.last(), self.velocities.columns,
+                self.current_detector.condition)
+        except IndexError:
             return
-        if self.current_detector.detector(self.threshold, self.velocities):
+        if consecutive.min() >= self.dflen:
             self.current_detector.publisher(self.current_detector.data)
             self.change_detector(self.detectors)
         return self
@@ -233,7 +423,8 @@ class PoseDetectorNode(object):
     def change_detector(self, detectors):
         """Update current detector and flushes the velocities dataset."""
         self.current_detector = detectors.next()
-        self.velocities = pd.DataFrame()
+        self.velocities.clear()
+        self.consecutive.reset()
         loginfo("Changing detector to: {}".format(self.current_detector.name))
         return self
 
@@ -253,7 +444,7 @@ class PoseDetectorNode(object):
         return self.pose_instance
 
     def get_velocities(self):
-        """Return the velocities DataFrame."""
+        """Return the velocities buffer."""
         return self.velocities
 
     def run(self):
@@ -0,0 +1,157 @@
+#!/usr/bin/env python
+"""
+Fixed capacity ring buffer of instances backed by a preallocated array.
+
+A L{RingBuffer} stores the last ``capacity`` rows appended to it in a
+preallocated 2-D ``numpy.ndarray``. Appending a row is O(1) (no matter the
+length of the window) and the stored rows can be retrieved, oldest first,
+as a view without copying the buffer.
+
+Internally every row is written twice, at ``i`` and ``i + capacity``,
+so the window of stored rows is always a contiguous slice of the array.
+"""
+import numpy as np
+import pandas as pd
+
+
+class RingBuffer(object):
+
+    """Fixed capacity buffer that drops the oldest row when it is full.
+
+    Example
+    -------
+    >>> rb = RingBuffer(2, columns=['A', 'B'])
+    >>> for row in ([1, 2], [3, 4], [5, 6]):
+    ...     rb.append(row)
+    >>> rb.values
+    array([[ 3.,  4.],
+           [ 5.,  6.]])
+    """
+
+    def __init__(self, capacity, columns=None, dtype=np.float64):
+        """
+        Constructor.
+
+        Parameters
+        ----------
+        capacity : int
+            Max number of rows stored by the buffer.
+        columns : list of str (Optional)
+            Names of the columns of the buffer. If not set, they are taken
+            from the first appended row. (See L{append})
+        dtype : numpy.dtype (Default numpy.float64)
+            Data type of the stored values.
+
+        Raises
+        ------
+        ValueError
+            If capacity is lower than 1
+        """
+        if capacity < 1:
+            raise ValueError("capacity must be >= 1. Got: {}".format(capacity))
+        self.capacity = int(capacity)
+        self.dtype = dtype
+        self._data = None
+        self._columns = None
+        self._next = 0      # Row where next append writes
+        self._len = 0
+        if columns is not None:
+            self._allocate(columns)
+
+    def _allocate(self, columns):
+        """Allocate the buffer to store rows with ``columns``."""
+        self._columns = list(columns)
+        self._data = np.zeros((2 * self.capacity, len(self._columns)),
+                              dtype=self.dtype)
+        self.clear()
+
+    def __len__(self):
+        return self._len
+
+    @property
+    def columns(self):
+        """Names of the columns of the buffer (None if not allocated)."""
+        return self._columns
+
+    @property
+    def width(self):
+        """Number of columns of the buffer."""
+        return 0 if self._columns is None else len(self._columns)
+
+    def is_full(self):
+        """Return True if the buffer has ``capacity`` rows."""
+        return self._len == self.capacity
+
+    def clear(self):
+        """Remove all the rows of the buffer. It does not free memory."""
+        self._next = 0
+        self._len = 0
+        return self
+
+    def append(self, row, columns=None):
+        """
+        Append a row to the buffer, dropping the oldest one if it is full.
+
+        Parameters
+        ----------
+        row : array_like (1D)
+            The row to append.
+            If ``row`` is a ``pandas.Series`` its index is used as columns.
+        columns : list of str (Optional)
+            The column names of ``row``. Only used to allocate the buffer
+            the first time a row is appended.
+
+        Raises
+        ------
+        ValueError
+            If row is not 1D or its length differs from the buffer width.
+        """
+        if self._data is None:
+            if columns is None:
+                columns = getattr(row, 'index', None)
+            if columns is None:
+                columns = range(len(row))
+            self._allocate(columns)
+        row = np.asarray(row, dtype=self.dtype)
+        if row.ndim != 1:
+            raise ValueError("'row' is not 1D. Shape: {}".format(row.shape))
+        if len(row) != self.width:
+            raise ValueError("'row' has {} elements. Expected {}"
+                             .format(len(row), self.width))
+        i = self._next
+        self._data[i] = row
+        self._data[i + self.capacity] = row
+        self._next = (i + 1) % self.capacity
+        self._len = min(self._len + 1, self.capacity)
+        return self
+
+    @property
+    def values(self):
+        """
+        Return a view of the stored rows ordered from oldest to newest.
+
+        Note that the view is overwritten by subsequent appends.
+        Copy it if it has to outlive the next call to L{append}.
+        """
+        if self._data is None:
+            return np.empty((0, 0), dtype=self.dtype)
+        start = (self._next - self._len) % self.capacity
+        return self._data[start:start + self._len]
+
+    def first(self):
+        """Return a view of the oldest row of the buffer."""
+        if not self._len:
+            raise IndexError("RingBuffer is empty")
+        return self._data[(self._next - self._len) % self.capacity]
+
+    def last(self):
+        """Return a view of the newest row of the buffer."""
+        if not self._len:
+            raise IndexError("RingBuffer is empty")
+        return self._data[(self._next - 1) % self.capacity]
+
+    def to_dataframe(self):
+        """Return a copy of the buffer contents as a ``pandas.DataFrame``."""
+        if self._data is None:
+            return pd.DataFrame()
+        return pd.DataFrame(self.values.copy(), columns=self._columns)
@@ -0,0 +1,310 @@
+#!/usr/bin/env python
+"""
+Streaming aggregates over a sliding window of instances.
+
+Each aggregate is updated with the newest instance of the window and
+(once the window is full) the instance that leaves it, so its value
+is available without recomputing it over the whole window.
+
+    - L{RunningMean}: running sum. O(columns) per update.
+    - L{RunningGeometricMean}: running sum of logs. O(columns) per update.
+    - L{RunningMedian}: window kept sorted per column. One vectorized
+      insertion (and removal) per update, without sorting the window.
+
+L{SlidingAggregate} keeps the window along with its running aggregate.
+
+Example
+-------
+>>> window = RingBuffer(30)
+>>> avg = RunningMean(30)
+>>> for row in rows:
+...     avg.update(row, window.first() if window.is_full() else None)
+...     window.append(row)
+>>> avg.value()
+"""
+from abc import (ABCMeta, abstractmethod)
+import numpy as np
+
+from ring_buffer import RingBuffer
+
+
+class RunningAggregate(object):
+
+    """Base class of the streaming aggregates."""
+
+    __metaclass__ = ABCMeta
+
+    def __init__(self, capacity):
+        """
+        Constructor.
+
+        Parameters
+        ----------
+        capacity : int
+            Max length of the window of instances that is aggregated.
+        """
+        self.capacity = int(capacity)
+        self.reset()
+
+    def __len__(self):
+        return self._n
+
+    def reset(self):
+        """Forget all the aggregated instances."""
+        self._n = 0
+        return self
+
+    @abstractmethod
+    def update(self, new, old=None):
+        """
+        Update the aggregate with a new instance.
+
+        Parameters
+        ----------
+        new : numpy.ndarray (1D)
+            Instance entering the window.
+        old : numpy.ndarray (1D) (Optional)
+            Instance leaving the window. None if the window was not full.
+        """
+
+    @abstractmethod
+    def resync(self, window):
+        """
+        Recompute the aggregate from the instances of the window.
+
+        Used to get rid of the numerical drift of the running values.
+
+        Parameters
+        ----------
+        window : numpy.ndarray (2D)
+            The instances currently in the window.
+        """
+
+    @abstractmethod
+    def value(self):
+        """Return the current value of the aggregate as a 1D array."""
+
+
+class RunningMean(RunningAggregate):
+
+    """Arithmetic mean of the window computed from a running sum."""
+
+    def reset(self):
+        self._sum = None
+        return super(RunningMean, self).reset()
+
+    def update(self, new, old=None):
+        if self._sum is None:
+            self._sum = np.zeros(len(new))
+        self._sum += new
+        if old is None:
+            self._n += 1
+        else:
+            self._sum -= old
+        return self
+
+    def resync(self, window):
+        self._sum = np.asarray(window, dtype=np.float64).sum(axis=0)
+        self._n = len(window)
+        return self
+
+    def value(self):
+        return self._sum / self._n
+
+
+class RunningGeometricMean(RunningAggregate):
+
+    """
+    Geometric mean of the window computed from a running sum of logs.
+
+    As L{scipy.stats.gmean}, it is 0 for columns with zeros
+    and NaN for columns with negative (or NaN) values.
+    """
+
+    def reset(self):
+        self._logsum = None
+        self._zeros = None
+        self._negatives = None
+        return super(RunningGeometricMean, self).reset()
+
+    @staticmethod
+    def _split(values):
+        """Return logs of positive values, zeros and non-positive values."""
+        positive = values > 0
+        zeros = values == 0
+        logs = np.log(np.where(positive, values, 1.0))
+        return logs, zeros, ~(positive | zeros)
+
+    def update(self, new, old=None):
+        if self._logsum is None:
+            self._logsum = np.zeros(len(new))
+            self._zeros = np.zeros(len(new), dtype=np.int64)
+            self._negatives = np.zeros(len(new), dtype=np.int64)
+        logs, zeros, negatives = self._split(new)
+        self._logsum += logs
+        self._zeros += zeros
+        self._negatives += negatives
+        if old is None:
+            self._n += 1
+        else:
+            logs, zeros, negatives = self._split(old)
+            self._logsum -= logs
+            self._zeros -= zeros
+            self._negatives -= negatives
+        return self
+
+    def resync(self, window):
+        logs, zeros, negatives = self._split(np.asarray(window))
+        self._logsum = logs.sum(axis=0)
+        self._zeros = zeros.sum(axis=0)
+        self._negatives = negatives.sum(axis=0)
+        self._n = len(window)
+        return self
+
+    def value(self):
+        gmean = np.exp(self._logsum / self._n)
+        gmean[self._zeros > 0] = 0.0
+        gmean[self._negatives > 0] = np.nan
+        return gmean
+
+
+class RunningMedian(RunningAggregate):
+
+    """
+    Median of the window.
+
+    Keeps each column of the window sorted in a preallocated array.
+    Removing or inserting a value shifts the rows around its position
+    with a single fancy-indexing operation for all the columns.
+
+    As L{pandas.DataFrame.median}, NaN values are skipped: they are kept
+    at the end of each column and the median is computed over the other
+    values. It is NaN for columns with only NaN values.
+    """
+
+    def reset(self):
+        self._sorted = None
+        self._cols = None
+        self._valid = None
+        return super(RunningMedian, self).reset()
+
+    def _allocate(self, width):
+        self._sorted = np.empty((self.capacity, width))
+        self._cols = np.arange(width)
+        self._valid = np.zeros(width, dtype=np.int64)
+
+    def _remove(self, values):
+        """Remove ``values`` (one per column) from the sorted window."""
+        n = self._n - 1
+        window = self._sorted[:self._n]
+        nans = np.isnan(values)
+        with np.errstate(invalid='ignore'):     # NaN comparisons are False
+            pos = np.where(nans, n, (window < values).sum(axis=0))
+        rows = np.arange(n)[:, np.newaxis]
+        self._sorted[:n] = window[rows + (rows >= pos), self._cols]
+        self._valid -= ~nans
+        self._n = n
+
+    def _insert(self, values):
+        """Insert ``values`` (one per column) into the sorted window."""
+        n = self._n
+        nans = np.isnan(values)
+        with np.errstate(invalid='ignore'):
+            pos = np.where(nans, n, (self._sorted[:n] < values).sum(axis=0))
+        rows = np.arange(n + 1)[:, np.newaxis]
+        self._sorted[:n + 1] = self._sorted[rows - (rows > pos), self._cols]
+        self._sorted[pos, self._cols] = values
+        self._valid += ~nans
+        self._n = n + 1
+
+    def update(self, new, old=None):
+        if self._sorted is None:
+            self._allocate(len(new))
+        if old is not None:
+            self._remove(old)
+        self._insert(new)
+        return self
+
+    def resync(self, window):
+        window = np.asarray(window)
+        if self._sorted is None:
+            self._allocate(window.shape[1])
+        self._n = len(window)
+        self._sorted[:self._n] = np.sort(window, axis=0)   # NaN last
+        self._valid = (~np.isnan(window)).sum(axis=0)
+        return self
+
+    def value(self):
+        low = np.maximum(self._valid - 1, 0) // 2
+        high = self._valid // 2
+        median = (self._sorted[low, self._cols] +
+                  self._sorted[high, self._cols]) / 2.0
+        median[self._valid == 0] = np.nan
+        return median
+
+
+class SlidingAggregate(object):
+
+    """
+    Window of the last instances and its running aggregate.
+
+    Example
+    -------
+    >>> avg = SlidingAggregate(RunningMean(30))
+    >>> for row in rows:
+    ...     avg.update(row)
+    >>> avg.value()
+    """
+
+    def __init__(self, aggregate):
+        """
+        Constructor.
+
+        Parameters
+        ----------
+        aggregate : L{RunningAggregate}
+            The aggregate. Its capacity is the length of the window.
+        """
+        self.aggregate = aggregate
+        self.window = RingBuffer(aggregate.capacity)
+        self._updates = 0
+
+    @property
+    def columns(self):
+        """Columns of the window (None if no instance has been added)."""
+        return self.window.columns
+
+    def update(self, instance, columns=None):
+        """
+        Add an instance to the window and update the aggregate.
+
+        The aggregate is recomputed from the window every capacity updates
+        to drop the drift of its running values.
+
+        Parameters
+        ----------
+        instance : numpy.ndarray (1D)
+            Instance entering the window.
+        columns : list of str (Optional)
+            The column names of instance (See L{RingBuffer.append})
+
+        Raises
+        ------
+        ValueError
+            If the length of instance differs from the window width.
+            The window and the aggregate are left unchanged.
+        """
+        if self.window.width and len(instance) != self.window.width:
+            raise ValueError("'instance' has {} elements. Expected {}"
+                             .format(len(instance), self.window.width))
+        oldest = self.window.first() if self.window.is_full() else None
+        self.aggregate.update(instance, oldest)
+        self.window.append(instance, columns=columns)
+        self._updates += 1
+        if self._updates % self.aggregate.capacity == 0:
+            self.aggregate.resync(self.window.values)
+        return self
+
+    def value(self):
+        """Return the current value of the aggregate as a 1D array."""
+        return self.aggregate.value()
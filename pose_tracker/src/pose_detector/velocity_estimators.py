@@ -0,0 +1,377 @@
+#!/usr/bin/env python
+"""
+Streaming velocity estimators over a sliding window of timed instances.
+
+The velocity of each column of the window is its derivative with respect
+to the times of the instances, so it remains correct when frames are
+dropped or arrive at an irregular rate.
+
+    - L{DifferenceVelocity}: (last - first) / elapsed time. O(columns).
+    - L{LstsqVelocity}: slope of the least squares line of the window,
+      computed from running sums. O(columns) per update.
+    - L{SavgolVelocity}: derivative at the newest instance of the least
+      squares polynomial of the window (Savitzky-Golay filter with the
+      actual times). O(window * columns) per update.
+
+A L{VelocityWindow} keeps the window of timed instances and updates its
+estimator. As the running aggregates, estimators are updated with the newest
+instance of the window and (once the window is full) the instance that
+leaves it:
+
+Example
+-------
+>>> times, window = RingBuffer(30, columns=['t']), RingBuffer(30)
+>>> velo = LstsqVelocity(30)
+>>> for t, row in timed_rows:
+...     if window.is_full():
+...         velo.update(t, row, times.first()[0], window.first())
+...     else:
+...         velo.update(t, row)
+...     times.append([t])
+...     window.append(row)
+>>> velo.value(times.values[:, 0], window.values)
+"""
+import time
+from abc import (ABCMeta, abstractmethod)
+import numpy as np
+
+from ring_buffer import RingBuffer
+
+# Times of the instances of a L{VelocityWindow}:
+#   'stamp': their 'stamp' column ('arrival' if they do not have it)
+#   'arrival': the time they are added to the window
+#   'frames': the number of instances added to the window
+TIME_SOURCES = ('stamp', 'arrival', 'frames')
+
+
+class VelocityEstimator(object):
+
+    """Base class of the velocity estimators."""
+
+    __metaclass__ = ABCMeta
+
+    def __init__(self, capacity):
+        """
+        Constructor.
+
+        Parameters
+        ----------
+        capacity : int
+            Max length of the window of instances.
+        """
+        self.capacity = int(capacity)
+        self.reset()
+
+    def reset(self):
+        """Forget all the instances of the window."""
+        return self
+
+    def update(self, t, new, old_t=None, old=None):
+        """
+        Update the estimator with a new instance.
+
+        Parameters
+        ----------
+        t : float
+            Time (in seconds) of the new instance.
+        new : numpy.ndarray (1D)
+            Instance entering the window.
+        old_t : float (Optional)
+            Time of the instance leaving the window.
+        old : numpy.ndarray (1D) (Optional)
+            Instance leaving the window. None if the window was not full.
+        """
+        return self
+
+    def resync(self, times, window):
+        """
+        Recompute the running values from the instances of the window.
+
+        Parameters
+        ----------
+        times : numpy.ndarray (1D)
+            The times of the instances currently in the window.
+        window : numpy.ndarray (2D)
+            The instances currently in the window.
+        """
+        return self
+
+    @abstractmethod
+    def value(self, times, window):
+        """
+        Return the velocity of each column of the window.
+
+        It is 0 if the window does not span any time.
+
+        Parameters
+        ----------
+        times : numpy.ndarray (1D)
+            The times of the instances of the window, oldest first.
+        window : numpy.ndarray (2D)
+            The instances of the window, oldest first.
+
+        Raises
+        ------
+        ValueError
+            If the window is empty
+        """
+
+    @staticmethod
+    def _check_window(window):
+        if not all(np.shape(window)):
+            raise ValueError("Window is empty")
+
+
+class DifferenceVelocity(VelocityEstimator):
+
+    """Difference between the last and the first instance of the window."""
+
+    def value(self, times, window):
+        self._check_window(window)
+        elapsed = times[-1] - times[0]
+        if elapsed <= 0:
+            return np.zeros(window.shape[1])
+        return (window[-1] - window[0]) / elapsed
+
+
+class LstsqVelocity(VelocityEstimator):
+
+    """
+    Slope of the least squares line of each column of the window.
+
+    Keeps the running sums of the times, the squared times, the instances
+    and the instances multiplied by their times. Times are taken relative
+    to a reference time that is moved to the oldest time of the window
+    on each L{resync}, which should be called every few windows.
+    """
+
+    def reset(self):
+        self._n = 0
+        self._t0 = None
+        self._st = self._stt = 0.0
+        self._sx = self._stx = None
+        return self
+
+    def update(self, t, new, old_t=None, old=None):
+        if self._t0 is None:
+            self._t0 = t
+            self._sx = np.zeros(len(new))
+            self._stx = np.zeros(len(new))
+        t = t - self._t0
+        self._st += t
+        self._stt += t * t
+        self._sx += new
+        self._stx += t * new
+        if old is None:
+            self._n += 1
+        else:
+            old_t = old_t - self._t0
+            self._st -= old_t
+            self._stt -= old_t * old_t
+            self._sx -= old
+            self._stx -= old_t * old
+        return self
+
+    def resync(self, times, window):
+        window = np.asarray(window, dtype=np.float64)
+        self._n = len(times)
+        if not self._n:
+            return self.reset()
+        self._t0 = times[0]
+        t = np.asarray(times, dtype=np.float64) - self._t0
+        self._st = t.sum()
+        self._stt = t.dot(t)
+        self._sx = window.sum(axis=0)
+        self._stx = t.dot(window)
+        return self
+
+    def value(self, times, window):
+        self._check_window(window)
+        denom = self._n * self._stt - self._st * self._st
+        if self._n < 2 or denom <= 0:
+            return np.zeros(window.shape[1])
+        return (self._n * self._stx - self._st * self._sx) / denom
+
+
+class SavgolVelocity(VelocityEstimator):
+
+    """
+    Derivative at the newest instance of the least squares polynomial.
+
+    The polynomial is fitted with the actual times of the instances,
+    so, unlike the classical Savitzky-Golay filter, it does not assume
+    that they are evenly spaced.
+    """
+
+    def __init__(self, capacity, order=2):
+        """
+        Constructor.
+
+        Parameters
+        ----------
+        capacity : int
+            Max length of the window of instances.
+        order : int (Default 2)
+            Order of the fitted polynomial.
+            Lowered to len(window) - 1 for shorter windows.
+        """
+        self.order = int(order)
+        super(SavgolVelocity, self).__init__(capacity)
+
+    def value(self, times, window):
+        self._check_window(window)
+        order = min(self.order, len(times) - 1)
+        t = np.asarray(times, dtype=np.float64) - times[-1]
+        if order < 1 or t[0] >= 0:
+            return np.zeros(window.shape[1])
+        vander = t[:, np.newaxis] ** np.arange(order + 1)
+        # Row of the pseudo-inverse that yields the 1st order coefficient
+        weights = np.linalg.pinv(vander)[1]
+        return weights.dot(window)
+
+
+ESTIMATORS = {'difference': DifferenceVelocity,
+              'lstsq': LstsqVelocity,
+              'savgol': SavgolVelocity}
+
+
+class VelocityWindow(object):
+
+    """
+    Window of the last timed instances and the velocity estimator over it.
+
+    Example
+    -------
+    >>> window = VelocityWindow(30, 'lstsq', time_source='stamp')
+    >>> window.allocate(columns)
+    >>> for instance in instances:
+    ...     window.add(instance)
+    ...     velocities = window.velocities()
+    """
+
+    def __init__(self, capacity, estimator='difference', time_source='stamp',
+                 savgol_order=2, clock=time.time):
+        """
+        Constructor.
+
+        Parameters
+        ----------
+        capacity : int
+            Max number of instances of the window.
+        estimator : str (Default 'difference')
+            One of L{ESTIMATORS}.
+        time_source : str (Default 'stamp')
+            One of L{TIME_SOURCES}.
+        savgol_order : int (Default 2)
+            Order of the polynomial of the 'savgol' estimator.
+        clock : callable (Default time.time)
+            Returns the arrival time of the instances.
+
+        Raises
+        ------
+        KeyError
+            If the estimator is not valid
+        ValueError
+            If the time_source is not valid
+        """
+        if time_source not in TIME_SOURCES:
+            raise ValueError("Invalid time source: {}. Use one of {}"
+                             .format(time_source, TIME_SOURCES))
+        if estimator == 'savgol':
+            self.estimator = SavgolVelocity(capacity, savgol_order)
+        else:
+            self.estimator = ESTIMATORS[estimator](capacity)
+        self.capacity = int(capacity)
+        self.time_source = time_source
+        self.clock = clock
+        self.stamp_column = None
+        self.buffer = RingBuffer(capacity)
+        self.times = RingBuffer(capacity, columns=['time'])
+        self._frames = 0
+
+    @property
+    def columns(self):
+        """Columns of the instances (None until L{allocate} is called)."""
+        return self.buffer.columns
+
+    def __len__(self):
+        return len(self.buffer)
+
+    def allocate(self, columns):
+        """Allocate the window for instances with columns."""
+        self.buffer = RingBuffer(self.capacity, columns=columns)
+        self.stamp_column = None
+        if self.time_source == 'stamp' and 'stamp' in columns:
+            self.stamp_column = list(columns).index('stamp')
+        self.clear()
+        return self
+
+    def clear(self):
+        """Remove all the instances of the window."""
+        self.buffer.clear()
+        self.times.clear()
+        self.estimator.reset()
+        return self
+
+    def _instance_time(self, instance):
+        """Return the time of an instance according to the time_source."""
+        if self.time_source == 'frames':
+            return float(self._frames)
+        if self.stamp_column is not None:
+            return instance[self.stamp_column]
+        return self.clock()
+
+    def add(self, instance):
+        """
+        Add an instance to the window and update the estimator.
+
+        Instances older than the newest one of the window restart it.
+
+        Parameters
+        ----------
+        instance : numpy.ndarray (1D)
+            The instance. Its columns are the ones of L{allocate}
+            (or 0, 1, ... if it was not called).
+
+        Returns
+        -------
+        bool
+            True if the instance restarted the window
+
+        Raises
+        ------
+        ValueError
+            If the instance length differs from the window width.
+        """
+        if self.buffer.columns is None:
+            self.allocate(range(len(instance)))
+        if len(instance) != self.buffer.width:
+            raise ValueError("Instance has {} fields. Expected {}"
+                             .format(len(instance), self.buffer.width))
+        self._frames += 1
+        t = self._instance_time(instance)
+        restarted = bool(len(self.times)) and t < self.times.last()[0]
+        if restarted:
+            self.clear()
+        if self.buffer.is_full():
+            self.estimator.update(t, instance, self.times.first()[0],
+                                  self.buffer.first())
+        else:
+            self.estimator.update(t, instance)
+        self.buffer.append(instance)
+        self.times.append([t])
+        if self._frames % self.capacity == 0:  # Drop the running values drift
+            self.estimator.resync(self.times.values[:, 0], self.buffer.values)
+        return restarted
+
+    def velocities(self):
+        """
+        Return the velocities of the instances of the window.
+
+        Raises
+        ------
+        ValueError
+            If the window is empty
+        """
+        return self.estimator.value(self.times.values[:, 0],
+                                    self.buffer.values)
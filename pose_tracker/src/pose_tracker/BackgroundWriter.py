@@ -0,0 +1,91 @@
+#!/usr/bin/env python
+"""
+Write-behind thread that dumps a L{SkeletonQueue} to the dataset.
+
+Skeleton callbacks only append to the queue. The L{BackgroundWriter}
+thread pops the queued skeletons in large batches and passes them to a
+write function, so no ROS thread ever blocks on disk.
+
+A batch is written when the queue reaches ``max_rows`` skeletons or,
+if there is any skeleton waiting, when ``max_latency`` seconds elapsed
+since the last write. L{BackgroundWriter.stop} drains the queue before
+the thread ends.
+"""
+import rospy
+
+import threading
+import time
+
+
+class BackgroundWriter(threading.Thread):
+
+    """
+    Thread that writes the elements of a queue in batches.
+
+    Example
+    -------
+    >>> writer = BackgroundWriter(queue, write_func, max_rows=1000)
+    >>> writer.start()
+    >>> # ... queue.append(...) from other threads ...
+    >>> writer.stop()   # Writes what is left in the queue
+    """
+
+    def __init__(self, queue, write, max_rows=1000, max_latency=1.0):
+        """
+        Constructor.
+
+        Parameters
+        ----------
+        queue : L{SkeletonQueue}
+            The queue to be written. Any sized container works.
+        write : callable
+            Function called as ``write(n)`` to pop and write n elements
+            of the queue. n = -1 means all of them.
+        max_rows : int (Default 1000)
+            Queue length that triggers a write.
+        max_latency : float (Default 1.0)
+            Max time (in seconds) a queued element waits to be written.
+        """
+        super(BackgroundWriter, self).__init__(name='background_writer')
+        self.daemon = True
+        self.queue = queue
+        self.write = write
+        self.max_rows = max_rows
+        self.max_latency = max_latency
+        self._poll_period = max_latency / 10.0
+        self._stop_event = threading.Event()
+        self.written_batches = 0
+
+    def _flush(self, items):
+        """Write items of the queue. Errors are logged, not raised."""
+        try:
+            self.write(items)
+            self.written_batches += 1
+        except Exception as e:
+            rospy.logerr("Could not write skeletons to the dataset. "
+                         "Reason: {}".format(e))
+
+    def run(self):
+        last_write = time.time()
+        while not self._stop_event.is_set():
+            queued = len(self.queue)
+            elapsed = time.time() - last_write
+            if queued >= self.max_rows or \
+                    (queued and elapsed >= self.max_latency):
+                self._flush(queued)
+                last_write = time.time()
+            else:
+                self._stop_event.wait(self._poll_period)
+        if len(self.queue):
+            self._flush(-1)
+
+    def stop(self, timeout=None):
+        """
+        Stop the thread once the queue has been written.
+
+        Blocks until the thread ends (or timeout seconds elapse).
+        """
+        self._stop_event.set()
+        if self.is_alive():
+            self.join(timeout)
+        return self
@@ -1,35 +1,175 @@
 import roslib; roslib.load_manifest('pose_tracker')
 import rospy
 
-import collections as col
+import threading
+import numpy as np
 import pandas as pd
-from itertools import chain
 
 import kinect.nite_skeleton_msg_utils as nsku
 
+USER_POLICIES = ('first', 'all', 'closest')
+
 
 class SkeletonQueue(object):
 
     """
     Class that contains a queue of skeletons
     along with operations return its eleements as a pandas.DataFrame
+
+    Skeletons are unpacked when they are appended. Their data is stored
+    in a growable float64 block and their labels as integer codes of
+    L{labels} in a parallel array, so popping n skeletons is just a slice
+    of both arrays.
+
+    The skeletons of the users stored from each message depend on the
+    user policy:
+        - 'first': the first skeleton of the message
+        - 'all': the skeletons of all the users
+        - 'closest': the skeleton with the lowest distance_field
+          (E.g. the torso z position)
+        - an int: the skeleton of the user with that user_id
     """
 
-    def __init__(self, joint_names):
+    def __init__(self, joint_names, capacity=1024, header_len=2,
+                 user_policy='first', distance_field=None):
+        """
+        Constructor.
+
+        @param joint_names: the joints that the skeletons should have
+        @param capacity: initial num of skeletons the queue can store.
+            The queue grows if it needs more space.
+        @param header_len: num of fields of an unpacked skeleton
+            that precede the fields of the joints (E.g. user_id, stamp).
+            The first one must be the user_id.
+        @param user_policy: the users whose skeletons are stored.
+            One of L{USER_POLICIES} or a user_id.
+        @param distance_field: position of the field of the unpacked
+            skeletons used by the 'closest' policy
+        @raise ValueError: if user_policy is not valid
+        """
         super(SkeletonQueue, self).__init__()
-        self.skeleton_queue = col.deque([])  # stores (skeletons, label)
+        if user_policy not in USER_POLICIES and \
+                not isinstance(user_policy, int):
+            raise ValueError("Invalid user policy: {}. Use one of {} "
+                             "or a user_id".format(user_policy, USER_POLICIES))
+        if user_policy == 'closest' and distance_field is None:
+            raise ValueError("'closest' policy needs a distance_field")
         self.joint_names = joint_names
+        self.header_len = header_len
+        self.user_policy = user_policy
+        self.distance_field = distance_field
+        # Maps (joint names, num of fields) of the unpacked skeletons
+        # to the reorder indices of their fields (See L{_joints_order})
+        self._joints_orders = {}
+        self.labels = []        # Label of each code
+        self._label_codes = {}  # Code of each label
+        self._capacity = capacity
+        self._data = None       # Allocated by the first append
+        self._codes = np.empty(capacity, dtype=np.intp)
+        self._start = 0         # First queued row
+        self._end = 0           # Row where the next skeleton is stored
+        self._lock = threading.Lock()
 
     def __len__(self):
-        return len(self.skeleton_queue)
+        return self._end - self._start
+
+    def _label_code(self, label):
+        """Return the code of a label, adding it to L{labels} if needed."""
+        code = self._label_codes.get(label)
+        if code is None:
+            code = self._label_codes[label] = len(self.labels)
+            self.labels.append(label)
+        return code
+
+    def _reserve(self, rows, width):
+        """
+        Make room for rows rows of width elements at the end of the queue.
+
+        The queued rows are moved to a new block (twice as big if they
+        fill more than half of the current one). The old block is never
+        modified, so rows already popped from it remain valid.
+        """
+        if self._data is None:
+            while self._capacity < rows:
+                self._capacity *= 2
+            self._data = np.empty((self._capacity, width))
+            self._codes = np.empty(self._capacity, dtype=np.intp)
+            return
+        if self._end + rows <= len(self._data):
+            return
+        nrows = len(self)
+        while 2 * (nrows + rows) > self._capacity:
+            self._capacity *= 2
+        data = np.empty((self._capacity, self._data.shape[1]))
+        codes = np.empty(self._capacity, dtype=np.intp)
+        data[:nrows] = self._data[self._start:self._end]
+        codes[:nrows] = self._codes[self._start:self._end]
+        self._data, self._codes = data, codes
+        self._start, self._end = 0, nrows
+
+    def _unpack_users(self, skeletons):
+        """
+        Return the unpacked skeletons of a message selected by the policy.
+
+        @return: array of shape (num of selected skeletons, fields)
+        @raise TypeError: if a skeleton does not have the expected joints
+        @raise IndexError: if the message does not have any skeleton
+        """
+        if self.user_policy == 'first':
+            skels = skeletons.skeletons[:1]
+        elif isinstance(self.user_policy, int):
+            skels = [s for s in skeletons.skeletons
+                     if s.user_id == self.user_policy]
+        else:
+            skels = skeletons.skeletons
+        if not skels:
+            raise IndexError("Message has no skeletons of the policy users")
+        first = self._process_skeleton_msg(skels[0])
+        rows = np.empty((len(skels), len(first)))
+        rows[0] = first
+        for skel, row in zip(skels[1:], rows[1:]):
+            self._process_skeleton_msg(skel, out=row)
+        if self.user_policy == 'closest':
+            rows = rows[[rows[:, self.distance_field].argmin()]]
+        return rows
 
     def append(self, skeletons, label):
-        """Append a skeleton and a label to the queue."""
-        self.skeleton_queue.append((skeletons, label))
+        """
+        Unpack the skeletons of a message and append them to the queue.
+
+        The skeletons of the message that are appended depend on the
+        user policy (See L{SkeletonQueue}).
+        Messages with skeletons without the expected joints are discarded.
+
+        @param skeletons: the skeletons message
+        @type skeletons: kinect.msg.NiteSkeletonList
+        @param label: the label of the skeletons
+        """
+        try:
+            rows = self._unpack_users(skeletons)
+        except (TypeError, IndexError, ValueError), e:
+            rospy.logwarn("Message not added to the dataset\n"
+                          "Reason: {}".format(e))
+            return
+        with self._lock:
+            width = rows.shape[1]
+            if self._data is not None and width != self._data.shape[1]:
+                rospy.logwarn("Message not added to the dataset\n"
+                              "Reason: it has {} fields. Expected {}"
+                              .format(width, self._data.shape[1]))
+                return
+            self._reserve(len(rows), width)
+            end = self._end + len(rows)
+            self._data[self._end:end] = rows
+            self._codes[self._end:end] = self._label_code(label)
+            self._end = end
 
     def clear(self):
         """Remove all elements of the queue."""
-        self.skeleton_queue.clear()
+        with self._lock:
+            self._data = None   # Do not overwrite the popped elements
+            self._codes = np.empty(self._capacity, dtype=np.intp)
+            self._start = self._end = 0
 
     def _check_joints(self, joint_names1, joint_names2):
         """Raise TypeError if entered parameters differ."""
@@ -40,81 +180,113 @@ class SkeletonQueue(object):
                 "Received: {}\nExpected: {}"
                 .format(str(joint_names1), str(joint_names2)))
 
-    def _process_skeleton_msg(self, skeleton):
+    def _joints_order(self, joint_names, num_fields):
         """
-        Return unpacked data from a skeleton if its joints are valid..
+        Return the indices that sort the fields of an unpacked skeleton.
 
-        Unpack a skeleton message frome the queue,
-        check if joints are valid and returns its data.
+        Sorts the joint fields in the order of L{joint_names}. Results are
+        cached, as the joint names of a tracker do not change.
+
+        @param joint_names: joint names of the unpacked skeleton
+        @param num_fields: num of fields of the unpacked skeleton
+        @return: the reorder indices or None if fields are already sorted
+        @raise TypeError: if joint names differ from the expected ones
         """
+        key = (tuple(joint_names), num_fields)
         try:
-            data, joint_names = nsku.unpack_skeleton_msg(skeleton)
-            self._check_joints(joint_names, self.joint_names)
-            return data
-        except TypeError as e:
-            raise e
-
-    def _calc_chunksize(self, chunksize):
-        """Calculate how many elements to retrieve from squeleton queue."""
-        if chunksize < 0 or chunksize > len(self.skeleton_queue):
-            return len(self.skeleton_queue)
-        return chunksize
+            order = self._joints_orders[key]
+        except KeyError:
+            try:
+                self._check_joints(joint_names, self.joint_names)
+                order = self._calc_joints_order(key[0], num_fields)
+            except TypeError as e:
+                order = e
+            self._joints_orders[key] = order
+        if isinstance(order, TypeError):
+            raise order
+        return order
 
-    def _pop_from_queue(self, elements):
-        """
-        Pop n elements from skeleton_queue.
+    def _calc_joints_order(self, joint_names, num_fields):
+        """Calculate the reorder indices of L{_joints_order}."""
+        if list(joint_names) == list(self.joint_names):
+            return None
+        attribs, rest = divmod(num_fields - self.header_len, len(joint_names))
+        if rest or len(joint_names) != len(self.joint_names):
+            raise TypeError("Can not sort the {} fields of joints {}"
+                            .format(num_fields, joint_names))
+        position = {name: i for i, name in enumerate(joint_names)}
+        starts = [self.header_len + position[name] * attribs
+                  for name in self.joint_names]
+        order = np.arange(num_fields)
+        order[self.header_len:] = \
+            (np.array(starts)[:, np.newaxis] + np.arange(attribs)).ravel()
+        return order
 
-        @note: this is a generator, meaning that it executes LAZYLY!
-        @note: only grabs the first skeleton from the NiteSkeletonList msg
+    def _process_skeleton_msg(self, skeleton, out=None):
         """
-        for _ in xrange(self._calc_chunksize(elements)):
-            try:
-                skels, label = self.skeleton_queue.popleft()
-                skel_data = self._process_skeleton_msg(skels.skeletons[0])
-                yield chain(skel_data, label)
-            except TypeError, e:
-                rospy.logwarn("Message not added to the dataset\n"
-                              "Reason: {}".format(e))
-            except IndexError, e:
-                rospy.logdebug("Skeleton Queue got emptied. Stoping")
-                break
+        Return unpacked data from a skeleton if its joints are valid..
 
-    def _prepare_chunk(self, chunksize=50):
-        """
-        Yield chunksize elements from self.skeleton_queue (using popleft()).
+        Unpack a skeleton message frome the queue,
+        check if joints are valid and returns its data
+        with the joints sorted as L{joint_names}.
 
-        @param chunksize: Num of elements to retrieve from the queue.
-        @note: If chunksize < 0  or > len self.skeleton_queue,
-            then yelds all elements of the queue
+        @param out: (Optional) float64 array where the data is written
+        @return: the data (out if it was passed)
+        @rtype: numpy.ndarray of floats
+        @raise TypeError: if the skeleton does not have the expected joints
+        @raise ValueError: if out does not have the num of fields of data
         """
-        if not self.skeleton_queue:
-            rospy.logdebug("Skeleton_queue is empty. Nothing to do.")
-            return
+        data, joint_names = nsku.unpack_skeleton_msg(skeleton)
+        data = np.fromiter(data, dtype=np.float64)
+        order = self._joints_order(joint_names, len(data))
+        if out is not None and len(out) != len(data):
+            raise ValueError("Skeleton has {} fields. Expected {}"
+                             .format(len(data), len(out)))
+        if order is not None:
+            return data.take(order, out=out)
+        if out is None:
+            return data
+        out[:] = data
+        return out
 
-        for skel_data in self._pop_from_queue(chunksize):
-            yield skel_data
+    def _calc_chunksize(self, chunksize):
+        """Calculate how many elements to retrieve from squeleton queue."""
+        if chunksize < 0 or chunksize > len(self):
+            return len(self)
+        return chunksize
 
-    def _chunk_to_data_frame(self, chunk, columns):
+    def pop_n(self, n):
         """
-        Return a pandas.DataFrame of chunksize elements.
+        Pop n elements from the queue.
 
-        @note: This method expects its input from L{_prepare_chunk}
-        @param chunk: a chunk of elements obtained from L{_prepare_chunk}
-        @param columns: list containing the names of the
-            pandas.DataFrame columns
-        @return: the elements of queue in form of a pandas.DataFrame
-        @rtype: pandas.Dataframe
+        @param n: number of elements to retrieve from queue.
+            If n < 0  or > len(self), pops all the elements of the queue
+        @return: tuple (data, codes) with the data of the skeletons,
+            shape (n, fields), and the codes of their labels, shape (n,)
+            (See L{labels}). Both are views of the queue storage that
+            stay valid after subsequent appends.
         """
-        return pd.DataFrame(list(chunk), columns=columns)
+        with self._lock:
+            start = self._start
+            self._start += self._calc_chunksize(n)
+            if self._data is None:
+                return np.empty((0, 0)), self._codes[:0]
+            return (self._data[start:self._start],
+                    self._codes[start:self._start])
 
     def pop_n_to_DataFrame(self, n, columns):
         """
         Pop n elements from queue and returns them as a L{pandas.DataFrame}.
 
         @param n: number of elements to retrieve from queue
-        @param columns: list with the names of the pandas.DataFrame columns
+        @param columns: list with the names of the pandas.DataFrame columns.
+            The last one is the column of the labels.
         @return: n elements from the queue in form of a pandas.DataFrame
         @rtype: pandas.DataFrame
         """
-        chunk = self._prepare_chunk(n)
-        return self._chunk_to_data_frame(chunk, columns)
+        data, codes = self.pop_n(n)
+        if not len(data):
+            return pd.DataFrame(columns=columns)
+        df = pd.DataFrame(data, columns=columns[:-1], copy=False)
+        df[columns[-1]] = np.array(self.labels, dtype=object).take(codes)
+        return df
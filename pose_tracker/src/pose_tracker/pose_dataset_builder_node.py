@@ -19,6 +19,7 @@ from func_utils import (error_handler, preconditions, PreconditionError)
 from iter_utils import as_iter
 import PoseDatasetIO as pdio
 import SkeletonQueue as skq
+from BackgroundWriter import BackgroundWriter
 
 
 DEFAULT_NAME = 'pose_dataset_builder'
@@ -26,6 +27,16 @@ DEFAULT_NAME = 'pose_dataset_builder'
 PARAM_NAMES = ('dataset', 'rate', 'pose_labels', 'pose_commands',
                'command_mapper', 'skeleton_joints', 'joint_attrib_names')
 
+# Optional params and their default values.
+# write_batch_size: num of queued skeletons that triggers a write to disk
+# write_latency: max time (s) a queued skeleton waits to be written to disk
+# user_policy: users added to the dataset from each skeletons msg.
+#              'first' (Default), 'all', 'closest' or a user_id
+#              (See L{SkeletonQueue})
+# closest_joint: joint whose z position selects the 'closest' user
+OPTIONAL_PARAMS = {'write_batch_size': 1000, 'write_latency': 1.0,
+                   'user_policy': 'first', 'closest_joint': 'torso'}
+
 STATE_INIT = 'initiating'
 STATE_IDLE = 'idle'
 STATE_PROCESSING = 'processing'
@@ -143,7 +154,24 @@ class PoseDatasetBuilder(object):
         #   rospy.set_param('~dataset/columns', self.dataset_columns)
 
         # Stores (skeletons, label) pairs and manages queue IO
-        self.skeleton_queue = skq.SkeletonQueue(self.joint_names)
+        distance_field = None
+        if self.user_policy == 'closest':
+            distance_column = self.closest_joint + '_pos_z'
+            if distance_column not in self.dataset_columns:
+                logfatal("Invalid closest_joint: {}. Dataset has no column {}."
+                         " Valid joints: {}".format(self.closest_joint,
+                                                    distance_column,
+                                                    self.joint_names))
+                rospy.signal_shutdown("node " + rospy.get_name() +
+                                      " shot down because of invalid params")
+                raise ValueError("Invalid closest_joint: {}"
+                                 .format(self.closest_joint))
+            distance_field = self.dataset_columns.index(distance_column)
+        self.skeleton_queue = skq.SkeletonQueue(
+            self.joint_names, user_policy=self.user_policy,
+            distance_field=distance_field)
+        # Thread writing the queue to the dataset (See L{state_processing})
+        self.writer = None
 
     def _combine_joints_attribs(self, joint_names, attrib_names):
         """
@@ -192,6 +220,9 @@ class PoseDatasetBuilder(object):
             self.attrib_names = all_params.next().value
             logger("Attrib names" + str(self.attrib_names))
 
+            for pname, default in OPTIONAL_PARAMS.iteritems():
+                setattr(self, pname, rospy.get_param('~' + pname, default))
+
         except Exception, e:
             logfatal(e.message + " Error when loading parameters: {}".
                      format(list(all_params)))
@@ -304,18 +335,39 @@ class PoseDatasetBuilder(object):
 
     @preconditions(_state_processing_precons, logger=logdebug, reraise=False)
     def state_processing(self):
-        """Processes skeletons from the queue and adds them to the dataset"""
+        """
+        Start the thread that adds the skeletons of the queue to the dataset.
+
+        The skeletons are written in the background by a L{BackgroundWriter}
+        in batches of write_batch_size or every write_latency seconds.
+        """
         logdebug('State: Processing')
-        # We process one chunk per second
-        self._write_from_queue(self.rate, self.table_name, self.append_data)
+        if self.writer is None:
+            self.writer = BackgroundWriter(self.skeleton_queue,
+                                           self._write_batch,
+                                           max_rows=self.write_batch_size,
+                                           max_latency=self.write_latency)
+            self.writer.start()
+
+    def _write_batch(self, items):
+        """Write items skeletons of the queue to the dataset table."""
+        self._write_from_queue(items, self.table_name, self.append_data)
         # After the first time we write, we append the data
         self.append_data = True
 
     def _write_from_queue(self, items, table_name, append):
         df = self.skeleton_queue.pop_n_to_DataFrame(
             items, self.dataset_columns)
+        if df.empty:
+            return
         self.data_writer.write(table_name, df, table=True, append=append)
 
+    def _stop_writer(self):
+        """Stop the writer thread once it has written the queue."""
+        if self.writer is not None:
+            self.writer.stop()
+            self.writer = None
+
     def _write_labels_to_file(self, table_name):
         """
         Helper method that writes all labels to dataset.
@@ -331,6 +383,7 @@ class PoseDatasetBuilder(object):
         Dumps remaining skeletons to the dataset and closes the file"""
         loginfo('State: finishing')
         try:
+            self._stop_writer()
             # Write to the file the remaining skeletons of the queue
             self._write_from_queue(-1, self.table_name, True)
             self._write_labels_to_file('used_labels')
@@ -387,16 +440,6 @@ class PoseDatasetBuilder(object):
                 self.run_current_state()
             self.rate.sleep()
 
-    # def __get_closest_skeleton(self, skeletons, joint="torso"):
-    #     """Returns the closest skeleton by comparing
-    #         the z position of a list of skeletons
-    #         Input: skeletons - The list of skeletons
-    #         Input: joint="torso" The joint which is used to compare skeletons
-    #         Return: The index of the closest skeleton
-    #     """
-    # TODO
-    #     pass
-
     def shutdown(self):
         """Closes the node """
         if self.curr_state != STATE_END:
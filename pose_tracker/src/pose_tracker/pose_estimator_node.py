@@ -5,21 +5,83 @@ roslib.load_manifest('pose_tracker')
 import rospy
 from rospy import (logdebug, loginfo, logwarn)
 
-from pandas import Series
+from threading import Lock
+import numpy as np
 
 from func_utils import error_handler as eh
 import param_utils as pu
 import pose_learner as pl
+from latency_monitor import (LatencyMonitor, timed_callback)
+from column_schema import SchemaCache
 
 import kinect.nite_skeleton_msg_utils as nsku
 
 # Import message types
-from pose_msgs.msg import PoseEstimated
+from pose_msgs.msg import (PoseEstimated, PoseInstance)
+from std_msgs.msg import Bool
 from pose_tracker.srv import DatasetInfo
 import kinect.msg as kin
 
 DEFAULT_NAME = 'pose_estimator'
-PARAMS = ('estimator_file', 'dataset_columns', 'drop_columns', 'labels')
+PARAMS = ('estimator_file', 'dataset_columns', 'drop_columns')
+
+# Optional params and their default values.
+# labels: label names of the estimator classes. Only used if the estimator
+#         file does not store them (See L{pose_learner.save_clf})
+# batch_size: Max num of skeletons estimated together. 1 disables batching
+# batch_latency: Max time (ms) a skeleton waits in a batch to be estimated
+# mmap_mode: memory-map mode of the estimator arrays. Empty loads them in RAM.
+#            'r' avoids a copy of them, but processes do not share them
+# multi_user: If True, estimates the poses of all the users of each msg.
+#             Otherwise only the pose of the first one.
+# motion_gated: If True, only estimates a pose once each time the user
+#               stops moving (See is_user_moving topic of PoseDetectorNode)
+# gated_source: what is estimated in each stillness episode if motion_gated:
+#               'skeletons': the first skeletons msg received while still
+#               'user_pose': the PoseInstance published by PoseDetectorNode
+#                            (the averaged instance if it subscribes to them)
+# gating_report_period: seconds between logs of the done and skipped
+#                       inferences if motion_gated. 0 only logs at shutdown
+OPTIONAL_PARAMS = {'batch_size': 1, 'batch_latency': 100, 'labels': None,
+                   'mmap_mode': '', 'multi_user': False,
+                   'motion_gated': False, 'gated_source': 'skeletons',
+                   'gating_report_period': 60.0}
+GATED_SOURCES = ('skeletons', 'user_pose')
+LABEL_COLUMN = 'pose'
+
+
+def column_plan(columns, drop_columns, label_column=LABEL_COLUMN):
+    """
+    Return the positions of the columns that are fed to the estimator.
+
+    @param columns: the columns of the dataset used to train the estimator
+    @param drop_columns: the columns not used to train the estimator
+    @param label_column: name of the column containing the labels
+    @return: positions of the kept columns (in the order of ``columns``)
+    @rtype: numpy.ndarray of ints
+    """
+    dropped = set(drop_columns) | set([label_column])
+    return np.array([i for i, col in enumerate(columns) if col not in dropped],
+                    dtype=np.intp)
+
+
+def instance_plan(instance_columns, columns, plan):
+    """
+    Return the positions of the estimator columns in a PoseInstance.
+
+    @param instance_columns: the columns of the PoseInstance
+    @param columns: the columns of the dataset used to train the estimator
+    @param plan: the L{column_plan} of the dataset columns
+    @return: positions in the instance of the columns kept by the plan
+    @rtype: numpy.ndarray of ints
+    @raise ValueError: if the instance does not have some of the columns
+    """
+    position = {col: i for i, col in enumerate(instance_columns)}
+    missing = [columns[i] for i in plan if columns[i] not in position]
+    if missing:
+        raise ValueError("Instance does not have columns: {}"
+                         .format(missing))
+    return np.array([position[columns[i]] for i in plan], dtype=np.intp)
 
 
 class PoseEstimatorNode(object):
@@ -36,16 +98,45 @@ class PoseEstimatorNode(object):
         rospy.init_node(self.node_name)
         rospy.on_shutdown(self.shutdown)
         rospy.loginfo("Initializing " + self.node_name + " node...")
+        self.latency_monitor = LatencyMonitor.from_params()
 
-        with eh(action=self.shutdown):
+        with eh(logger=rospy.logfatal, log_msg="Couldn't start the node: ",
+                action=self.shutdown, reraise=True):
             self.load_parameters()
+            self.load_estimator()
 
-        # Subscriber
-        rospy.Subscriber("skeletons", kin.NiteSkeletonList, self.skeleton_cb)
+        # Skeletons waiting to be estimated and their users
+        # (See L{flush_batch})
+        self._batches = [np.empty((self.batch_size, len(self._column_plan)),
+                                  dtype=np.float32) for _ in xrange(2)]
+        self._batch_users = [np.empty(self.batch_size, dtype=np.int32)
+                             for _ in xrange(2)]
+        self._batch = self._batches[0]
+        self._users = self._batch_users[0]
+        self._batch_len = 0
+        self._batch_lock = Lock()   # Protects self._batch & self._batch_len
+        self._flush_lock = Lock()   # Only one batch is estimated at a time
 
         # Publishers
         self.publisher = rospy.Publisher('pose_estimated', PoseEstimated)
 
+        # Motion gating (See L{gate})
+        self._user_moving = True    # Until PoseDetectorNode reports stillness
+        self._episode_estimated = False
+        self.skipped_inferences = 0
+        self.gated_inferences = 0
+        self._instance_plans = {}   # Instance columns -> L{instance_plan}
+        if self.motion_gated:
+            self._start_gating()
+
+        # Subscriber
+        rospy.Subscriber("skeletons", kin.NiteSkeletonList, self.skeleton_cb)
+        if self.batch_size > 1:
+            loginfo("Estimating in batches of up to {} skeletons or {} ms"
+                    .format(self.batch_size, self.batch_latency))
+            rospy.Timer(rospy.Duration(self.batch_latency / 1000.0),
+                        self._batch_timer_cb)
+
     def load_parameters(self):
         """
         Load the parameters needed by the node.
@@ -60,18 +151,34 @@ class PoseEstimatorNode(object):
         except:
             rospy.logfatal("Couldn't load Parameters: {}".format(list(params)))
             raise
+        for pname, default in OPTIONAL_PARAMS.iteritems():
+            setattr(self, pname, rospy.get_param('~' + pname, default))
+        if self.gated_source not in GATED_SOURCES:
+            raise ValueError("Invalid gated_source: {}. Use one of {}"
+                             .format(self.gated_source, GATED_SOURCES))
+        self._column_plan = column_plan(self.dataset_columns,
+                                        self.drop_columns)
 
     def load_estimator(self, filename=None):
         """
         Load an estimator from file.
 
+        The label names are taken from the estimator if it stores them.
+        Otherwise, the ~labels param is used.
+
         @param filename: the file name of the file storing the estimator
                          Default: self.estimator_file
         @type filename: string
-        @return: the estimator loaded from the file"""
+        @return: the estimator loaded from the file
+        @raise ValueError: if there are no label names for the estimator"""
         if not filename:
             filename = self.estimator_file
-        self.estimator = pl.load_clf(filename)
+        self.estimator = pl.load_clf(filename,
+                                     mmap_mode=self.mmap_mode or None)
+        self.labels = getattr(self.estimator, 'labels_', self.labels)
+        if self.labels is None:
+            raise ValueError("Estimator {} has no labels. Set ~labels param"
+                             .format(filename))
         return self.estimator
 
     def predict(self, instance):
@@ -86,27 +193,204 @@ class PoseEstimatorNode(object):
         """Return prediction probabilities."""
         return self.estimator.predict_proba(instance)
 
-    def _unpack_skeleton_msg(self, skel_msg):
-        """Convert a NiteskeletonMsg to a list to a pandas.Series."""
-        unpacked = list(nsku.unpack_skeleton_msg(skel_msg)[1])
-        cols = self.dataset_columns
-        return Series(unpacked, index=cols).drop(self.drop_columns, axis=1)
+    def estimate(self, instances):
+        """
+        Estimate the labels of a batch of instances.
+
+        Uses a single call to L{predict_proba} and derives the predicted
+        labels from the most probable class of each instance.
+
+        @param instances: the instances to estimate
+        @type instances: array of shape (n_instances, n_features)
+        @return: tuple (label_ids, probas) with the predicted label ids
+            (shape (n_instances,)) and the probabilities of each label
+            (shape (n_instances, n_labels))
+        """
+        probas = self.predict_proba(instances)
+        label_ids = self.estimator.classes_.take(probas.argmax(axis=1))
+        return label_ids, probas
+
+    def _unpack_skeleton_msg(self, skel_msg, out=None):
+        """
+        Convert a NiteSkeleton msg to an instance for the estimator.
+
+        Keeps only the columns of the L{column_plan} of the node.
+
+        @param skel_msg: the skeleton to unpack
+        @param out: (Optional) float32 array where the instance is written
+        @return: the instance (out if it was passed)
+        @raise ValueError: if the skeleton has less fields than expected
+        """
+        unpacked = np.fromiter(nsku.unpack_skeleton_msg(skel_msg)[0],
+                               dtype=np.float64)
+        if len(unpacked) <= self._column_plan[-1]:
+            raise ValueError("Skeleton has {} fields. Expected {}"
+                             .format(len(unpacked), self._column_plan[-1] + 1))
+        if out is None:
+            out = np.empty(len(self._column_plan), dtype=np.float32)
+        return unpacked.take(self._column_plan, out=out, mode='clip')
 
-    def _build_pose_estimated_msg(self, skels):
-        """Build a L{PoseEstimated} message from a L{Skeleton msg}."""
+    def _build_pose_estimated_msg(self, instance, label_id, probas,
+                                  user_id=0):
+        """Build a L{PoseEstimated} message from an estimated instance."""
         epose = PoseEstimated()
-        epose.raw_instance = self._unpack_skeleton_msg(skels.skeletons[0])
-        epose.predicted_label_id = self.predict(epose.raw_instance)
-        epose.predicted_label = self.labels[epose.predicted_label_id]
+        epose.raw_instance = instance
+        epose.predicted_label_id = label_id
+        epose.predicted_label = self.labels[label_id]
         epose.label_names = self.labels
-        epose.label_probas = self.predict_proba(epose.raw_instance)
+        epose.label_probas = probas
+        epose.user_id = user_id
         return epose
 
+    @timed_callback('estimate_batch')
+    def publish_estimations(self, instances, user_ids=None):
+        """
+        Estimate a 2D array of instances and publish a msg for each one.
+
+        @param user_ids: (Optional) the user of each instance
+        """
+        label_ids, probas = self.estimate(instances)
+        if user_ids is None:
+            user_ids = np.zeros(len(instances), dtype=np.int32)
+        for instance, label_id, proba, user_id in \
+                zip(instances, label_ids, probas, user_ids):
+            self.publisher.publish(self._build_pose_estimated_msg(
+                instance, label_id, proba, user_id))
+
+    @timed_callback()
     def skeleton_cb(self, skels):
         """Callback for skeleton messages."""
-        with eh(logger=logwarn, low_msg='Could not estimate pose. '):
-            pe_msg = self._build_pose_estimated_msg(skels)
-            self.publisher.publish(pe_msg)
+        with eh(logger=logwarn, log_msg='Could not estimate pose. '):
+            skeletons = skels.skeletons if self.multi_user \
+                else skels.skeletons[:1]
+            if self.motion_gated and not self.gate(len(skeletons)):
+                return
+            self._add_to_batch(skeletons)
+
+    def _start_gating(self):
+        """Subscribe to the topics of PoseDetectorNode used for gating."""
+        loginfo("Estimating poses only when the user stops moving. "
+                "Estimating: {}".format(self.gated_source))
+        if self.gated_source == 'user_pose':
+            self.instance_schemas = SchemaCache('user_pose')
+            rospy.Subscriber('user_pose', PoseInstance, self.user_pose_cb)
+        else:
+            rospy.Subscriber('is_user_moving', Bool, self.is_moving_cb)
+        if self.gating_report_period > 0:
+            rospy.Timer(rospy.Duration(self.gating_report_period),
+                        self.log_gating)
+
+    def log_gating(self, event=None):
+        """Log the inferences done and skipped by the motion gating."""
+        total = self.gated_inferences + self.skipped_inferences
+        loginfo("Motion gating: {} inferences done, {} of {} skipped"
+                .format(self.gated_inferences, self.skipped_inferences,
+                        total))
+
+    def gate(self, num_skeletons):
+        """
+        Return whether num_skeletons of a skeletons msg have to be estimated.
+
+        Only the skeletons of the first msg received in each stillness
+        episode are estimated (none if gated_source is 'user_pose').
+        The rest are counted in L{skipped_inferences}.
+        """
+        if self.gated_source != 'skeletons' or self._user_moving or \
+                self._episode_estimated:
+            self.skipped_inferences += num_skeletons
+            return False
+        self._episode_estimated = True
+        self.gated_inferences += num_skeletons
+        logdebug("Estimating stillness episode. Skipped inferences: {}"
+                 .format(self.skipped_inferences))
+        return True
+
+    def is_moving_cb(self, msg):
+        """Store whether the user is moving. Stopping starts an episode."""
+        if self._user_moving and not msg.data:
+            self._episode_estimated = False
+        self._user_moving = msg.data
+
+    @timed_callback()
+    def user_pose_cb(self, msg):
+        """
+        Estimate the pose instance published when the user stops.
+
+        PoseDetectorNode only publishes it once per stillness episode.
+        """
+        with eh(logger=logwarn, log_msg='Could not estimate pose. '):
+            self.gated_inferences += 1
+            instance = np.asarray(msg.instance, dtype=np.float64)
+            columns = self.instance_schemas.columns(msg)
+            key = tuple(columns)
+            plan = self._instance_plans.get(key)
+            if plan is None:
+                plan = self._instance_plans[key] = instance_plan(
+                    columns, self.dataset_columns, self._column_plan)
+            users = [int(instance[columns.index('user_id')])] \
+                if 'user_id' in columns else None
+            self.publish_estimations(
+                instance.take(plan).astype(np.float32)[np.newaxis], users)
+
+    def _grow_batch(self, size):
+        """Reallocate the current batch so it can hold size skeletons."""
+        batch = np.empty((size, self._batch.shape[1]), dtype=np.float32)
+        users = np.empty(size, dtype=np.int32)
+        batch[:self._batch_len] = self._batch[:self._batch_len]
+        users[:self._batch_len] = self._users[:self._batch_len]
+        self._batch = self._batches[0] = batch
+        self._users = self._batch_users[0] = users
+
+    def _add_to_batch(self, skeletons):
+        """
+        Unpack skeletons into the batch. Estimates the batch if it is full.
+
+        All the skeletons of a msg are added to the same batch (which grows
+        if needed), so they are estimated together.
+
+        @param skeletons: list of NiteSkeleton msgs
+        @note: Subscriber callbacks are called sequentially,
+            so the batch is always flushed before the next skeleton arrives
+        """
+        if not len(skeletons):
+            raise IndexError("Skeletons list is empty")
+        with self._batch_lock:
+            if self._batch_len + len(skeletons) > len(self._batch):
+                self._grow_batch(self._batch_len + len(skeletons))
+            for skeleton in skeletons:
+                self._unpack_skeleton_msg(skeleton,
+                                          out=self._batch[self._batch_len])
+                self._users[self._batch_len] = skeleton.user_id
+                self._batch_len += 1
+            is_full = self._batch_len >= self.batch_size
+        if is_full:
+            self.flush_batch()
+
+    def _batch_timer_cb(self, event):
+        """Estimate the waiting skeletons once batch_latency has elapsed."""
+        with eh(logger=logwarn, log_msg='Could not estimate pose. '):
+            self.flush_batch()
+
+    def flush_batch(self):
+        """
+        Estimate and publish all the skeletons waiting in the batch.
+
+        The node has two preallocated batches. While one of them is being
+        estimated, incoming skeletons are unpacked into the other one.
+        """
+        with self._flush_lock:
+            with self._batch_lock:
+                batch = self._batch[:self._batch_len]
+                users = self._users[:self._batch_len]
+                self._batches.reverse()
+                self._batch_users.reverse()
+                self._batch = self._batches[0]
+                self._users = self._batch_users[0]
+                self._batch_len = 0
+            if len(batch):
+                logdebug("Estimating a batch of {} skeletons"
+                         .format(len(batch)))
+                self.publish_estimations(batch, users)
 
     def get_dataset_info(self):
         """Service client to get the dataset information used for learning."""
@@ -124,6 +408,8 @@ class PoseEstimatorNode(object):
 
     def shutdown(self):
         """Close the node."""
+        if hasattr(self, 'gated_inferences') and self.motion_gated:
+            self.log_gating()
         rospy.loginfo('Shutting down ' + rospy.get_name() + ' node')
 
 
@@ -2,17 +2,27 @@
 
 from __future__ import (print_function, division)
 
+import os
+import time
 import itertools as it
-from functools import partial
+from functools import (partial, wraps)
 import numpy as np
 import pandas as pd
 
-from sklearn.grid_search import GridSearchCV
-from sklearn.metrics import f1_score
+from sklearn.base import clone
+try:
+    from sklearn.model_selection import (GridSearchCV, StratifiedKFold,
+                                         ParameterGrid)
+    _SCORING = {'scoring': 'f1_weighted'}
+except ImportError:     # scikit-learn < 0.18
+    from sklearn.grid_search import (GridSearchCV, ParameterGrid)
+    from sklearn.cross_validation import StratifiedKFold
+    from sklearn.metrics import f1_score
+    _SCORING = {'score_func': f1_score}
 
 from rospy_utils import load_class
 
-from PoseDatasetIO import PoseDatasetIO
+from PoseDatasetIO import (PoseDatasetIO, filename_with_extension)
 # import user_data_loader as udl
 
 HEADER = tuple(['h_seqNum', 'h_stamp', 'user_id'])
@@ -40,20 +50,175 @@ def _clean_prefix(text, prefix):
 _rm_stand_pref = partial(_clean_prefix, prefix='STAND_')
 
 
-def prepare_dataset(filename, group_name):
+class PoseStats(object):
+
+    """
+    Per pose counts, means and variances of a table read in chunks.
+
+    The statistics of each chunk are merged into the accumulated ones
+    with the pairwise update of Chan et al., so the whole table never
+    needs to be in memory.
+
+    Example:
+        >>> stats = PoseStats()
+        >>> for chunk in store.select('/table', chunksize=100000):
+        ...     stats.update(chunk)
+        >>> stats.mean()
+    """
+
+    def __init__(self, label='pose'):
+        """
+        Constructor.
+
+        @param label: name of the column with the pose labels
+        """
+        self.label = label
+        self.columns = None
+        self.counts = None
+        self.means = None
+        self.m2 = None      # Sum of squared deviations from the mean
+
+    def update(self, chunk):
+        """Add the rows of a L{pandas.DataFrame} to the statistics."""
+        grouped = chunk.groupby(self.label)
+        means = grouped.mean()
+        counts = grouped.count().reindex(columns=means.columns)
+        m2 = grouped.var(ddof=0).reindex(columns=means.columns) * counts
+        return self.merge(counts, means, m2.fillna(0))
+
+    def merge(self, counts, means, m2):
+        """
+        Merge partial statistics into the accumulated ones.
+
+        @param counts: non null values of each column, per pose
+        @param means: means of each column, per pose
+        @param m2: sum of squared deviations from the mean, per pose
+        @type counts, means, m2: pandas.DataFrame indexed by pose
+        """
+        if self.counts is None:
+            self.columns = means.columns
+            self.counts, self.means, self.m2 = counts, means, m2
+            return self
+        poses = self.counts.index.union(counts.index)
+
+        def align(df):
+            return df.reindex(index=poses, columns=self.columns).fillna(0)
+
+        n_a, mean_a, m2_a = map(align, (self.counts, self.means, self.m2))
+        n_b, mean_b, m2_b = map(align, (counts, means, m2))
+        n = n_a + n_b
+        delta = mean_b - mean_a
+        self.means = mean_a + delta * n_b / n
+        self.m2 = m2_a + m2_b + delta ** 2 * n_a * n_b / n
+        self.counts = n
+        return self
+
+    def mean(self):
+        """Return the mean of each column, per pose."""
+        return self.means
+
+    def var(self, ddof=1):
+        """Return the variance of each column, per pose."""
+        return self.m2 / (self.counts - ddof)
+
+
+def _table_stats(store, table, chunksize=None):
+    """Return the L{PoseStats} of a table of an open L{pandas.HDFStore}."""
+    stats = PoseStats()
+    if chunksize:
+        for chunk in store.select(table, chunksize=chunksize):
+            stats.update(chunk)
+    else:
+        stats.update(store.select(table))
+    return stats
+
+
+def _load_table_stats(filename, table, chunksize=None):
+    """Open filename read-only and return the L{PoseStats} of a table."""
+    with PoseDatasetIO(dataset=filename, columns=COLUMNS, mode='r') as dataset:
+        return _table_stats(dataset.store, table, chunksize)
+
+
+def _parallel_tables_stats(filename, tables, chunksize, n_jobs):
+    """
+    Return the L{PoseStats} of each table computed in a pool of processes.
+
+    @note: Each worker opens its own read-only handle of the file
+    @param tables: dict mapping the table names to their paths in the file
+    @param n_jobs: number of worker processes. If < 1, it uses one per CPU
+    """
+    from concurrent.futures import ProcessPoolExecutor
+    workers = min(n_jobs, len(tables)) if n_jobs > 0 else None
+    with ProcessPoolExecutor(max_workers=workers) as pool:
+        futures = {name: pool.submit(_load_table_stats,
+                                     filename, path, chunksize)
+                   for name, path in tables.iteritems()}
+        return {name: f.result() for name, f in futures.iteritems()}
+
+
+def prepare_dataset(filename, group_name, chunksize=None, variance=False,
+                    n_jobs=1):
     """
     Return dataset from filename.
 
     Loads the file filename and returns all the tables contained in the
     group 'group_name' in form of a unified dataset.
     Prior to returning it, the dataset is grouped by pose, to
+    obtain the mean instance of each pose.
+
+    @param chunksize: if set, tables are read in chunks of chunksize rows,
+        so memory usage is bounded regardless of the size of the tables
+    @param variance: if True, it also returns the variance of each pose
+    @param n_jobs: number of processes loading tables in parallel.
+        1 (default) loads them sequentially. If < 1, uses one per CPU.
+    @return: the dataset or, if variance is True,
+        a tuple (dataset, variances) with the same shape
     """
     with PoseDatasetIO(dataset=filename, columns=COLUMNS, mode='r') as dataset:
-        dataset = {node._v_name: dataset.store.select(node._v_pathname).
-                   groupby('pose').mean().
-                   rename(_rm_stand_pref)
-                   for node in dataset.store.get_node(group_name)}
-        return pd.concat(dataset)
+        if n_jobs == 1:
+            stats = {node._v_name: _table_stats(dataset.store,
+                                                node._v_pathname, chunksize)
+                     for node in dataset.store.get_node(group_name)}
+        else:
+            tables = {node._v_name: node._v_pathname
+                      for node in dataset.store.get_node(group_name)}
+    if n_jobs != 1:
+        stats = _parallel_tables_stats(dataset.dataset, tables,
+                                       chunksize, n_jobs)
+    means = pd.concat({name: s.mean().rename(_rm_stand_pref)
+                       for name, s in stats.iteritems()})
+    if not variance:
+        return means
+    variances = pd.concat({name: s.var().rename(_rm_stand_pref)
+                           for name, s in stats.iteritems()})
+    return means, variances
+
+
+def _prepare_dataset_version(filename, group_name, mtime, chunksize=None,
+                             variance=False, n_jobs=1):
+    """Call L{prepare_dataset}. mtime is only used as part of the cache key."""
+    return prepare_dataset(filename, group_name, chunksize=chunksize,
+                           variance=variance, n_jobs=n_jobs)
+
+
+def cached_prepare_dataset(cachedir):
+    """
+    Return L{prepare_dataset} memoized on disk with C{joblib.Memory}.
+
+    The cache is invalidated when the dataset file is modified.
+
+    @param cachedir: the directory where the prepared datasets are stored
+    @return: a function with the same signature of L{prepare_dataset}
+    """
+    from sklearn.externals import joblib
+    memory = joblib.Memory(cachedir, verbose=0)
+    cached = memory.cache(_prepare_dataset_version, ignore=['n_jobs'])
+
+    @wraps(prepare_dataset)
+    def prepare(filename, group_name, **kwargs):
+        mtime = os.path.getmtime(filename_with_extension(filename, '.h5'))
+        return cached(filename, group_name, mtime, **kwargs)
+    return prepare
 
 
 def drop_columns(dataset, cols=COLS_TO_CLEAN):
@@ -69,22 +234,230 @@ def drop_columns(dataset, cols=COLS_TO_CLEAN):
     return dataset.drop(cols, axis=1)
 
 
+def encode_labels(y):
+    """
+    Encode a vector of labels as integers.
+
+    @param y: the labels
+    @type y: array_like of shape (m,)
+    @return: a tuple (codes, labels) where labels are the sorted unique
+        labels of y and codes the position of each element of y in labels,
+        so that labels[codes] == y
+    """
+    labels, codes = np.unique(np.asarray(y), return_inverse=True)
+    return codes, labels
+
+
 def numerize_y(y):
     """Convert vector y to nums."""
-    labels = sorted(set(y))
-    return np.array(map(labels.index, y))
+    return encode_labels(y)[0]
 
 
 def df_to_Xy(dataframe):
     """Convert a dataframe to scikitlearn's compatible X and y format.
 
+    The labels are taken from the second level of the dataframe index
+    (See L{prepare_dataset}).
+
     @param dataframe: DataFrame to be converted to scikit-learn X,y format
     @type dataframe: pandas.DataFrame
-    @return: a tuple (X, y)
+    @return: a tuple (X, y, labels) where y are the label codes
+        and labels the vocabulary of the codes (See L{encode_labels})
     """
-    y = zip(*dataframe.index)[1]
-    y_num = numerize_y(y)
-    return (dataframe.values, y_num)
+    y, labels = encode_labels(dataframe.index.get_level_values(1))
+    return (dataframe.values, y, labels)
+
+
+def cv_folds(X, y, n_folds=3):
+    """
+    Return the stratified cross validation folds of a dataset.
+
+    Folds are computed once, so they can be shared by all the
+    candidates of a search (and by successive searches).
+
+    @return: list of (train_indices, test_indices) tuples
+    """
+    if hasattr(StratifiedKFold, 'split'):
+        return list(StratifiedKFold(n_splits=n_folds).split(X, y))
+    return list(StratifiedKFold(y, n_folds=n_folds))
+
+
+SEARCH_STRATEGIES = ('grid', 'random', 'halving')
+
+
+def _fit_and_score(estimator, params, X, y, train, test, scorer):
+    """Fit a clone of estimator with params. Return (score, fit time)."""
+    estimator = clone(estimator).set_params(**params)
+    start = time.time()
+    estimator.fit(X[train], y[train])
+    fit_time = time.time() - start
+    return scorer(estimator, X[test], y[test]), fit_time
+
+
+class HalvingSearch(object):
+
+    """
+    Successive halving search over the candidates of a param grid.
+
+    All the candidates are evaluated on the folds with a small amount of
+    resource. The best 1/factor of them are kept for the next iteration,
+    which uses factor times more resource, until one candidate is left
+    or the max resource is reached. The best candidate is then refitted
+    with the whole dataset and the max resource.
+
+    The resource is either 'n_samples' (the training samples of each fold)
+    or a hyperparameter of the estimator, like 'n_estimators'. In that case
+    its values in param_grid (where it must be) are removed from the
+    candidates and their min and max are used as the min and max resource.
+
+    It has the fitted attributes of L{GridSearchCV} used by this module:
+    C{best_estimator_}, C{best_params_}, C{best_score_} and C{cv_results_}
+    (one entry per candidate and iteration).
+    """
+
+    def __init__(self, estimator, param_grid, cv, resource='n_samples',
+                 factor=3, scoring=None, score_func=None, n_jobs=1,
+                 pre_dispatch='2*n_jobs', random_state=None):
+        """
+        Constructor.
+
+        @param cv: list of (train_indices, test_indices) (See L{cv_folds})
+        @param scoring: name of a scikit-learn scorer (E.g. 'f1_weighted')
+        @param score_func: score_func(y_true, y_pred). Used if no scoring.
+            Default: the mean accuracy of the estimator
+        @param random_state: seed of the samples used with less resource
+        """
+        self.estimator = estimator
+        self.param_grid = param_grid
+        self.cv = cv
+        self.resource = resource
+        self.factor = factor
+        self.scoring = scoring
+        self.score_func = score_func
+        self.n_jobs = n_jobs
+        self.pre_dispatch = pre_dispatch
+        self.random_state = random_state
+
+    def _scorer(self):
+        """Return a scorer(estimator, X, y)."""
+        if self.scoring:
+            from sklearn.metrics import get_scorer
+            return get_scorer(self.scoring)
+        if self.score_func:
+            return lambda est, X, y: self.score_func(y, est.predict(X))
+        return lambda est, X, y: est.score(X, y)
+
+    def _resources(self, n_candidates, n_samples):
+        """
+        Return the min and max resource and the num of iterations.
+
+        @param n_samples: training samples of the smallest fold
+        """
+        n_iters = 1
+        while self.factor ** (n_iters - 1) < n_candidates:
+            n_iters += 1
+        values = self.param_grid.get(self.resource)
+        if values:
+            return min(values), max(values), n_iters
+        return (max(1, n_samples // self.factor ** (n_iters - 1)),
+                n_samples, n_iters)
+
+    def fit(self, X, y):
+        """Run the search and refit the best candidate. Return self."""
+        from sklearn.externals.joblib import (Parallel, delayed)
+        if self.factor < 2:
+            raise ValueError("factor must be >= 2. Got {}"
+                             .format(self.factor))
+        if self.resource != 'n_samples' and \
+                self.resource not in self.param_grid:
+            raise ValueError("resource must be 'n_samples' or a param of "
+                             "param_grid. Got {}".format(self.resource))
+        X, y = np.asarray(X), np.asarray(y)
+        rnd = np.random.RandomState(self.random_state)
+        grid = dict(self.param_grid)
+        grid.pop(self.resource, None)
+        candidates = list(ParameterGrid(grid))
+        folds = [(rnd.permutation(train), test) for train, test in self.cv]
+        min_r, max_r, n_iters = self._resources(
+            len(candidates), min(len(train) for train, _ in folds))
+        scorer = self._scorer()
+        results = {'params': [], 'iter': [], 'n_resources': [],
+                   'mean_fit_time': [], 'std_fit_time': [],
+                   'mean_test_score': []}
+        for i in xrange(n_iters):
+            n_resources = int(min(max_r, min_r * self.factor ** i))
+            if self.resource == 'n_samples':
+                jobs = [(c, train[:n_resources], test) for c in candidates
+                        for train, test in folds]
+            else:
+                jobs = [(dict(c, **{self.resource: n_resources}),
+                         train, test)
+                        for c in candidates for train, test in folds]
+            scores = Parallel(n_jobs=self.n_jobs,
+                              pre_dispatch=self.pre_dispatch)(
+                delayed(_fit_and_score)(self.estimator, params, X, y,
+                                        train, test, scorer)
+                for params, train, test in jobs)
+            scores = np.array(scores).reshape(len(candidates), len(folds), 2)
+            mean_scores = scores[:, :, 0].mean(axis=1)
+            results['params'].extend(candidates)
+            results['iter'].extend([i] * len(candidates))
+            results['n_resources'].extend([n_resources] * len(candidates))
+            results['mean_fit_time'].extend(scores[:, :, 1].mean(axis=1))
+            results['std_fit_time'].extend(scores[:, :, 1].std(axis=1))
+            results['mean_test_score'].extend(mean_scores)
+            best = np.argsort(-mean_scores, kind='mergesort')
+            self.best_score_ = mean_scores[best[0]]
+            if len(candidates) == 1 or n_resources >= max_r:
+                candidates = [candidates[best[0]]]
+                break
+            n_kept = -(-len(candidates) // self.factor)     # ceil
+            candidates = [candidates[c] for c in best[:n_kept]]
+        self.cv_results_ = {k: np.asarray(v) if k != 'params' else v
+                            for k, v in results.iteritems()}
+        self.best_params_ = candidates[0]
+        params = dict(self.best_params_)
+        if self.resource != 'n_samples':
+            params[self.resource] = max_r
+        self.best_estimator_ = clone(self.estimator).set_params(**params)
+        self.best_estimator_.fit(X, y)
+        return self
+
+    @property
+    def classes_(self):
+        return self.best_estimator_.classes_
+
+    def predict(self, X):
+        """Predict with the best estimator."""
+        return self.best_estimator_.predict(X)
+
+    def predict_proba(self, X):
+        """Return the probabilities of the best estimator."""
+        return self.best_estimator_.predict_proba(X)
+
+
+def _build_search(strategy, estimator, param_grid, **kwargs):
+    """
+    Return the hyperparameter search of a strategy (See L{fit_clf}).
+
+    @raise ValueError: if the strategy is unknown
+    """
+    if strategy not in SEARCH_STRATEGIES:
+        raise ValueError("Unknown search strategy '{}'. Expected one of {}"
+                         .format(strategy, SEARCH_STRATEGIES))
+    n_iter = kwargs.pop('n_iter', 10)
+    factor = kwargs.pop('factor', 3)
+    resource = kwargs.pop('resource', 'n_samples')
+    random_state = kwargs.pop('random_state', None)
+    if strategy == 'grid':
+        return GridSearchCV(estimator, param_grid, **kwargs)
+    if strategy == 'random':
+        from sklearn.model_selection import RandomizedSearchCV
+        return RandomizedSearchCV(estimator, param_grid, n_iter=n_iter,
+                                  random_state=random_state, **kwargs)
+    return HalvingSearch(estimator, param_grid, factor=factor,
+                         resource=resource, random_state=random_state,
+                         **kwargs)
 
 
 def fit_clf(X, y, **kwargs):
@@ -102,39 +475,107 @@ def fit_clf(X, y, **kwargs):
     @type estimator: string
     @keyword param_grid: hyperparameters of the model to be optimized
     @type param_grid: dict
+    @keyword search: strategy of the hyperparameter search (Default 'grid'):
+        - 'grid': tries all the candidates of param_grid.
+        - 'random': tries n_iter candidates sampled from param_grid.
+        - 'halving': successive halving. Tries all the candidates with a
+          small amount of resource and keeps the best 1/factor of them
+          for the next iteration, which uses factor times more resource.
+    @keyword n_iter: num of candidates of the 'random' search (Default 10)
+    @keyword resource: resource of the 'halving' search. Either
+        'n_samples' (Default) or an estimator hyperparameter like
+        'n_estimators' (num of trees)
+    @keyword factor: elimination rate of the 'halving' search (Default 3)
+    @keyword random_state: seed of the 'random' and 'halving' searches
+    @keyword cv: num of cross validation folds (Default 3)
+                 or a list of precomputed folds (See L{cv_folds})
+    @keyword n_jobs: num of jobs that evaluate candidates in parallel.
+                     Default 1. -1 uses all CPUs.
+    @keyword pre_dispatch: num of jobs dispatched at once (Default '2*n_jobs')
     @return: the classifier already fitted to the input data
+    @note: the 'random' search needs scikit-learn >= 0.18.
+        The 'halving' search is a L{HalvingSearch}
     """
     estimator = kwargs.get('estimator', __get_default_classifier())
-    if kwargs['param_grid']:
-        estimator = GridSearchCV(estimator, kwargs['param_grid'],
-                                 cv=3, score_func=f1_score)
+    if kwargs.get('param_grid'):
+        folds = kwargs.get('cv', 3)
+        if isinstance(folds, int):
+            folds = cv_folds(X, y, folds)
+        search_kwargs = {'cv': folds,
+                         'n_jobs': kwargs.get('n_jobs', 1),
+                         'pre_dispatch': kwargs.get('pre_dispatch',
+                                                    '2*n_jobs')}
+        search_kwargs.update(_SCORING)
+        for key in ('n_iter', 'resource', 'factor', 'random_state'):
+            if key in kwargs:
+                search_kwargs[key] = kwargs[key]
+        estimator = _build_search(kwargs.get('search', 'grid'), estimator,
+                                  kwargs['param_grid'], **search_kwargs)
     estimator.fit(X, y)
     return estimator
 
 
+def fit_time_report(search):
+    """
+    Return the fit time and test score of each candidate of a fitted search.
+
+    @param search: a fitted hyperparameter search (E.g. L{GridSearchCV})
+    @return: DataFrame with the params, mean and std fit time (in seconds)
+        and mean test score of each candidate, sorted by mean fit time
+    @raise AttributeError: if the search did not record fit times
+        (scikit-learn < 0.18)
+    """
+    results = search.cv_results_
+    report = pd.DataFrame({'params': map(str, results['params']),
+                           'mean_fit_time': results['mean_fit_time'],
+                           'std_fit_time': results['std_fit_time'],
+                           'mean_test_score': results['mean_test_score']},
+                          columns=['params', 'mean_fit_time', 'std_fit_time',
+                                   'mean_test_score'])
+    return report.sort_values('mean_fit_time', ascending=False)
+
+
 def __get_default_classifier():
     """Return default classifier."""
     clf = load_class('sklearn.ensemble.RandomForestClassifier')
     return clf(oob_score=True)
 
 
-def save_clf(classifier, filename):
+def save_clf(classifier, filename, labels=None, compress=0):
     """Save a classifier to a file.
 
+    By default the classifier is saved uncompressed, so that its arrays
+    can be memory-mapped when loading it (See L{load_clf}).
+
     @param classifier: the classifier
     @param filename: the path where to save the classifier
+    @param labels: (Optional) the label names of the classes of the
+        classifier (See L{df_to_Xy}). Saved as its C{labels_} attribute
+    @param compress: compression level from 0 (Default) to 9.
+        Compressed classifiers can not be memory-mapped.
     """
     from sklearn.externals import joblib
-    joblib.dump(classifier, filename, compress=9)
+    if labels is not None:
+        classifier.labels_ = list(labels)
+    joblib.dump(classifier, filename, compress=compress)
 
 
-def load_clf(filename):
+def load_clf(filename, mmap_mode=None):
     """
     Load a classifier from a file.
 
+    Memory-mapping the arrays (mmap_mode='r') avoids reading them into
+    an intermediate copy, but the trees of sklearn forests still copy
+    their arrays into private memory when unpickled, so processes
+    loading the same file do not share them (See
+    benchmarks/bench_clf_io.py).
+
     @param filename: file path where to load the classifier
+    @param mmap_mode: memory-map mode of the arrays of the classifier.
+        None (Default) loads them in memory. Ignored if the file is
+        compressed.
     @return: the loaded classifier.
     """
     from sklearn.externals import joblib
-    loaded_model = joblib.load(filename)
+    loaded_model = joblib.load(filename, mmap_mode=mmap_mode)
     return loaded_model
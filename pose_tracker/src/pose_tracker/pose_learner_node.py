@@ -3,9 +3,11 @@
 import roslib
 roslib.load_manifest('pose_tracker')
 import rospy
-from rospy import (logerr, logfatal)
+from rospy import (loginfo, logwarn, logerr, logfatal)
 from std_msgs.msg import String
 
+import time
+
 import param_utils as pu
 from func_utils import load_class
 import pose_learner as pl
@@ -15,6 +17,29 @@ DEFAULT_NAME = 'pose_learner'
 PARAMS = ('dataset_file', 'table_name', 'algorithm', 'parameter_grid',
           'out_file', 'drop_columns')
 
+# Optional params and their default values.
+# chunksize: rows read at once from each dataset table. 0 reads whole tables
+# load_jobs: processes loading dataset tables in parallel. < 1 uses all CPUs
+# cache_dir: dir where prepared datasets are cached. Empty disables cache
+# n_jobs: jobs evaluating the hyperparameter candidates. -1 uses all CPUs
+# pre_dispatch: jobs dispatched at once during the hyperparameter search
+# cv_folds: num of cross validation folds
+# fit_report_file: CSV file where the fit time of each candidate is saved
+# search_strategy: hyperparameter search. 'grid', 'random' or 'halving'
+# n_iter: num of candidates tried by the 'random' search
+# halving_resource: resource of the 'halving' search. 'n_samples' or a
+#                   hyperparameter of the algorithm (E.g. 'n_estimators')
+# halving_factor: the 'halving' search keeps 1/factor of the candidates
+#                 at each iteration
+# random_state: seed of the 'random' and 'halving' searches. None: random
+# compress: compression level (0-9) of out_file. 0 allows memory-mapping it
+OPTIONAL_PARAMS = {'chunksize': 0, 'load_jobs': 1, 'cache_dir': '',
+                   'n_jobs': 1, 'pre_dispatch': '2*n_jobs', 'cv_folds': 3,
+                   'fit_report_file': '', 'search_strategy': 'grid',
+                   'n_iter': 10, 'halving_resource': 'n_samples',
+                   'halving_factor': 3, 'random_state': None,
+                   'compress': 0}
+
 
 class PoseLearnerNode():
 
@@ -29,15 +54,17 @@ class PoseLearnerNode():
         rospy.on_shutdown(self.shutdown)
         rospy.loginfo("Initializing " + self.node_name + " node...")
 
+        self.ready_pub = rospy.Publisher('~classifier_ready', String)
+
         with eh(logger=logfatal, action=self.shutdown, reraise=True):
             self.load_parameters()
-            self.classif = load_class(self.algorithm)()
+            self.estimator = load_class(self.algorithm)()
+            self.classif = self.estimator
             rospy.loginfo("Classifier loaded: {}".format(self.classif))
             self.load_dataset(self.dataset_file, self.table_name)
             self.fit().save_clf()
 
         rospy.Subscriber("~learn_this", String, self._learn_dataset_cb)
-        self.ready_pub = rospy.Publisher('~classifier_ready', String)
 
     def load_parameters(self):
         """
@@ -53,6 +80,11 @@ class PoseLearnerNode():
         except:
             logerr("Couldn't load Parameters: {}".format(list(params)))
             raise
+        for pname, default in OPTIONAL_PARAMS.iteritems():
+            setattr(self, pname, rospy.get_param('~' + pname, default))
+        self._prepare_dataset = pl.prepare_dataset
+        if self.cache_dir:
+            self._prepare_dataset = pl.cached_prepare_dataset(self.cache_dir)
 
     def _learn_dataset_cb(self, dataset_file):
         """Callback to learn dataset."""
@@ -65,21 +97,47 @@ class PoseLearnerNode():
         """Load dataset from filename."""
         with eh(logger=logerr, errors=IOError, reraise=True,
                 log_msg="Couldn't load dataset {}".format(filename)):
-            self.dataset = pl.prepare_dataset(filename, table_name) \
+            self.dataset = self._prepare_dataset(filename, table_name,
+                                                 chunksize=self.chunksize,
+                                                 n_jobs=self.load_jobs) \
                 .drop(self.drop_columns, axis=1)
         return self
 
     def fit(self):
         """Fit the classifier to the dataset data."""
-        X, y = pl.df_to_Xy(self.dataset)
+        X, y, self.labels = pl.df_to_Xy(self.dataset)
+        start = time.time()
         self.classif = pl.fit_clf(X, y,
                                   param_grid=self.parameter_grid,
-                                  estimator=self.classif)
+                                  estimator=self.estimator,
+                                  search=self.search_strategy,
+                                  n_iter=self.n_iter,
+                                  resource=self.halving_resource,
+                                  factor=self.halving_factor,
+                                  random_state=self.random_state,
+                                  cv=pl.cv_folds(X, y, self.cv_folds),
+                                  n_jobs=self.n_jobs,
+                                  pre_dispatch=self.pre_dispatch)
+        loginfo("Classifier fitted with {} search in {:.2f} s"
+                .format(self.search_strategy, time.time() - start))
+        self.report_fit_times()
+        return self
+
+    def report_fit_times(self):
+        """Log (and save if fit_report_file is set) fit time per candidate."""
+        with eh(logger=logwarn, errors=AttributeError,
+                log_msg="Fit times not reported. "):
+            report = pl.fit_time_report(self.classif)
+            loginfo("Fit time per candidate (s):\n{}"
+                    .format(report.to_string(index=False)))
+            if self.fit_report_file:
+                report.to_csv(self.fit_report_file, index=False)
         return self
 
     def save_clf(self):
         """Save the best estimator to a file."""
-        pl.save_clf(self.classif.best_estimator_, self.out_file)
+        pl.save_clf(self.classif.best_estimator_, self.out_file,
+                    labels=self.labels, compress=self.compress)
         self.ready_pub.publish(self.out_file)
         rospy.loginfo("Classifier saved to: {}".format(self.out_file))
         return self
@@ -0,0 +1,280 @@
+#!/usr/bin/env python
+"""
+In-process pipeline of the pose tracking stages.
+
+It chains, within a single process, the logic of the nodes that a skeleton
+goes through in the ROS graph:
+
+    - L{InstanceStage}: InstanceBuilderNode (skeleton msg -> instance)
+    - L{AveragerStage}: InstanceAveragerNode (averaged instance)
+    - L{VelocityStage}: JointVelocitiesPublisher (joint velocities)
+    - L{DetectorStage}: PoseDetectorNode (user stops / starts moving)
+    - L{EstimatorStage}: PoseEstimatorNode (estimated pose)
+
+Each skeleton msg becomes a L{Frame} that is passed through the stages,
+which store their results in it as numpy arrays. Arrays are passed by
+reference: no msgs are built nor serialized between the stages, and the
+columns of the instances are only resolved again when they change::
+
+    pipeline = Pipeline([InstanceStage(KinectIBuilder()),
+                         VelocityStage(VelocityWindow(30)),
+                         DetectorStage(30, ConsecutiveCounter(0.5))])
+    frame = pipeline.process(skeletons_msg)
+    if frame.event == STILL:
+        ...
+
+Stages skip the frames that lack their input (e.g. the velocities if the
+velocities are not computed), so any subset of them can be chained as long
+as they keep the order above. Arrays of a frame may be reused by its
+stages for the next frame, so they must be copied to be kept.
+"""
+import numpy as np
+
+from pose_detector.pose_detector_node import (below_threshold,
+                                              above_threshold)
+from pose_tracker.pose_estimator_node import (column_plan, instance_plan)
+
+# Events of L{DetectorStage}
+STILL = 'still'     # The user stopped moving
+MOVING = 'moving'   # The user started moving
+
+
+class Frame(object):
+
+    """Results of the stages of the pipeline for a skeleton msg."""
+
+    __slots__ = ('msg', 'instance', 'columns', 'averaged', 'velocities',
+                 'event', 'pose', 'estimated', 'label_id', 'probas')
+
+    def __init__(self, msg):
+        """
+        Constructor.
+
+        @param msg: the skeleton msg of the frame
+        """
+        self.msg = msg
+        self.instance = None    # Instance of the skeleton
+        self.columns = None     # Columns of instance, averaged and velocities
+        self.averaged = None    # Instance averaged with the previous ones
+        self.velocities = None  # Velocities of the columns
+        self.event = None       # L{STILL}, L{MOVING} or None (no change)
+        self.pose = None        # Pose of the user when it stops (STILL)
+        self.estimated = None   # Instance fed to the estimator
+        self.label_id = None    # Estimated label id
+        self.probas = None      # Probabilities of each label
+
+
+class InstanceStage(object):
+
+    """Unpack the instance of a skeleton msg with an instance builder."""
+
+    name = 'instance'
+
+    def __init__(self, builder):
+        """
+        Constructor.
+
+        @param builder: the instance builder of the skeleton msgs
+            (See C{instance_builder.IBuilder.unpack})
+        """
+        self.builder = builder
+
+    def process(self, frame):
+        """
+        Set the instance and columns of the frame.
+
+        @raise TypeError: if the builder can not unpack the frame msg
+        """
+        frame.instance, frame.columns = self.builder.unpack(frame.msg)
+        return frame
+
+
+class AveragerStage(object):
+
+    """Average the instances with a sliding aggregate."""
+
+    name = 'averager'
+
+    def __init__(self, aggregate):
+        """
+        Constructor.
+
+        @param aggregate: the aggregate of the last instances
+        @type aggregate: L{pose_detector.running_aggregates.SlidingAggregate}
+        """
+        self.aggregate = aggregate
+
+    def process(self, frame):
+        """
+        Set the averaged instance of the frame.
+
+        @raise ValueError: if the instance width differs from the window one
+        """
+        if frame.instance is not None:
+            self.aggregate.update(frame.instance, columns=frame.columns)
+            frame.averaged = self.aggregate.value()
+        return frame
+
+
+class VelocityStage(object):
+
+    """Calculate the velocities of the instances."""
+
+    name = 'velocity'
+
+    def __init__(self, window):
+        """
+        Constructor.
+
+        @param window: the window of the last instances
+        @type window: L{pose_detector.velocity_estimators.VelocityWindow}
+        """
+        self.window = window
+        self.restarts = 0   # Times the window was restarted by old instances
+
+    def process(self, frame):
+        """
+        Set the velocities of the frame.
+
+        @raise ValueError: if the instance width differs from the window one
+        """
+        if frame.instance is None:
+            return frame
+        if self.window.columns is None:
+            self.window.allocate(frame.columns)
+        if self.window.add(frame.instance):
+            self.restarts += 1
+        frame.velocities = self.window.velocities()
+        return frame
+
+
+class DetectorStage(object):
+
+    """
+    Detect when the user stops and starts moving.
+
+    As PoseDetectorNode, it starts looking for the user to stop. The user
+    stops (L{STILL}) once the speeds of all the participating columns have
+    been below their thresholds for dflen consecutive velocities, and starts
+    moving (L{MOVING}) once all have been above them.
+    """
+
+    name = 'detector'
+
+    def __init__(self, dflen, counter, pose_source='instance'):
+        """
+        Constructor.
+
+        @param dflen: num of consecutive velocities needed to change state
+        @param counter: the counter of consecutive velocities
+        @type counter: L{pose_detector.pose_detector_node.ConsecutiveCounter}
+        @param pose_source: frame attribute set as the pose of the user
+            when it stops: 'instance' or 'averaged'
+        """
+        self.dflen = dflen
+        self.counter = counter
+        self.pose_source = pose_source
+        self.moving = True
+
+    @property
+    def condition(self):
+        """Per column condition that changes the state of the user."""
+        return below_threshold if self.moving else above_threshold
+
+    def process(self, frame):
+        """Set the event (and pose, if the user stops) of the frame."""
+        if frame.velocities is None:
+            return frame
+        counts = self.counter.count(frame.velocities, frame.columns,
+                                    self.condition)
+        if counts.min() >= self.dflen:
+            self.moving = not self.moving
+            self.counter.reset()
+            frame.event = MOVING if self.moving else STILL
+            if frame.event == STILL:
+                frame.pose = getattr(frame, self.pose_source)
+        return frame
+
+
+class EstimatorStage(object):
+
+    """Estimate the pose of an instance of the frame."""
+
+    name = 'estimator'
+
+    def __init__(self, estimator, dataset_columns, drop_columns,
+                 source='instance'):
+        """
+        Constructor.
+
+        @param estimator: the classifier (See C{pose_learner.load_clf})
+        @param dataset_columns: the columns of the dataset used to train it
+        @param drop_columns: the columns not used to train it
+        @param source: frame attribute that is estimated: 'instance',
+            'averaged' or 'pose' (only estimated when the user stops)
+        """
+        self.estimator = estimator
+        self.dataset_columns = dataset_columns
+        self.plan = column_plan(dataset_columns, drop_columns)
+        self.source = source
+        self.estimations = 0
+        self.skipped = 0    # Frames without source
+        self._columns = None        # Columns of the cached instance plan
+        self._instance_plan = None
+
+    def process(self, frame):
+        """
+        Set the estimated instance, label_id and probas of the frame.
+
+        @raise ValueError: if the instance lacks columns of the estimator
+        """
+        instance = getattr(frame, self.source)
+        if instance is None:
+            self.skipped += 1
+            return frame
+        if frame.columns is not self._columns:
+            self._instance_plan = instance_plan(
+                frame.columns, self.dataset_columns, self.plan)
+            self._columns = frame.columns
+        frame.estimated = instance.take(self._instance_plan) \
+            .astype(np.float32)[np.newaxis]
+        probas = self.estimator.predict_proba(frame.estimated)
+        frame.probas = probas[0]
+        frame.label_id = self.estimator.classes_[probas[0].argmax()]
+        frame.estimated = frame.estimated[0]
+        self.estimations += 1
+        return frame
+
+
+class Pipeline(object):
+
+    """Chain of stages that processes skeleton msgs in a single process."""
+
+    def __init__(self, stages, latency_monitor=None):
+        """
+        Constructor.
+
+        @param stages: the stages, in processing order
+        @param latency_monitor: if set, the latency of each stage is
+            recorded with its name (See L{LatencyMonitor})
+        """
+        self.stages = list(stages)
+        self.latency_monitor = latency_monitor
+
+    def process(self, msg):
+        """
+        Pass a skeleton msg through all the stages.
+
+        @return: the L{Frame} of the msg
+        @raise TypeError, ValueError: if a stage can not process the frame.
+            The stages after it are not run.
+        """
+        frame = Frame(msg)
+        if self.latency_monitor is None:
+            for stage in self.stages:
+                stage.process(frame)
+            return frame
+        for stage in self.stages:
+            with self.latency_monitor.timer(stage.name):
+                stage.process(frame)
+        return frame
@@ -0,0 +1,262 @@
+#!/usr/bin/env python
+"""
+Node that runs the whole pose tracking pipeline in a single process.
+
+It replaces InstanceBuilderNode, InstanceAveragerNode,
+JointVelocitiesPublisher, PoseDetectorNode and PoseEstimatorNode with a
+L{Pipeline} of their stages, so skeletons are not serialized between them.
+It subscribes and publishes the same external topics as those nodes:
+
+    - Subscribes: <skeleton_topic>, pose_label
+    - Publishes: pose_instance, averaged_pose, /joint_velocities,
+      is_user_moving, user_pose, user_moving and pose_estimated
+
+The intermediate topics (pose_instance, averaged_pose and
+/joint_velocities) are only built and published if they have subscribers.
+"""
+import roslib
+roslib.load_manifest('pose_tracker')
+import rospy
+from rospy import (loginfo, logwarn, logfatal)
+
+from func_utils import error_handler as eh
+from func_utils import load_class
+from param_utils import load_params
+import pose_tracker.pose_learner as pl
+from latency_monitor import (LatencyMonitor, timed_callback)
+from column_schema import SchemaPublisher
+from pose_tracker.pose_pipeline import (Pipeline, InstanceStage,
+                                        AveragerStage, VelocityStage,
+                                        DetectorStage, EstimatorStage,
+                                        STILL, MOVING)
+from pose_detector.instance_averager_node import METHODS
+from pose_detector.running_aggregates import SlidingAggregate
+from pose_detector.velocity_estimators import VelocityWindow
+from pose_detector.pose_detector_node import ConsecutiveCounter
+
+from pose_msgs.msg import (PoseInstance, JointVelocities, PoseEstimated)
+from std_msgs.msg import (Bool, String)
+
+_DEFAULT_NAME = 'pose_pipeline'
+_NODE_PARAMS = ['builder_type', 'skeleton_topic', 'num_instances',
+                'dataframe_length', 'movement_threshold']
+_ESTIMATOR_PARAMS = ['estimator_file', 'dataset_columns', 'drop_columns']
+
+# Optional params (and their default values) of the node
+# averager_method: one of instance_averager_node.METHODS. Empty: no averaging
+# velocity_estimator, time_source, savgol_order: See JointVelocitiesPublisher
+# joint_thresholds, ignored_columns, hysteresis: See PoseDetectorNode
+# user_pose_source: instance published to user_pose: 'instance' or 'averaged'
+# estimate_poses: if False, the estimator is not loaded
+# labels, mmap_mode: See PoseEstimatorNode
+# motion_gated: If True, only estimates the user_pose of each stillness
+#               episode. Otherwise, the instance of each skeleton
+OPTIONAL_PARAMS = {'averager_method': 'mean',
+                   'velocity_estimator': 'difference',
+                   'time_source': 'stamp',
+                   'savgol_order': 2,
+                   'joint_thresholds': {},
+                   'ignored_columns': ['user_id', 'stamp', '*confidence'],
+                   'hysteresis': 0.0,
+                   'user_pose_source': 'instance',
+                   'estimate_poses': True,
+                   'labels': None,
+                   'mmap_mode': '',
+                   'motion_gated': False}
+USER_POSE_SOURCES = ('instance', 'averaged')
+
+
+class PosePipelineNode(object):
+
+    """
+    Node that builds, averages, detects and estimates poses in one process.
+
+    See L{pose_tracker.pose_pipeline} for the stages of the pipeline.
+    """
+
+    def __init__(self, **kwargs):
+        """
+        Constructor.
+
+        @keyword node_name: The name of the node.
+        """
+        name = kwargs.get('node_name', _DEFAULT_NAME)
+        rospy.init_node(name)
+        self.node_name = rospy.get_name()
+        rospy.on_shutdown(self.shutdown)
+        loginfo("Initializing " + self.node_name + " node...")
+        self.latency_monitor = LatencyMonitor.from_params()
+
+        with eh(logger=logfatal, log_msg="Couldn't load parameters",
+                action=self.shutdown, reraise=True):
+            (self.builder_type, self.skel_topic, self.num_instances,
+             self.dflen, self.threshold) = load_params(_NODE_PARAMS)
+            for pname, default in OPTIONAL_PARAMS.iteritems():
+                setattr(self, pname, rospy.get_param('~' + pname, default))
+            if self.user_pose_source not in USER_POSE_SOURCES:
+                raise ValueError("Invalid user_pose_source: {}. Use one of {}"
+                                 .format(self.user_pose_source,
+                                         USER_POSE_SOURCES))
+            self.pipeline = Pipeline(self.build_stages(),
+                                     self.latency_monitor)
+        loginfo("Pipeline stages: {}"
+                .format(', '.join(s.name for s in self.pipeline.stages)))
+        self.label = ''
+
+        # Publishers
+        self.instance_pub = rospy.Publisher('pose_instance', PoseInstance)
+        self.averaged_pub = rospy.Publisher('averaged_pose', PoseInstance)
+        self.velocities_pub = rospy.Publisher('/joint_velocities',
+                                              JointVelocities)
+        self.is_moving_pub = rospy.Publisher('is_user_moving', Bool,
+                                             latch=True)
+        self.pose_pub = rospy.Publisher('user_pose', PoseInstance, latch=True)
+        self.moving_pub = rospy.Publisher('user_moving', JointVelocities,
+                                          latch=True)
+        self.estimated_pub = rospy.Publisher('pose_estimated', PoseEstimated)
+        self.instance_schema = SchemaPublisher('pose_instance')
+        self.averaged_schema = SchemaPublisher('averaged_pose')
+        self.velocities_schema = SchemaPublisher('/joint_velocities')
+        self.pose_schema = SchemaPublisher('user_pose')
+        self.moving_schema = SchemaPublisher('user_moving')
+        self._user_column = (None, None)    # (columns, position of user_id)
+
+        # Subscribers
+        rospy.Subscriber(self.skel_topic, self.builder.get_msg_class(),
+                         self.skel_cb)
+        loginfo("Subscribed to topic {}".format(self.skel_topic))
+        rospy.Subscriber('pose_label', String, self.label_cb)
+
+    def build_stages(self):
+        """
+        Return the stages of the pipeline configured with the node params.
+
+        @raise KeyError, ValueError: if some param is not valid
+        """
+        self.builder = load_class(self.builder_type)()
+        loginfo("Using Instance Builder: {}".format(self.builder_type))
+        stages = [InstanceStage(self.builder)]
+        if self.averager_method:
+            stages.append(AveragerStage(
+                SlidingAggregate(METHODS[self.averager_method](self.dflen))))
+        elif self.user_pose_source == 'averaged':
+            raise ValueError("user_pose_source is 'averaged' "
+                             "but averager_method is empty")
+        stages.append(VelocityStage(VelocityWindow(
+            self.num_instances, self.velocity_estimator, self.time_source,
+            self.savgol_order, clock=rospy.get_time)))
+        stages.append(DetectorStage(
+            self.dflen, ConsecutiveCounter(self.threshold,
+                                           self.joint_thresholds,
+                                           self.ignored_columns,
+                                           self.hysteresis),
+            self.user_pose_source))
+        self.estimator = None
+        if self.estimate_poses:
+            stages.append(self.build_estimator_stage())
+        return stages
+
+    def build_estimator_stage(self):
+        """
+        Load the estimator and return its stage.
+
+        @raise ValueError: if there are no label names for the estimator
+        """
+        estimator_file, dataset_columns, drop_columns = \
+            load_params(_ESTIMATOR_PARAMS)
+        self.estimator = pl.load_clf(estimator_file,
+                                     mmap_mode=self.mmap_mode or None)
+        self.labels = getattr(self.estimator, 'labels_', self.labels)
+        if self.labels is None:
+            raise ValueError("Estimator {} has no labels. Set ~labels param"
+                             .format(estimator_file))
+        source = 'pose' if self.motion_gated else 'instance'
+        if self.motion_gated:
+            loginfo("Estimating poses only when the user stops moving")
+        return EstimatorStage(self.estimator, dataset_columns, drop_columns,
+                              source)
+
+    @timed_callback()
+    def skel_cb(self, msg):
+        """Callback for skeleton msgs. Run the pipeline and publish."""
+        try:
+            frame = self.pipeline.process(msg)
+        except (TypeError, ValueError) as e:
+            logwarn("Skeleton discarded. Reason: {}".format(e))
+            return
+        self.publish(frame)
+
+    def label_cb(self, label):
+        """Store the received label."""
+        self.label = label.data
+
+    def publish(self, frame):
+        """Publish the results of a L{Frame}."""
+        if frame.instance is not None and \
+                self.instance_pub.get_num_connections():
+            msg = PoseInstance(label=self.label,
+                               instance=frame.instance.tolist())
+            self.instance_schema.stamp(msg, frame.columns)
+            self.instance_pub.publish(msg)
+        if frame.averaged is not None and \
+                self.averaged_pub.get_num_connections():
+            msg = PoseInstance(instance=frame.averaged.tolist())
+            self.averaged_schema.stamp(msg, frame.columns)
+            self.averaged_pub.publish(msg)
+        if frame.velocities is not None and \
+                self.velocities_pub.get_num_connections():
+            msg = JointVelocities(velocities=frame.velocities.tolist())
+            self.velocities_schema.stamp(msg, frame.columns)
+            self.velocities_pub.publish(msg)
+        if frame.event == STILL:
+            msg = PoseInstance(instance=frame.pose.tolist())
+            self.pose_pub.publish(self.pose_schema.stamp(msg, frame.columns))
+            self.is_moving_pub.publish(Bool(False))
+        elif frame.event == MOVING:
+            msg = JointVelocities(velocities=frame.velocities.tolist())
+            self.moving_pub.publish(self.moving_schema.stamp(msg,
+                                                             frame.columns))
+            self.is_moving_pub.publish(Bool(True))
+        if frame.label_id is not None:
+            self.estimated_pub.publish(self._build_pose_estimated_msg(frame))
+
+    def _user_id(self, frame):
+        """Return the user_id of the instance of a frame (0 if unknown)."""
+        columns, position = self._user_column
+        if frame.columns is not columns:
+            position = frame.columns.index('user_id') \
+                if 'user_id' in frame.columns else None
+            self._user_column = (frame.columns, position)
+        return 0 if position is None else int(frame.instance[position])
+
+    def _build_pose_estimated_msg(self, frame):
+        """Build a L{PoseEstimated} message from an estimated frame."""
+        epose = PoseEstimated()
+        epose.raw_instance = frame.estimated
+        epose.predicted_label_id = frame.label_id
+        epose.predicted_label = self.labels[frame.label_id]
+        epose.label_names = self.labels
+        epose.label_probas = frame.probas
+        epose.user_id = self._user_id(frame)
+        return epose
+
+    def run(self):
+        """Run the node until shutdown."""
+        rospy.spin()
+
+    def shutdown(self):
+        """Close the node."""
+        pipeline = getattr(self, 'pipeline', None)
+        if pipeline and isinstance(pipeline.stages[-1], EstimatorStage):
+            stage = pipeline.stages[-1]
+            loginfo("{} poses estimated, {} skipped"
+                    .format(stage.estimations, stage.skipped))
+        loginfo('Shutting down ' + rospy.get_name() + ' node.')
+
+
+if __name__ == '__main__':
+    try:
+        node = PosePipelineNode()
+        node.run()
+    except rospy.ROSInterruptException:
+        pass
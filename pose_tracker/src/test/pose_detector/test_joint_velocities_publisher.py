@@ -15,6 +15,7 @@ import numpy as np
 import pandas as pd
 
 from pose_msgs.msg import (PoseInstance, JointVelocities)
+from column_schema import SchemaCache
 
 
 # import numpy.testing 
@@ -26,6 +27,7 @@ class TestJointVelocitiesPublisher(unittest.TestCase):
         super(TestJointVelocitiesPublisher, self).__init__(*args)
         name = 'test_joint_velocities_publisher'
         rospy.init_node(name)
+        self.velocity_schemas = SchemaCache('/joint_velocities')
                     
     def setUp(self):
         self.instances = pd.DataFrame(np.linspace(1,20,20).reshape(4,5),
@@ -41,11 +43,11 @@ class TestJointVelocitiesPublisher(unittest.TestCase):
 
     # @unittest.skip('Skipped')
     def test_publishes_velocities_when_receives_instances(self):
-        # Pre-computed velocities
+        # Pre-computed velocities (per instance: time_source is 'frames')
         expected_velocities = {1: np.array([0]*5),
-                               2: np.array([2.5]*5),
-                               3: np.array([3.33333333]*5),
-                               4: np.array([3.75]*5)}
+                               2: np.array([5.0]*5),
+                               3: np.array([5.0]*5),
+                               4: np.array([5.0]*5)}
         expected_velocities = pd.DataFrame(expected_velocities,
                                                 columns=list('ABCDE'))
         
@@ -68,7 +70,8 @@ class TestJointVelocitiesPublisher(unittest.TestCase):
             
 
     def _velo_cb(self, msg):
-        velocities = pd.Series(msg.velocities, index=msg.columns)
+        velocities = pd.Series(msg.velocities,
+                               index=self.velocity_schemas.columns(msg))
         self.recvd_velocities = \
             self.recvd_velocities.append(velocities, ignore_index=True)
         
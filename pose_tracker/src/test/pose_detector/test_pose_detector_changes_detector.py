@@ -10,7 +10,6 @@ roslib.load_manifest(PKG)
 
 import unittest
 import numpy as np
-import pandas as pd
 
 
 from pose_detector.pose_detector_node import PoseDetectorNode
@@ -48,7 +47,8 @@ class TestPoseDetectorChangesProperly(unittest.TestCase):
 
     def __fill_velocities_dataframe(self):
         data = np.linspace(1, 10, 10).reshape(2, 5)
-        self.node.velocities = pd.DataFrame(data)
+        for row in data:
+            self.node.velocities.append(row, columns=list('ABCDE'))
 
     def __change_detector(self):
         self.__fill_velocities_dataframe()
@@ -22,6 +22,7 @@ from pose_tracker.srv import SetDetector as SetDetectorSrv
 from pose_tracker.srv import CurrentDetector as CurrDetectorSrv
 from std_msgs.msg import Bool
 from pose_msgs.msg import (PoseInstance, JointVelocities)
+from column_schema import schema_id
 from pose_detector.pose_detector_node import (DatasetNotFullError,
                                               PoseDetectorNode, Detector,
                                               is_dataset_full,
@@ -40,6 +41,7 @@ ALMOST_STILL_MSG = JointVelocities(columns=COLUMNS,
                                    velocities=[0.0, 30.0] * (MSG_LEN / 2))
 ALMOST_MOVING_MSG = JointVelocities(columns=COLUMNS,
                                     velocities=[0.0, 30.0] * (MSG_LEN / 2))
+NARROW_STILL_MSG = JointVelocities(columns=COLUMNS[:3], velocities=[0.1] * 3)
 
 
 class TestPoseDetectorCommon(unittest.TestCase):
@@ -108,6 +110,11 @@ class TestPoseDetectorCommon(unittest.TestCase):
         self.publish_n(self.dflen, self.velo_pub, MOVING_MSG)
         # rospy.sleep(1)
 
+    def assertPoseInstance(self, msg):
+        """Assert msg is POSE_INSTANCE stamped with the schema of COLUMNS."""
+        self.assertEqual(msg.instance, POSE_INSTANCE.instance)
+        self.assertEqual(msg.schema_id, schema_id(COLUMNS))
+
     def set_detector(self, detector):
 #        response = self.set_detector_srv(detector)
 #        if response.current_detector != detector:
@@ -126,14 +133,23 @@ class TestPoseDetectorNode(TestPoseDetectorCommon):
         self.set_detector(STILL_D)
         self.fake_user_still()
         rospy.wait_for_message('user_pose', PoseInstance, timeout=6)
-        self.assertEqual(self.received_pose, POSE_INSTANCE)
+        self.assertPoseInstance(self.received_pose)
 
     # @unittest.skip('TODO')
     def test_velocities_cb_publishes_velos_when_the_user_starts_moving(self):
         self.set_detector(MOVING_D)
         self.fake_user_moving()
         rospy.wait_for_message('user_moving', JointVelocities, timeout=6)
-        self.assertEqual(self.user_moving, MOVING_MSG)
+        self.assertEqual(self.user_moving.velocities, MOVING_MSG.velocities)
+        self.assertEqual(self.user_moving.schema_id, schema_id(COLUMNS))
+
+    def test_velocities_cb_restarts_detection_when_columns_change(self):
+        self.set_detector(STILL_D)
+        self.instance_pub.publish(POSE_INSTANCE)
+        self.publish_n(self.dflen - 1, self.velo_pub, STILL_MSG)
+        self.publish_n(self.dflen, self.velo_pub, NARROW_STILL_MSG)
+        rospy.wait_for_message('user_pose', PoseInstance, timeout=6)
+        self.assertPoseInstance(self.received_pose)
 
     @unittest.skip('TODO')
     def test_Node_switches_detector_when_user_starts_or_stops_moving(self):
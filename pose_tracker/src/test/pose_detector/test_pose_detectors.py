@@ -16,7 +16,10 @@ import numpy as np
 import pandas as pd
 
 from pose_detector.pose_detector_node import (is_dataset_full, is_still,
-                                              is_moving, DatasetNotFullError)
+                                              is_moving, DatasetNotFullError,
+                                              below_threshold,
+                                              above_threshold,
+                                              threshold_bands)
 
 
 class TestIsDatasetFull(unittest.TestCase):
@@ -172,9 +175,75 @@ class TestIsStillAndIsMovingAreCoherent(unittest.TestCase):
                                  .format(s, detector, 3, dataset))
 
 
+class TestThresholdConditions(unittest.TestCase):
+
+    """Tests"""
+
+    def __init__(self, *args):
+        super(TestThresholdConditions, self).__init__(*args)
+
+    def setUp(self):
+        self.velocities = np.array([0.1, 3, 5, -30, 30])
+
+    def tearDown(self):
+        pass
+
+    def test_conditions_are_checked_per_column(self):
+        np.testing.assert_array_equal(below_threshold(3, self.velocities),
+                                      [True, False, False, True, False])
+        np.testing.assert_array_equal(above_threshold(3, self.velocities),
+                                      [False, False, True, False, True])
+
+    def test_conditions_are_coherent_with_detectors(self):
+        dataset = pd.DataFrame(np.vstack([self.velocities] * 3))
+        for threshold in (-40, 0, 3, 40):
+            self.assertEqual(is_still(threshold, dataset),
+                             below_threshold(threshold,
+                                             dataset.values).all())
+            self.assertEqual(is_moving(threshold, dataset),
+                             above_threshold(threshold,
+                                             dataset.values).all())
+
+
+class TestThresholdBands(unittest.TestCase):
+
+    """Tests"""
+
+    def __init__(self, *args):
+        super(TestThresholdBands, self).__init__(*args)
+
+    def setUp(self):
+        self.columns = ['user_id', 'stamp', 'head_pos_x', 'head_orient_x',
+                        'head_pos_confidence', 'left_hand_pos_x']
+
+    def tearDown(self):
+        pass
+
+    def test_default_threshold(self):
+        lower, upper, ignored = threshold_bands(self.columns, 2)
+        np.testing.assert_array_equal(lower, [2] * len(self.columns))
+        np.testing.assert_array_equal(upper, [2] * len(self.columns))
+        self.assertFalse(ignored.any())
+
+    def test_joint_thresholds_and_ignored_columns(self):
+        lower, upper, ignored = threshold_bands(
+            self.columns, 2, {'*_pos_*': 1, 'left_hand_*': 0.5},
+            ['user_id', 'stamp', '*confidence'])
+        np.testing.assert_array_equal(lower, [2, 2, 1, 2, 1, 0.5])
+        np.testing.assert_array_equal(ignored, [True, True, False, False,
+                                                True, False])
+
+    def test_hysteresis(self):
+        lower, upper, _ = threshold_bands(self.columns, 2, hysteresis=0.25)
+        np.testing.assert_array_equal(lower, [1.5] * len(self.columns))
+        np.testing.assert_array_equal(upper, [2.5] * len(self.columns))
+
+
 if __name__ == '__main__':
     import rosunit
     rosunit.unitrun(PKG, 'test_is_dataset_full', TestIsDatasetFull)
     rosunit.unitrun(PKG, 'test_is_still', TestIsStill)
     rosunit.unitrun(PKG, 'test_is_moving', TestIsMoving)
     rosunit.unitrun(PKG, 'test_is_moving', TestIsStillAndIsMovingAreCoherent)
+    rosunit.unitrun(PKG, 'test_threshold_conditions', TestThresholdConditions)
+    rosunit.unitrun(PKG, 'test_threshold_bands', TestThresholdBands)
@@ -0,0 +1,102 @@
+PKG = 'pose_tracker'
+import roslib
+roslib.load_manifest(PKG)
+
+import unittest
+import numpy as np
+import pandas as pd
+from numpy.testing import assert_array_equal as assert_arrEQ
+
+from pose_detector.ring_buffer import RingBuffer
+
+
+def _make_rows(nrows, ncols):
+    return np.linspace(1, nrows * ncols, nrows * ncols).reshape(nrows, ncols)
+
+
+class TestRingBuffer(unittest.TestCase):
+
+    """Tests"""
+
+    def __init__(self, *args):
+        super(TestRingBuffer, self).__init__(*args)
+
+    def setUp(self):
+        self.cols = list('ABCDE')
+        self.rows = _make_rows(10, 5)
+        self.rb = RingBuffer(3, columns=self.cols)
+
+    def tearDown(self):
+        pass
+
+    def _fill(self, rb, nrows):
+        for row in self.rows[:nrows]:
+            rb.append(row)
+        return rb
+
+    def test_raises_ValueError_if_capacity_lower_than_one(self):
+        for capacity in (0, -1, -10):
+            with self.assertRaises(ValueError):
+                RingBuffer(capacity)
+
+    def test_raises_ValueError_if_row_is_not_1d(self):
+        with self.assertRaises(ValueError):
+            self.rb.append(self.rows)
+
+    def test_raises_ValueError_if_row_length_differs_from_width(self):
+        with self.assertRaises(ValueError):
+            self.rb.append(range(4))
+
+    def test_empty_buffer(self):
+        rb = RingBuffer(3)
+        self.assertEqual(len(rb), 0)
+        self.assertEqual(rb.values.shape, (0, 0))
+        self.assertTrue(rb.to_dataframe().empty)
+        for method in (rb.first, rb.last):
+            with self.assertRaises(IndexError):
+                method()
+
+    def test_len_grows_until_capacity(self):
+        for i in xrange(1, len(self.rows) + 1):
+            self.rb.append(self.rows[i - 1])
+            self.assertEqual(len(self.rb), min(i, 3))
+        self.assertTrue(self.rb.is_full())
+
+    def test_values_are_ordered_from_oldest_to_newest(self):
+        for nrows in xrange(1, len(self.rows) + 1):
+            rb = self._fill(RingBuffer(3, columns=self.cols), nrows)
+            expected = self.rows[max(0, nrows - 3):nrows]
+            assert_arrEQ(rb.values, expected)
+            assert_arrEQ(rb.first(), expected[0])
+            assert_arrEQ(rb.last(), expected[-1])
+
+    def test_values_is_a_view_of_the_buffer(self):
+        self._fill(self.rb, 5)
+        self.assertFalse(self.rb.values.flags['OWNDATA'])
+
+    def test_takes_columns_from_first_appended_row(self):
+        rb = RingBuffer(3)
+        rb.append(pd.Series(range(5), index=self.cols))
+        self.assertEqual(rb.columns, self.cols)
+        rb = RingBuffer(3)
+        rb.append(range(5), columns=self.cols)
+        self.assertEqual(rb.columns, self.cols)
+
+    def test_clear_empties_buffer_but_keeps_columns(self):
+        self._fill(self.rb, 5).clear()
+        self.assertEqual(len(self.rb), 0)
+        self.assertEqual(self.rb.columns, self.cols)
+        self.rb.append(self.rows[0])
+        assert_arrEQ(self.rb.values, self.rows[:1])
+
+    def test_to_dataframe(self):
+        self._fill(self.rb, 5)
+        df = self.rb.to_dataframe()
+        expected = pd.DataFrame(self.rows[2:5], columns=self.cols)
+        self.assertTrue((df == expected).values.all())
+        self.assertEqual(df.columns.tolist(), self.cols)
+
+
+if __name__ == '__main__':
+    import rosunit
+    rosunit.unitrun(PKG, 'test_ring_buffer', TestRingBuffer)
@@ -0,0 +1,136 @@
+PKG = 'pose_tracker'
+import roslib
+roslib.load_manifest(PKG)
+
+import unittest
+import numpy as np
+import pandas as pd
+from scipy.stats import gmean
+from numpy.testing import assert_array_almost_equal as assert_arrAlmostEQ
+
+from pose_detector.ring_buffer import RingBuffer
+from pose_detector.running_aggregates import (RunningAggregate,
+                                              RunningMean, RunningMedian,
+                                              RunningGeometricMean,
+                                              SlidingAggregate)
+
+
+def _aggregate_stream(aggregate, rows, capacity):
+    """Yield (window, aggregate value) for each row of the stream."""
+    window = RingBuffer(capacity)
+    for row in rows:
+        aggregate.update(row, window.first() if window.is_full() else None)
+        window.append(row)
+        yield window.values, aggregate.value()
+
+
+class TestRunningAggregates(unittest.TestCase):
+
+    """Tests"""
+
+    def __init__(self, *args):
+        super(TestRunningAggregates, self).__init__(*args)
+
+    def setUp(self):
+        rnd = np.random.RandomState(0)
+        self.capacity = 5
+        self.rows = rnd.uniform(0.1, 10, size=(23, 4))
+        self.rows[:, 0] = rnd.randint(0, 3, size=23)  # With repeated values
+
+    def tearDown(self):
+        pass
+
+    def _check_stream(self, aggregate, expected_func, rows=None):
+        rows = self.rows if rows is None else rows
+        for window, value in _aggregate_stream(aggregate, rows,
+                                               self.capacity):
+            assert_arrAlmostEQ(value, expected_func(window))
+
+    def test_running_mean(self):
+        self._check_stream(RunningMean(self.capacity),
+                           lambda w: pd.DataFrame(w).mean().values)
+
+    def test_running_median(self):
+        self._check_stream(RunningMedian(self.capacity),
+                           lambda w: pd.DataFrame(w).median().values)
+
+    def test_running_median_skips_nans(self):
+        self.rows[2:9, 1] = np.nan      # Whole windows without values
+        self.rows[[4, 11, 12, 20], 2] = np.nan
+        self._check_stream(RunningMedian(self.capacity),
+                           lambda w: pd.DataFrame(w).median().values)
+        median = RunningMedian(self.capacity).resync(self.rows[-5:])
+        assert_arrAlmostEQ(median.value(),
+                           pd.DataFrame(self.rows[-5:]).median().values)
+
+    def test_running_gmean(self):
+        self._check_stream(RunningGeometricMean(self.capacity),
+                           lambda w: gmean(w))
+
+    def test_running_gmean_is_zero_while_window_has_zeros(self):
+        self.rows[3, 1] = 0
+        for i, (window, value) in enumerate(
+                _aggregate_stream(RunningGeometricMean(self.capacity),
+                                  self.rows, self.capacity)):
+            if 3 <= i < 3 + self.capacity:
+                self.assertEqual(value[1], 0)
+            else:
+                self.assertAlmostEqual(value[1], gmean(window[:, 1]))
+
+    def test_running_gmean_is_nan_while_window_has_negatives(self):
+        self.rows[3, 2] = -1
+        for i, (_, value) in enumerate(
+                _aggregate_stream(RunningGeometricMean(self.capacity),
+                                  self.rows, self.capacity)):
+            self.assertEqual(np.isnan(value[2]),
+                             3 <= i < 3 + self.capacity)
+
+    def test_base_aggregate_is_abstract(self):
+        with self.assertRaises(TypeError):
+            RunningAggregate(self.capacity)
+
+    def test_resync_gives_same_values(self):
+        for klass in (RunningMean, RunningMedian, RunningGeometricMean):
+            aggregate = klass(self.capacity)
+            for window, value in _aggregate_stream(aggregate, self.rows,
+                                                   self.capacity):
+                pass
+            assert_arrAlmostEQ(aggregate.resync(window).value(), value)
+            self.assertEqual(len(aggregate), self.capacity)
+
+    def test_reset(self):
+        for klass in (RunningMean, RunningMedian, RunningGeometricMean):
+            aggregate = klass(self.capacity)
+            list(_aggregate_stream(aggregate, self.rows, self.capacity))
+            aggregate.reset()
+            self.assertEqual(len(aggregate), 0)
+            aggregate.update(self.rows[0])
+            assert_arrAlmostEQ(aggregate.value(), self.rows[0])
+
+    def test_sliding_aggregate(self):
+        sliding = SlidingAggregate(RunningMedian(self.capacity))
+        columns = ['a', 'b', 'c', 'd']
+        for i, row in enumerate(self.rows):
+            value = sliding.update(row, columns=columns).value()
+            window = self.rows[max(0, i + 1 - self.capacity):i + 1]
+            assert_arrAlmostEQ(value, np.median(window, axis=0))
+        self.assertEqual(sliding.columns, columns)
+
+    def test_sliding_aggregate_rejects_instances_of_other_width(self):
+        for aggregate, func in ((RunningMean, np.mean),
+                                (RunningMedian, np.median)):
+            sliding = SlidingAggregate(aggregate(self.capacity))
+            for row in self.rows[:self.capacity]:
+                sliding.update(row)
+            with self.assertRaises(ValueError):
+                sliding.update(self.rows[0][:-1])
+            assert_arrAlmostEQ(sliding.value(),
+                               func(self.rows[:self.capacity], axis=0))
+            window = self.rows[1:self.capacity + 1]
+            assert_arrAlmostEQ(sliding.update(window[-1]).value(),
+                               func(window, axis=0))
+
+
+if __name__ == '__main__':
+    import rosunit
+    rosunit.unitrun(PKG, 'test_running_aggregates', TestRunningAggregates)
@@ -0,0 +1,130 @@
+#!/usr/bin/python
+PKG = 'pose_tracker'
+import roslib
+roslib.load_manifest(PKG)
+import numpy as np
+import unittest
+from numpy.testing import assert_array_almost_equal as assert_arrAlmostEQ
+
+from pose_detector.ring_buffer import RingBuffer
+from pose_detector.velocity_estimators import (ESTIMATORS, VelocityEstimator,
+                                               LstsqVelocity, SavgolVelocity,
+                                               VelocityWindow)
+
+SLOPES = np.array([1.0, -2.0, 0.5, 0.0])
+
+
+def stream(estimator, times, rows, capacity):
+    """Feed timed rows to an estimator. Return its velocity after each."""
+    tbuf, window = RingBuffer(capacity, columns=['t']), RingBuffer(capacity)
+    velocities = []
+    for t, row in zip(times, rows):
+        if window.is_full():
+            estimator.update(t, row, tbuf.first()[0], window.first())
+        else:
+            estimator.update(t, row)
+        tbuf.append([t])
+        window.append(row)
+        velocities.append(estimator.value(tbuf.values[:, 0], window.values))
+    return velocities
+
+
+class TestVelocityEstimators(unittest.TestCase):
+
+    """Tests"""
+
+    def __init__(self, *args):
+        super(TestVelocityEstimators, self).__init__(*args)
+
+    def setUp(self):
+        # 30 Hz stream with dropped frames
+        frames = np.delete(np.arange(100), [10, 11, 12, 40, 75])
+        self.times = 1400000000.0 + frames / 30.0
+        self.rows = 3.0 + (self.times - self.times[0])[:, np.newaxis] * SLOPES
+
+    def tearDown(self):
+        pass
+
+    def test_velocity_of_linear_motion_with_dropped_frames(self):
+        for name, estimator in ESTIMATORS.iteritems():
+            velocities = stream(estimator(10), self.times, self.rows, 10)
+            assert_arrAlmostEQ(velocities[0], np.zeros(len(SLOPES)))
+            for velocity in velocities[1:]:
+                assert_arrAlmostEQ(velocity, SLOPES, decimal=4, err_msg=name)
+
+    def test_lstsq_resync(self):
+        estimator = LstsqVelocity(10)
+        velocity = stream(estimator, self.times, self.rows, 10)[-1]
+        estimator.resync(self.times[-10:], self.rows[-10:])
+        assert_arrAlmostEQ(velocity,
+                           estimator.value(self.times[-10:], self.rows[-10:]))
+
+    def test_savgol_derivative_at_last_instance(self):
+        times = np.array([0.0, 0.1, 0.15, 0.3, 0.4])
+        rows = (times ** 2)[:, np.newaxis] * SLOPES
+        assert_arrAlmostEQ(SavgolVelocity(5, 2).value(times, rows),
+                           2 * times[-1] * SLOPES)
+
+    def test_velocity_is_0_if_window_does_not_span_time(self):
+        for estimator in ESTIMATORS.itervalues():
+            velocities = stream(estimator(5), [1.0] * 3, self.rows[:3], 5)
+            assert_arrAlmostEQ(velocities[-1], np.zeros(len(SLOPES)))
+
+    def test_value_raises_ValueError_if_window_is_empty(self):
+        for estimator in ESTIMATORS.itervalues():
+            with self.assertRaises(ValueError):
+                estimator(5).value(np.empty(0), np.empty((0, 0)))
+
+    def test_base_estimator_is_abstract(self):
+        with self.assertRaises(TypeError):
+            VelocityEstimator(5)
+
+
+class TestVelocityWindow(unittest.TestCase):
+
+    """Tests"""
+
+    def __init__(self, *args):
+        super(TestVelocityWindow, self).__init__(*args)
+
+    def setUp(self):
+        self.columns = ['user_id', 'stamp', 'x']
+
+    def tearDown(self):
+        pass
+
+    def test_velocities_use_stamp_column(self):
+        window = VelocityWindow(5).allocate(self.columns)
+        for t in (10.0, 10.5, 11.0):
+            self.assertFalse(window.add(np.array([1, t, 4 * t])))
+        assert_arrAlmostEQ(window.velocities(), [0, 1, 4])
+
+    def test_velocities_per_frame(self):
+        window = VelocityWindow(5, 'lstsq', time_source='frames')
+        window.allocate(self.columns)
+        for t in (10.0, 10.5, 11.0):
+            window.add(np.array([1, t, 4 * t]))
+        assert_arrAlmostEQ(window.velocities(), [0, 0.5, 2])
+
+    def test_older_instances_restart_window(self):
+        window = VelocityWindow(5).allocate(self.columns)
+        window.add(np.array([1, 10.0, 0]))
+        self.assertTrue(window.add(np.array([1, 9.0, 0])))
+        self.assertEqual(len(window), 1)
+
+    def test_add_raises_ValueError_with_bad_instances(self):
+        window = VelocityWindow(5).allocate(self.columns)
+        with self.assertRaises(ValueError):
+            window.add(np.array([1, 10.0]))
+
+    def test_invalid_params(self):
+        with self.assertRaises(KeyError):
+            VelocityWindow(5, 'unknown')
+        with self.assertRaises(ValueError):
+            VelocityWindow(5, time_source='unknown')
+
+
+if __name__ == '__main__':
+    import rosunit
+    rosunit.unitrun(PKG, 'test_velocity_estimators', TestVelocityEstimators)
+    rosunit.unitrun(PKG, 'test_velocity_window', TestVelocityWindow)
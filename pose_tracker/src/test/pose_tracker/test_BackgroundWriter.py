@@ -0,0 +1,86 @@
+#!/usr/bin/env python
+PKG = 'pose_tracker'
+import roslib
+roslib.load_manifest(PKG)
+
+import unittest
+import collections as col
+import time
+
+from pose_tracker.BackgroundWriter import BackgroundWriter
+
+
+class TestBackgroundWriter(unittest.TestCase):
+    """Tests"""
+    def __init__(self, *args):
+        super(TestBackgroundWriter, self).__init__(*args)
+
+    def setUp(self):
+        self.queue = col.deque()
+        self.written = []
+
+    def tearDown(self):
+        pass
+
+    def _write(self, items):
+        """Fake write function that pops items from the queue."""
+        if items < 0:
+            items = len(self.queue)
+        self.written.append([self.queue.popleft() for _ in xrange(items)])
+
+    def _wait_for(self, condition, timeout=2.0):
+        start = time.time()
+        while not condition() and time.time() - start < timeout:
+            time.sleep(0.01)
+
+    def test_writes_when_queue_reaches_max_rows(self):
+        writer = BackgroundWriter(self.queue, self._write,
+                                  max_rows=5, max_latency=60)
+        writer.start()
+        self.queue.extend(range(5))
+        self._wait_for(lambda: self.written)
+        writer.stop()
+        self.assertEqual(self.written, [range(5)])
+
+    def test_writes_when_max_latency_elapses(self):
+        writer = BackgroundWriter(self.queue, self._write,
+                                  max_rows=1000, max_latency=0.05)
+        self.queue.extend(range(3))
+        writer.start()
+        self._wait_for(lambda: self.written)
+        self.assertEqual(self.written, [range(3)])
+        writer.stop()
+
+    def test_does_not_write_empty_batches(self):
+        writer = BackgroundWriter(self.queue, self._write,
+                                  max_rows=1000, max_latency=0.01)
+        writer.start()
+        time.sleep(0.1)
+        writer.stop()
+        self.assertEqual(self.written, [])
+
+    def test_stop_drains_queue(self):
+        writer = BackgroundWriter(self.queue, self._write,
+                                  max_rows=1000, max_latency=60)
+        writer.start()
+        self.queue.extend(range(10))
+        writer.stop()
+        self.assertFalse(writer.is_alive())
+        self.assertEqual(len(self.queue), 0)
+        self.assertEqual(sum(self.written, []), range(10))
+
+    def test_write_errors_do_not_stop_the_thread(self):
+        def failing_write(items):
+            raise IOError("Disk full")
+        writer = BackgroundWriter(self.queue, failing_write,
+                                  max_rows=1, max_latency=0.01)
+        writer.start()
+        self.queue.append(1)
+        time.sleep(0.05)
+        self.assertTrue(writer.is_alive())
+        writer.stop(timeout=0.1)
+
+
+if __name__ == '__main__':
+    import rosunit
+    rosunit.unitrun(PKG, 'test_BackgroundWriter', TestBackgroundWriter)
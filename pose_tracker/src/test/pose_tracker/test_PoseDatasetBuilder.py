@@ -10,6 +10,7 @@ from mock import call as mcall
 
 from std_msgs.msg import String
 import kinect.msg as kin
+import kinect.nite_skeleton_msg_utils as nsku
 import pose_tracker.pose_dataset_builder_node as pdb
 # import pose_tracker.SkeletonQueue as skq
 import pose_tracker.PoseDatasetIO as pdio
@@ -164,12 +165,13 @@ class TestPoseDatasetBuilder(unittest.TestCase):
     # unittest.skip("Skpping this Test")
     def test_skeleton_callback(self):
         self.node.curr_state = pdb.STATE_PROCESSING
-        skeletons_msg = kin.NiteSkeletonList()
-        skeletons_msg.skeletons = [1, 2, 3, 4, 5]
+        skeletons_msg = nsku.generate_fake_NiteSkeletonList_msg(
+            2, self.node.joint_names)
         self.node.current_label = 'aaaa'
         self.node.skeleton_callback(skeletons_msg)
-        self.assertEqual(1, len(self.node.skeleton_queue),
-                         msg="Should have added the skeleton msg to the queue ")
+        self.assertEqual(2, len(self.node.skeleton_queue),
+                         msg="Should have added the skeletons of all the "
+                             "users to the queue")
 
     # unittest.skip("Skpping this Test")
     def test_skeleton_callback_does_nothing_with_invalid_skel_msg(self):
@@ -221,8 +223,10 @@ class TestPoseDatasetBuilder(unittest.TestCase):
     def __setup_st_processing_precons(self):
         ''' Prepares valid preconditions for state_processing '''
         self.node.all_labels = set(['label1', 'label2', 'label3'])
-        for skel in ['s1', 's2', 's3']:
-            self.node.skeleton_queue.append(skel, None)
+        for label in ['label1', 'label2', 'label3']:
+            skels = nsku.generate_fake_NiteSkeletonList_msg(
+                1, self.node.joint_names)
+            self.node.skeleton_queue.append(skels, label)
 
     # unittest.skip("Skpping this Test")
     def test_state_processing_precons_raises_if_no_labels(self):
@@ -241,16 +245,37 @@ class TestPoseDatasetBuilder(unittest.TestCase):
             self.node._state_processing_precons()
 
     # unittest.skip("Skpping this Test")
-    def test_state_processing(self):
+    @patch.object(pdb, 'BackgroundWriter')
+    def test_state_processing_starts_writer_once(self, mock_writer):
         self.__setup_st_processing_precons()
-        self.node._write_from_queue = MagicMock()
         self.node.state_processing()
-        self.node._write_from_queue.assert_called_with(self.node.rate,
+        self.node.state_processing()
+        mock_writer.assert_called_once_with(
+            self.node.skeleton_queue, self.node._write_batch,
+            max_rows=self.node.write_batch_size,
+            max_latency=self.node.write_latency)
+        mock_writer.return_value.start.assert_called_once_with()
+
+    # unittest.skip("Skpping this Test")
+    def test_write_batch(self):
+        self.node._write_from_queue = MagicMock()
+        self.node._write_batch(10)
+        self.node._write_from_queue.assert_called_with(10,
                                                        self.node.table_name,
                                                        False)
         self.assertTrue(self.node.append_data,
                         msg="After first write, append_data should be true")
 
+    # unittest.skip("Skpping this Test")
+    @patch('pose_tracker.PoseDatasetIO.PoseDatasetIO')
+    @patch.object(pdb.PoseDatasetBuilder, '_write_from_queue')
+    def test_state_finishing_stops_writer(self, mock_write, mock_pdio):
+        writer = MagicMock()
+        self.node.writer = writer
+        self.node.state_finishing()
+        writer.stop.assert_called_once_with()
+        self.assertIsNone(self.node.writer)
+
     # unittest.skip("Skpping this Test")
     @patch('pose_tracker.PoseDatasetIO.PoseDatasetIO', autospec=True)
     @patch.object(pdb.PoseDatasetBuilder, '_write_from_queue')
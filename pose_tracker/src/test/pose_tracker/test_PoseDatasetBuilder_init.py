@@ -43,6 +43,25 @@ class TestPoseDatasetBuilderInit(unittest.TestCase):
         # node.state_srv.shutdown('Manually shutting down the service ')
         # node.shutdown()
 
+    @patch.object(pdb, 'logfatal')
+    @patch.object(rospy, 'signal_shutdown')
+    def test_die_if_closest_joint_not_valid(self, mock_shutdown,
+                                            mock_logfatal):
+        get_param = rospy.get_param
+        params = {'~user_policy': 'closest', '~closest_joint': 'tail'}
+
+        def fake_get_param(name, *args):
+            if name in params:
+                return params[name]
+            return get_param(name, *args)
+        with patch.object(rospy, 'get_param', side_effect=fake_get_param):
+            with self.assertRaises(ValueError):
+                pdb.PoseDatasetBuilder()
+        mock_shutdown.assert_called()
+        msg = mock_logfatal.call_args[0][0]
+        self.assertIn('tail', msg)
+        self.assertIn('Valid joints', msg)
+
 
 if __name__ == '__main__':
     import rostest
@@ -4,8 +4,6 @@ import roslib
 roslib.load_manifest(PKG)
 
 import unittest
-from mock import patch
-from itertools import chain
 
 import kinect.msg as kin
 import kinect.nite_skeleton_msg_utils as nsku
@@ -23,7 +21,7 @@ class TestSkeletonQueue(unittest.TestCase):
         pass
 
     def tearDown(self):
-        self.skq.skeleton_queue.clear()
+        self.skq.clear()
 
     # @unittest.skip("Skpping this Test")
     def test_process_skeleton_msg(self):
@@ -47,6 +45,28 @@ class TestSkeletonQueue(unittest.TestCase):
         bad_skel = nsku.generate_fake_skelmsg(['hhhead', 'ne33ck'])
         self.assertRaises(TypeError, self.skq._process_skeleton_msg, bad_skel)
 
+    def test_process_skeleton_msg_sorts_joints(self):
+        skel = nsku.generate_fake_skelmsg(self.joint_names[::-1])
+        unpacked = list(nsku.unpack_skeleton_msg(skel)[0])
+        attribs = (len(unpacked) - 2) // 2
+        expected = unpacked[:2] + unpacked[2 + attribs:] + \
+            unpacked[2:2 + attribs]
+        self.assertEqual(list(self.skq._process_skeleton_msg(skel)), expected)
+
+    def test_joints_order_is_cached(self):
+        skel = nsku.generate_fake_skelmsg(self.joint_names[::-1])
+        self.skq._process_skeleton_msg(skel)
+        self.skq._check_joints = None     # Not called again
+        self.skq._process_skeleton_msg(skel)
+        self.assertEqual(len(self.skq._joints_orders), 1)
+
+    def test_invalid_joints_are_cached(self):
+        bad_skel = nsku.generate_fake_skelmsg(['hhhead', 'ne33ck'])
+        for _ in xrange(2):
+            self.assertRaises(TypeError,
+                              self.skq._process_skeleton_msg, bad_skel)
+        self.assertEqual(len(self.skq._joints_orders), 1)
+
     def _fill_skel_queue(self, nelements, joint_names,
                          skels_per_msg=2, label='label'):
         ''' Helper function that ads n nelements to the skeleton queue.
@@ -64,99 +84,147 @@ class TestSkeletonQueue(unittest.TestCase):
         for i in xrange(nelements):
             fake_skels = nsku.generate_fake_NiteSkeletonList_msg(skels_per_msg,
                                                                  joint_names)
-            q_item = [fake_skels, label]
-            self.skq.skeleton_queue.append(q_item)
-            msg_list.append(q_item)
+            self.skq.append(fake_skels, label)
+            msg_list.append([fake_skels, label])
         return msg_list
 
-    def test_pop_from_queue_pops_correct_num_of_elements(self):
-        # self.joint_names = ['head', 'neck']
-        label = 'label_1'
-        # self.skq.all_labels.add(label)
-        self._fill_skel_queue(4, self.joint_names, label=label)
+    def _unpacked(self, msg):
+        return list(nsku.unpack_skeleton_msg(msg.skeletons[0])[0])
 
-        list(self.skq._pop_from_queue(0))
-        q_length = len(self.skq.skeleton_queue)
-        self.assertEqual(4, q_length, "Queue should have remained untouched")
+    def test_append_unpacks_first_skeleton(self):
+        msgs = self._fill_skel_queue(3, self.joint_names)
+        self.assertEqual(len(self.skq), 3)
+        data, codes = self.skq.pop_n(3)
+        for row, (msg, label) in zip(data, msgs):
+            self.assertEqual(list(row), self._unpacked(msg))
 
-        popped = list(self.skq._pop_from_queue(2))
-        q_length = len(self.skq.skeleton_queue)
-        self.assertEqual(2, q_length, "Queue should have now only 2 elements! "
-                                      "It has {} elements".format(q_length))
+    def test_append_discards_messages_with_invalid_joints(self):
+        self._fill_skel_queue(4, ['aaaa', 'bbbb'])
+        self.assertEqual(len(self.skq), 0,
+                         "Shouldn't have added any skeleton")
 
-        # retrieving more elements that already are in queue
-        popped = list(self.skq._pop_from_queue(4))
-        q_length = len(self.skq.skeleton_queue)
-        self.assertEqual(q_length, 0, "Queue should have been emptied")
-        self.assertEqual(len(popped), 2,
-                         "Should have retrieved the last {} elems from queue. "
-                         "Retrieved: {}\nPopped elements: {}"
-                         .format(2, len(popped), popped))
-
-    def test_pop_from_queue_does_not_return_messages_with_invalid_joints(self):
-        # self.joint_names = ['head', 'neck']
-        invalid_joint_names = ['aaaa', 'bbbb']
-
-        self._fill_skel_queue(4, invalid_joint_names, label='label')
-        popped = list(self.skq._pop_from_queue(4))
-        q_length = len(self.skq.skeleton_queue)
-        self.assertEqual(q_length, 0, "Queue should have been emptied. "
-                                      "There still are {} elements in queue."
-                                      .format(q_length))
-        self.assertEqual(len(popped), 0, "Shouldn't have returned any skeleton."
-                                         "Num of returned skeletons {}."
-                                         .format(len(popped)))
-
-    def test_pop_from_queue_returns_a_skeleton_and_a_label(self):
-        # self.joint_names = ['head', 'neck']
-        label = 'label_1'
-        # self.skq.all_labels.add(label)
-        msg_list = self._fill_skel_queue(4, self.joint_names, label=label)
-
-        popped = list(self.skq._pop_from_queue(4))
-        for i, item in enumerate(popped):
-            item = list(item)
-            message_skel = msg_list[i][0]
-            message_label = msg_list[i][1]
-            unpacked_skel = \
-                nsku.unpack_skeleton_msg(message_skel.skeletons[0])[0]
-            target_to_compare = list(chain(unpacked_skel, message_label))
-            self.assertEqual(item, target_to_compare,
-                             "Messages are not equal: {} != {}"
-                             .format(item, target_to_compare))
+    def test_append_discards_empty_messages(self):
+        self.skq.append(kin.NiteSkeletonList(), 'label')
+        self.assertEqual(len(self.skq), 0)
 
-    def test_calc_chunksize(self):
-        self.skq.skeleton_queue.clear()
-        self.skq.skeleton_queue.extend(xrange(10))
-        self.assertEqual(self.skq._calc_chunksize(8), 8)
-        for i in [-1, 12]:
-            self.assertEqual(self.skq._calc_chunksize(i),
-                             len(self.skq.skeleton_queue))
+    def test_pop_n_pops_correct_num_of_elements(self):
+        self._fill_skel_queue(4, self.joint_names)
 
-    # @unittest.skip("Skpping this Test")
-    @patch.object(skq.SkeletonQueue, '_pop_from_queue')
-    def test_prepare_chunk_returns_None_when_queue_is_empty(self, mock_pop):
-        self.skq.skeleton_queue.clear()
-        self.assertEqual(list(self.skq._prepare_chunk()), [])
+        self.assertEqual(len(self.skq.pop_n(0)[0]), 0)
+        self.assertEqual(4, len(self.skq),
+                         "Queue should have remained untouched")
 
-    # @unittest.skip("Skpping this Test")
-    @patch.object(skq.SkeletonQueue, '_pop_from_queue')
-    def test_prepare_chunk(self, mock_pop):
-        mock_pop.side_effect = lambda x: xrange(x)
+        self.assertEqual(len(self.skq.pop_n(2)[0]), 2)
+        self.assertEqual(2, len(self.skq))
 
-        self.skq.skeleton_queue.clear()
-        self.assertEqual(list(self.skq._prepare_chunk()), [],
-                         "Should return 'None' when queue is empty")
+        # retrieving more elements that already are in queue
+        popped = self.skq.pop_n(4)[0]
+        self.assertEqual(len(self.skq), 0, "Queue should have been emptied")
+        self.assertEqual(len(popped), 2)
+
+    def test_pop_n_returns_label_codes(self):
+        for label in ('l1', 'l2', 'l1', 'l3'):
+            self._fill_skel_queue(1, self.joint_names, label=label)
+        data, codes = self.skq.pop_n(-1)
+        self.assertEqual(self.skq.labels, ['l1', 'l2', 'l3'])
+        self.assertEqual(list(codes), [0, 1, 0, 2])
+
+    def test_popped_elements_are_views(self):
+        self._fill_skel_queue(3, self.joint_names)
+        data, codes = self.skq.pop_n(2)
+        self.assertFalse(data.flags['OWNDATA'])
+
+    def test_popped_elements_survive_queue_growth(self):
+        self.skq = skq.SkeletonQueue(self.joint_names, capacity=2)
+        msgs = self._fill_skel_queue(2, self.joint_names)
+        data, codes = self.skq.pop_n(1)
+        expected = list(data[0])
+        self._fill_skel_queue(10, self.joint_names)
+        self.assertEqual(list(data[0]), expected)
+        self.assertEqual(list(data[0]), self._unpacked(msgs[0][0]))
+        self.assertEqual(len(self.skq), 11)
+
+    def test_queue_grows_keeping_order(self):
+        self.skq = skq.SkeletonQueue(self.joint_names, capacity=2)
+        msgs = self._fill_skel_queue(7, self.joint_names)
+        self.skq.pop_n(3)
+        msgs.extend(self._fill_skel_queue(5, self.joint_names))
+        data, codes = self.skq.pop_n(-1)
+        self.assertEqual([list(row) for row in data],
+                         [self._unpacked(m) for m, _ in msgs[3:]])
+
+    def _users_msg(self, user_ids):
+        msg = nsku.generate_fake_NiteSkeletonList_msg(len(user_ids),
+                                                      self.joint_names)
+        for skel, user_id in zip(msg.skeletons, user_ids):
+            skel.user_id = user_id
+        return msg
+
+    def test_invalid_user_policy_raises_ValueError(self):
+        for policy in ('nobody', None, 'closest'):
+            self.assertRaises(ValueError, skq.SkeletonQueue,
+                              self.joint_names, user_policy=policy)
+
+    def test_user_policy_first(self):
+        self.skq.append(self._users_msg([3, 4, 5]), 'l1')
+        data, codes = self.skq.pop_n(-1)
+        self.assertEqual(list(data[:, 0]), [3])
+
+    def test_user_policy_all(self):
+        self.skq = skq.SkeletonQueue(self.joint_names, user_policy='all')
+        self.skq.append(self._users_msg([3, 4, 5]), 'l1')
+        self.skq.append(self._users_msg([3, 4]), 'l2')
+        data, codes = self.skq.pop_n(-1)
+        self.assertEqual(list(data[:, 0]), [3, 4, 5, 3, 4])
+        self.assertEqual(list(codes), [0, 0, 0, 1, 1])
+
+    def test_user_policy_user_id(self):
+        self.skq = skq.SkeletonQueue(self.joint_names, user_policy=4)
+        self.skq.append(self._users_msg([3, 4, 5]), 'l1')
+        self.skq.append(self._users_msg([3, 5]), 'l1')
+        data, codes = self.skq.pop_n(-1)
+        self.assertEqual(list(data[:, 0]), [4])
+
+    def test_user_policy_closest(self):
+        distance_field = 3
+        self.skq = skq.SkeletonQueue(self.joint_names, user_policy='closest',
+                                     distance_field=distance_field)
+        msg = self._users_msg([3, 4, 5])
+        distances = [self.skq._process_skeleton_msg(s)[distance_field]
+                     for s in msg.skeletons]
+        self.skq.append(msg, 'l1')
+        data, codes = self.skq.pop_n(-1)
+        self.assertEqual(len(data), 1)
+        self.assertEqual(data[0, distance_field], min(distances))
+
+    def test_many_users_grow_the_queue(self):
+        self.skq = skq.SkeletonQueue(self.joint_names, capacity=2,
+                                     user_policy='all')
+        for _ in xrange(3):
+            self.skq.append(self._users_msg(range(5)), 'l1')
+        data, codes = self.skq.pop_n(-1)
+        self.assertEqual(list(data[:, 0]), range(5) * 3)
+        self.assertEqual(list(codes), [0] * 15)
 
-        # Testing
-        self.skq.skeleton_queue.clear()
-        self.skq.skeleton_queue.extend(xrange(10))
-        list(self.skq._prepare_chunk(8))
-        mock_pop.assert_called_with(8)
+    def test_calc_chunksize(self):
+        self._fill_skel_queue(10, self.joint_names)
+        self.assertEqual(self.skq._calc_chunksize(8), 8)
+        for i in [-1, 12]:
+            self.assertEqual(self.skq._calc_chunksize(i), len(self.skq))
 
     def test_to_dataframe(self):
-        '''ToDo'''
-        pass
+        msgs = self._fill_skel_queue(3, self.joint_names, label='l1')
+        ncols = len(self._unpacked(msgs[0][0]))
+        columns = ['c{}'.format(i) for i in xrange(ncols)] + ['pose']
+        df = self.skq.pop_n_to_DataFrame(-1, columns)
+        self.assertEqual(df.columns.tolist(), columns)
+        self.assertEqual(df['pose'].tolist(), ['l1'] * 3)
+        self.assertEqual(df.iloc[0, :-1].tolist(), self._unpacked(msgs[0][0]))
+
+    def test_to_dataframe_of_empty_queue(self):
+        df = self.skq.pop_n_to_DataFrame(-1, ['a', 'b', 'pose'])
+        self.assertTrue(df.empty)
+        self.assertEqual(df.columns.tolist(), ['a', 'b', 'pose'])
 
 
 if __name__ == '__main__':
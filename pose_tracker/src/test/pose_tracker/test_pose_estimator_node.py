@@ -0,0 +1,184 @@
+#!/usr/bin/env python
+PKG = 'pose_tracker'
+import roslib; roslib.load_manifest(PKG)
+import rospy
+import unittest
+from collections import namedtuple
+import numpy as np
+from numpy.testing import assert_array_equal as assert_arrEQ
+from mock import patch
+from sklearn.tree import DecisionTreeClassifier
+
+import kinect.nite_skeleton_msg_utils as nsku
+import pose_tracker.pose_estimator_node as pen
+from pose_msgs.msg import PoseInstance
+from std_msgs.msg import Bool
+
+JOINTS = ['head', 'neck']
+LABELS = ['sitting', 'standing', 'pointing']
+Param = namedtuple('Param', 'name value')
+
+
+def skeletons_msg(user_ids):
+    """Return a NiteSkeletonList msg with a fake skeleton per user."""
+    msg = nsku.generate_fake_NiteSkeletonList_msg(len(user_ids), JOINTS)
+    for skel, user_id in zip(msg.skeletons, user_ids):
+        skel.user_id = user_id
+    return msg
+
+
+def unpacked(skel):
+    """Return the fields of a skeleton msg fed to the estimator."""
+    return list(nsku.unpack_skeleton_msg(skel)[0])[2:]
+
+
+class PoseEstimatorNodeTestCase(unittest.TestCase):
+    def __init__(self, *args):
+        super(PoseEstimatorNodeTestCase, self).__init__(*args)
+
+    def setUp(self):
+        nfields = len(unpacked(skeletons_msg([1]).skeletons[0]))
+        rnd = np.random.RandomState(0)
+        X = rnd.rand(60, nfields)
+        self.estimator = DecisionTreeClassifier(random_state=0) \
+            .fit(X, rnd.randint(len(LABELS), size=60))
+        self.params = {'labels': LABELS}
+        self.columns = ['user_id', 'stamp'] + \
+            ['field_{}'.format(i) for i in range(nfields)]
+        required = [Param('/pose_estimator/estimator_file', 'clf.pkl'),
+                    Param('/pose_estimator/dataset_columns',
+                          self.columns + ['pose']),
+                    Param('/pose_estimator/drop_columns', ['user_id', 'stamp'])]
+        for name in ('init_node', 'on_shutdown', 'Publisher', 'Subscriber',
+                     'Timer', 'Duration', 'get_name'):
+            patcher = patch.object(rospy, name)
+            patcher.start()
+            self.addCleanup(patcher.stop)
+        for target, name, kwargs in (
+                (rospy, 'get_param', {'side_effect': self.get_param}),
+                (pen.pu, 'get_parameters', {'return_value': required}),
+                (pen.pl, 'load_clf', {'return_value': self.estimator})):
+            patcher = patch.object(target, name, **kwargs)
+            patcher.start()
+            self.addCleanup(patcher.stop)
+
+    def get_param(self, name, default=None):
+        return self.params.get(name.lstrip('~'), default)
+
+    def node(self, **params):
+        self.params.update(params)
+        return pen.PoseEstimatorNode()
+
+    def published(self, node):
+        return [args[0] for args, _ in node.publisher.publish.call_args_list]
+
+    def test_flushes_batch_when_it_is_full(self):
+        node = self.node(batch_size=3)
+        msgs = [skeletons_msg([i]) for i in (1, 2, 3)]
+        for msg in msgs[:2]:
+            node.skeleton_cb(msg)
+        self.assertEqual(self.published(node), [])
+        node.skeleton_cb(msgs[2])
+        published = self.published(node)
+        self.assertEqual([p.user_id for p in published], [1, 2, 3])
+        for p, msg in zip(published, msgs):
+            assert_arrEQ(p.raw_instance,
+                         np.float32(unpacked(msg.skeletons[0])))
+        self.assertEqual(node._batch_len, 0)
+
+    def test_timer_flushes_waiting_skeletons(self):
+        node = self.node(batch_size=5, batch_latency=50)
+        rospy.Duration.assert_called_once_with(0.05)
+        self.assertEqual(rospy.Timer.call_args[0][1], node._batch_timer_cb)
+        for i in (1, 2):
+            node.skeleton_cb(skeletons_msg([i]))
+        self.assertEqual(self.published(node), [])
+        node._batch_timer_cb(None)
+        self.assertEqual([p.user_id for p in self.published(node)], [1, 2])
+        node._batch_timer_cb(None)
+        self.assertEqual(len(self.published(node)), 2)
+
+    def test_no_timer_without_batching(self):
+        self.node(batch_size=1)
+        self.assertFalse(rospy.Timer.called)
+
+    def test_estimated_labels_match_predict(self):
+        node = self.node()
+        X = np.random.RandomState(1).rand(20, self.estimator.n_features_) \
+            .astype(np.float32)
+        label_ids, probas = node.estimate(X)
+        assert_arrEQ(label_ids, self.estimator.predict(X))
+        assert_arrEQ(probas, self.estimator.predict_proba(X))
+
+    def test_publishes_a_msg_per_user(self):
+        node = self.node(multi_user=True)
+        msg = skeletons_msg([3, 4, 5])
+        node.skeleton_cb(msg)
+        published = self.published(node)
+        self.assertEqual([p.user_id for p in published], [3, 4, 5])
+        X = np.float32([unpacked(skel) for skel in msg.skeletons])
+        for p, label_id in zip(published, self.estimator.predict(X)):
+            self.assertEqual(p.predicted_label_id, label_id)
+            self.assertEqual(p.predicted_label, LABELS[label_id])
+            self.assertEqual(p.label_names, LABELS)
+
+    def test_publishes_only_first_user_if_not_multi_user(self):
+        node = self.node(multi_user=False)
+        node.skeleton_cb(skeletons_msg([3, 4, 5]))
+        self.assertEqual([p.user_id for p in self.published(node)], [3])
+
+    def test_gating_skips_inference_while_user_is_still(self):
+        node = self.node(motion_gated=True)
+        node.skeleton_cb(skeletons_msg([1]))    # Moving until told otherwise
+        node.is_moving_cb(Bool(data=False))
+        node.skeleton_cb(skeletons_msg([1]))    # Estimated: user stopped
+        node.skeleton_cb(skeletons_msg([1]))    # Skipped: same episode
+        self.assertEqual(len(self.published(node)), 1)
+        node.is_moving_cb(Bool(data=True))
+        node.skeleton_cb(skeletons_msg([1]))
+        node.is_moving_cb(Bool(data=False))
+        node.skeleton_cb(skeletons_msg([1]))    # Estimated: new episode
+        self.assertEqual(len(self.published(node)), 2)
+        self.assertEqual(node.gated_inferences, 2)
+        self.assertEqual(node.skipped_inferences, 3)
+
+    def test_gating_on_user_pose_only_estimates_user_poses(self):
+        node = self.node(motion_gated=True, gated_source='user_pose')
+        node.is_moving_cb(Bool(data=False))
+        node.skeleton_cb(skeletons_msg([1]))
+        self.assertEqual(self.published(node), [])
+        instance = [7, 0.5] + range(len(self.columns) - 2)
+        node.user_pose_cb(PoseInstance(columns=self.columns,
+                                       instance=instance))
+        published = self.published(node)
+        self.assertEqual(len(published), 1)
+        self.assertEqual(published[0].user_id, 7)
+        assert_arrEQ(published[0].raw_instance, np.float32(instance[2:]))
+        self.assertEqual(node.gated_inferences, 1)
+        self.assertEqual(node.skipped_inferences, 1)
+
+    def test_gating_counts_are_logged_periodically(self):
+        node = self.node(motion_gated=True, gating_report_period=30.0)
+        rospy.Duration.assert_called_once_with(30.0)
+        self.assertEqual(rospy.Timer.call_args[0][1], node.log_gating)
+        node.is_moving_cb(Bool(data=False))
+        for _ in range(3):
+            node.skeleton_cb(skeletons_msg([1]))
+        with patch.object(pen, 'loginfo') as mock_loginfo:
+            node.log_gating(None)
+        msg = mock_loginfo.call_args[0][0]
+        self.assertIn('1 inferences done', msg)
+        self.assertIn('2 of 3 skipped', msg)
+
+    def test_no_gating_report_if_period_is_0(self):
+        self.node(motion_gated=True, gating_report_period=0)
+        self.assertFalse(rospy.Timer.called)
+
+    def test_invalid_gated_source_raises_ValueError(self):
+        with self.assertRaises(ValueError):
+            self.node(motion_gated=True, gated_source='averaged_pose')
+
+
+if __name__ == '__main__':
+    import rosunit
+    rosunit.unitrun(PKG, 'test_pose_estimator_node', PoseEstimatorNodeTestCase)
@@ -0,0 +1,37 @@
+#!/usr/bin/env python
+PKG = 'pose_tracker'
+import roslib; roslib.load_manifest(PKG)
+import unittest
+import numpy as np
+from numpy.testing import assert_array_equal as assert_arrEQ
+
+from pose_tracker.pose_estimator_node import (column_plan, instance_plan)
+
+COLUMNS = ['user_id', 'stamp', 'head_pos_x', 'head_pos_confidence',
+           'torso_pos_x', 'pose']
+DROP_COLUMNS = ['user_id', 'stamp', 'head_pos_confidence']
+
+
+class ColumnPlanTestCase(unittest.TestCase):
+    def __init__(self, *args):
+        super(ColumnPlanTestCase, self).__init__(*args)
+
+    def test_column_plan_drops_columns_and_label(self):
+        assert_arrEQ(column_plan(COLUMNS, DROP_COLUMNS), [2, 4])
+
+    def test_instance_plan_maps_columns_by_name(self):
+        plan = column_plan(COLUMNS, DROP_COLUMNS)
+        instance_columns = ['torso_pos_x', 'user_id', 'head_pos_x']
+        instance = np.array([3.0, 1.0, 2.0])
+        iplan = instance_plan(instance_columns, COLUMNS, plan)
+        assert_arrEQ(instance.take(iplan), [2.0, 3.0])
+
+    def test_instance_plan_raises_ValueError_if_columns_are_missing(self):
+        plan = column_plan(COLUMNS, DROP_COLUMNS)
+        with self.assertRaises(ValueError):
+            instance_plan(['head_pos_x'], COLUMNS, plan)
+
+
+if __name__ == '__main__':
+    import rosunit
+    rosunit.unitrun(PKG, 'test_pose_estimator_plans', ColumnPlanTestCase)
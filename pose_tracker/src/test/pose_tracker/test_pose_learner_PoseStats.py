@@ -0,0 +1,52 @@
+#!/usr/bin/env python
+PKG = 'pose_tracker'
+import roslib; roslib.load_manifest(PKG)
+import unittest
+import numpy as np
+import pandas as pd
+from numpy.testing import assert_array_almost_equal as assert_arrAlmostEQ
+
+from pose_tracker.pose_learner import PoseStats
+
+
+class PoseStatsTestCase(unittest.TestCase):
+    def __init__(self, *args):
+        super(PoseStatsTestCase, self).__init__(*args)
+
+    def setUp(self):
+        rnd = np.random.RandomState(0)
+        self.df = pd.DataFrame(rnd.rand(100, 5) + 10, columns=list('ABCDE'))
+        self.df['pose'] = rnd.choice(['pose_1', 'pose_2', 'pose_3'], 100)
+        self.df.iloc[10:20, 1] = np.nan
+        self.grouped = self.df.groupby('pose')
+
+    def tearDown(self):
+        pass
+
+    def _chunked_stats(self, chunksize):
+        stats = PoseStats()
+        for start in xrange(0, len(self.df), chunksize):
+            stats.update(self.df.iloc[start:start + chunksize])
+        return stats
+
+    def test_chunked_mean_equals_groupby_mean(self):
+        for chunksize in (1, 7, 50, 100):
+            mean = self._chunked_stats(chunksize).mean()
+            assert_arrAlmostEQ(mean.values, self.grouped.mean().values)
+            self.assertEqual(mean.columns.tolist(), list('ABCDE'))
+
+    def test_chunked_var_equals_groupby_var(self):
+        for chunksize in (3, 7, 50, 100):
+            var = self._chunked_stats(chunksize).var()
+            assert_arrAlmostEQ(var.values, self.grouped.var().values)
+
+    def test_chunks_with_missing_poses(self):
+        stats = PoseStats()
+        for pose, chunk in self.grouped:
+            stats.update(chunk)
+        assert_arrAlmostEQ(stats.mean().values, self.grouped.mean().values)
+
+
+if __name__ == '__main__':
+    import rosunit
+    rosunit.unitrun(PKG, 'test_pose_learner_PoseStats', PoseStatsTestCase)
@@ -0,0 +1,63 @@
+#!/usr/bin/env python
+PKG = 'pose_tracker'
+import roslib; roslib.load_manifest(PKG)
+import os
+import shutil
+import tempfile
+import unittest
+import pandas as pd
+from mock import patch
+
+import pose_tracker.pose_learner as pl
+
+
+class CachedPrepareDatasetTestCase(unittest.TestCase):
+    def __init__(self, *args):
+        super(CachedPrepareDatasetTestCase, self).__init__(*args)
+
+    def setUp(self):
+        self.tmpdir = tempfile.mkdtemp()
+        self.filename = os.path.join(self.tmpdir, 'dataset')
+        open(self.filename + '.h5', 'w').close()
+        os.utime(self.filename + '.h5', (1000, 1000))
+        self.prepare = pl.cached_prepare_dataset(
+            os.path.join(self.tmpdir, 'cache'))
+        patcher = patch.object(pl, 'prepare_dataset',
+                               return_value=pd.DataFrame({'a': [1.0]}))
+        self.prepare_dataset = patcher.start()
+        self.addCleanup(patcher.stop)
+
+    def tearDown(self):
+        shutil.rmtree(self.tmpdir)
+
+    def test_cache_hit_if_file_is_not_modified(self):
+        first = self.prepare(self.filename, '/group', chunksize=10)
+        second = self.prepare(self.filename, '/group', chunksize=10)
+        self.assertEqual(self.prepare_dataset.call_count, 1)
+        self.assertTrue(first.equals(second))
+
+    def test_cache_miss_if_file_is_modified(self):
+        self.prepare(self.filename, '/group')
+        os.utime(self.filename + '.h5', (2000, 2000))
+        self.prepare(self.filename, '/group')
+        self.assertEqual(self.prepare_dataset.call_count, 2)
+
+    def test_cache_miss_with_other_args(self):
+        self.prepare(self.filename, '/group')
+        self.prepare(self.filename, '/other_group')
+        self.prepare(self.filename, '/group', chunksize=10)
+        self.assertEqual(self.prepare_dataset.call_count, 3)
+
+    def test_n_jobs_is_forwarded_but_not_part_of_the_key(self):
+        self.prepare(self.filename, '/group', n_jobs=4)
+        self.prepare_dataset.assert_called_once_with(
+            self.filename, '/group', chunksize=None, variance=False,
+            n_jobs=4)
+        self.prepare(self.filename, '/group', n_jobs=1)
+        self.assertEqual(self.prepare_dataset.call_count, 1)
+
+
+if __name__ == '__main__':
+    import rosunit
+    rosunit.unitrun(PKG, 'test_pose_learner_cache',
+                    CachedPrepareDatasetTestCase)
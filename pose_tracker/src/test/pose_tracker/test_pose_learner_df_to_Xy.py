@@ -0,0 +1,43 @@
+#!/usr/bin/env python
+PKG = 'pose_tracker'
+import roslib; roslib.load_manifest(PKG)
+import unittest
+import numpy as np
+import pandas as pd
+from numpy.testing import assert_array_equal as assert_arrEQ
+
+from pose_tracker.pose_learner import (encode_labels, numerize_y, df_to_Xy)
+
+
+class DfToXyTestCase(unittest.TestCase):
+    def __init__(self, *args):
+        super(DfToXyTestCase, self).__init__(*args)
+
+    def setUp(self):
+        self.y = ['pointing', 'hands_up', 'pointing', 'arms_crossed']
+        index = pd.MultiIndex.from_tuples(
+            [('exp01', label) for label in self.y])
+        self.df = pd.DataFrame(np.arange(12).reshape(4, 3), index=index,
+                               columns=list('ABC'))
+
+    def tearDown(self):
+        pass
+
+    def test_encode_labels_returns_sorted_vocabulary(self):
+        codes, labels = encode_labels(self.y)
+        assert_arrEQ(labels, sorted(set(self.y)))
+        assert_arrEQ(labels[codes], self.y)
+
+    def test_numerize_y_equals_position_in_sorted_labels(self):
+        labels = sorted(set(self.y))
+        assert_arrEQ(numerize_y(self.y), map(labels.index, self.y))
+
+    def test_df_to_Xy(self):
+        X, y, labels = df_to_Xy(self.df)
+        assert_arrEQ(X, self.df.values)
+        assert_arrEQ(labels[y], self.y)
+
+
+if __name__ == '__main__':
+    import rosunit
+    rosunit.unitrun(PKG, 'test_pose_learner_df_to_Xy', DfToXyTestCase)
@@ -0,0 +1,104 @@
+#!/usr/bin/env python
+PKG = 'pose_tracker'
+import roslib; roslib.load_manifest(PKG)
+import unittest
+import numpy as np
+from sklearn.tree import DecisionTreeClassifier
+from sklearn.ensemble import RandomForestClassifier
+
+from pose_tracker.pose_learner import (fit_clf, cv_folds, HalvingSearch,
+                                       fit_time_report)
+
+# Keyword args PoseLearnerNode.fit passes whatever the search strategy is
+NODE_KWARGS = {'n_iter': 2, 'resource': 'n_samples', 'factor': 2,
+               'random_state': 0, 'n_jobs': 1, 'pre_dispatch': '2*n_jobs'}
+
+
+class FitClfTestCase(unittest.TestCase):
+    def __init__(self, *args):
+        super(FitClfTestCase, self).__init__(*args)
+
+    def setUp(self):
+        rnd = np.random.RandomState(0)
+        self.X = rnd.rand(90, 4)
+        self.y = (self.X[:, 0] > 0.5).astype(int) + (self.X[:, 1] > 0.5)
+        self.grid = {'max_depth': [1, 2, 4, 8]}
+
+    def tearDown(self):
+        pass
+
+    def _fit(self, search, estimator=None, **kwargs):
+        kwargs = dict(NODE_KWARGS, **kwargs)
+        kwargs.setdefault('param_grid', self.grid)
+        if estimator is None:
+            estimator = DecisionTreeClassifier(random_state=0)
+        return fit_clf(self.X, self.y, search=search, estimator=estimator,
+                       cv=cv_folds(self.X, self.y, 3), **kwargs)
+
+    def test_grid_search(self):
+        clf = self._fit('grid')
+        self.assertEqual(len(clf.cv_results_['params']), 4)
+        self.assertEqual(clf.predict(self.X).shape, self.y.shape)
+
+    def test_random_search(self):
+        clf = self._fit('random')
+        self.assertEqual(len(clf.cv_results_['params']), 2)
+        self.assertEqual(clf.cv_results_['params'],
+                         self._fit('random').cv_results_['params'])
+
+    def test_halving_search_on_samples(self):
+        clf = self._fit('halving')
+        self.assertIsInstance(clf, HalvingSearch)
+        results = clf.cv_results_
+        self.assertEqual(results['iter'].tolist(), [0] * 4 + [1] * 2 + [2])
+        resources = results['n_resources']
+        self.assertEqual(resources[-1], min(len(train) for train, _ in
+                                            cv_folds(self.X, self.y, 3)))
+        self.assertTrue((np.diff(resources) >= 0).all())
+        self.assertIn(clf.best_params_, results['params'])
+        self.assertEqual(clf.predict(self.X).shape, self.y.shape)
+
+    def test_halving_search_on_n_estimators(self):
+        grid = dict(self.grid, n_estimators=[2, 18])
+        clf = self._fit('halving', RandomForestClassifier(random_state=0),
+                        param_grid=grid, resource='n_estimators', factor=3)
+        self.assertEqual(clf.cv_results_['n_resources'].tolist(),
+                         [2] * 4 + [6] * 2 + [18])
+        self.assertEqual(clf.best_estimator_.n_estimators, 18)
+        self.assertNotIn('n_estimators', clf.best_params_)
+
+    def test_halving_resource_not_in_param_grid_raises_ValueError(self):
+        with self.assertRaises(ValueError):
+            self._fit('halving', RandomForestClassifier(random_state=0),
+                      resource='n_estimators')
+
+    def test_n_jobs_and_pre_dispatch_are_forwarded(self):
+        for search in ('grid', 'random', 'halving'):
+            clf = self._fit(search, n_jobs=2, pre_dispatch='n_jobs')
+            self.assertEqual(clf.n_jobs, 2)
+            self.assertEqual(clf.pre_dispatch, 'n_jobs')
+
+    def test_unknown_strategy_raises_ValueError(self):
+        with self.assertRaises(ValueError):
+            self._fit('unknown')
+
+    def test_fit_time_report(self):
+        for search in ('grid', 'halving'):
+            clf = self._fit(search)
+            report = fit_time_report(clf)
+            self.assertEqual(report.columns.tolist(),
+                             ['params', 'mean_fit_time', 'std_fit_time',
+                              'mean_test_score'])
+            self.assertEqual(len(report), len(clf.cv_results_['params']))
+            self.assertIn(str(clf.best_params_), report['params'].tolist())
+            times = report['mean_fit_time'].values
+            self.assertTrue((times[:-1] >= times[1:]).all())
+
+    def test_without_param_grid_fits_the_estimator(self):
+        clf = self._fit('grid', param_grid=None)
+        self.assertIsInstance(clf, DecisionTreeClassifier)
+
+
+if __name__ == '__main__':
+    import rosunit
+    rosunit.unitrun(PKG, 'test_pose_learner_fit_clf', FitClfTestCase)
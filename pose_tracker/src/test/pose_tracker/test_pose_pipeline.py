@@ -0,0 +1,99 @@
+#!/usr/bin/env python
+PKG = 'pose_tracker'
+import roslib; roslib.load_manifest(PKG)
+import unittest
+import numpy as np
+from numpy.testing import assert_array_almost_equal as assert_arrAlmostEQ
+
+from pose_tracker.pose_pipeline import (Pipeline, InstanceStage,
+                                        AveragerStage, VelocityStage,
+                                        DetectorStage, EstimatorStage,
+                                        STILL, MOVING)
+from pose_detector.running_aggregates import (RunningMean, SlidingAggregate)
+from pose_detector.velocity_estimators import VelocityWindow
+from pose_detector.pose_detector_node import ConsecutiveCounter
+
+COLUMNS = ['user_id', 'stamp', 'head_pos_x', 'torso_pos_x']
+DATASET_COLUMNS = ['user_id', 'head_pos_x', 'torso_pos_x', 'pose']
+
+
+class FakeBuilder(object):
+    """Builder whose msgs are already instances."""
+    def unpack(self, msg):
+        if len(msg) != len(COLUMNS):
+            raise TypeError("Bad msg")
+        return np.asarray(msg, dtype=np.float64), COLUMNS
+
+
+class FakeEstimator(object):
+    """Estimator that predicts class 1 if the head is above the torso."""
+    classes_ = np.array([0, 1])
+
+    def predict_proba(self, X):
+        up = (X[:, 0] > X[:, 1]).astype(np.float64)
+        return np.column_stack([1 - up, up])
+
+
+class PosePipelineTestCase(unittest.TestCase):
+    def __init__(self, *args):
+        super(PosePipelineTestCase, self).__init__(*args)
+
+    def setUp(self):
+        self.dflen = 3
+        self.detector = DetectorStage(
+            self.dflen, ConsecutiveCounter(0.5, ignored_columns=['user_id',
+                                                             'stamp']))
+        self.estimator = EstimatorStage(FakeEstimator(), DATASET_COLUMNS,
+                                        ['user_id'], source='pose')
+        self.pipeline = Pipeline([
+            InstanceStage(FakeBuilder()),
+            AveragerStage(SlidingAggregate(RunningMean(self.dflen))),
+            VelocityStage(VelocityWindow(self.dflen)),
+            self.detector, self.estimator])
+
+    def stream(self, head_positions, t0=0.0):
+        """Process a skeleton per head position. Return the frames.
+
+        The torso moves in the opposite direction of the head.
+        """
+        return [self.pipeline.process([7, t0 + i, x, -x])
+                for i, x in enumerate(head_positions)]
+
+    def test_frames_carry_the_results_of_the_stages(self):
+        frames = self.stream([2.0, 4.0])
+        self.assertIs(frames[-1].columns, COLUMNS)
+        assert_arrAlmostEQ(frames[-1].instance, [7, 1, 4, -4])
+        assert_arrAlmostEQ(frames[-1].averaged, [7, 0.5, 3, -3])
+        assert_arrAlmostEQ(frames[-1].velocities, [0, 1, 2, -2])
+
+    def test_detects_when_user_stops_and_moves(self):
+        frames = self.stream([2.0] * 4 + [2.0, 4.0, 6.0, 8.0])
+        events = [f.event for f in frames]
+        self.assertEqual(events, [None, None, STILL, None,
+                                  None, None, None, MOVING])
+        assert_arrAlmostEQ(frames[2].pose, frames[2].instance)
+        self.assertTrue(self.detector.moving)
+
+    def test_estimates_only_when_user_stops(self):
+        frames = self.stream([2.0] * 5)
+        estimated = [f for f in frames if f.label_id is not None]
+        self.assertEqual(len(estimated), 1)
+        self.assertIs(estimated[0].event, STILL)
+        self.assertEqual(estimated[0].label_id, 1)
+        assert_arrAlmostEQ(estimated[0].estimated, [2.0, -2.0])
+        self.assertEqual(self.estimator.skipped, 4)
+
+    def test_stages_skip_frames_without_input(self):
+        pipeline = Pipeline([self.detector, self.estimator])
+        frame = pipeline.process(None)
+        self.assertIsNone(frame.event)
+        self.assertIsNone(frame.label_id)
+
+    def test_process_raises_if_a_stage_fails(self):
+        with self.assertRaises(TypeError):
+            self.pipeline.process([1, 2])
+
+
+if __name__ == '__main__':
+    import rosunit
+    rosunit.unitrun(PKG, 'test_pose_pipeline', PosePipelineTestCase)